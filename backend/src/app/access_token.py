@@ -0,0 +1,176 @@
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from ..models import (
+    AccessToken,
+    BotInfo,
+)
+from ..datastore.bot_api_cred import (
+    BaseAccessTokenRepository,
+    BaseBotClientCredentialRepository,
+    BaseInstalledAppRepository,
+    DynamoDBAccessTokenRepository,
+    DynamoDBBotClientCredentialRepository,
+    DynamoDBInstalledAppRepository,
+)
+from ..lib import lineworks
+
+# refresh the token this long before it expires
+ACCESS_TOKEN_REFRESH_MARGIN_SEC = 10 * 60
+# a container which died while refreshing blocks the others this long at most
+ACCESS_TOKEN_LEASE_SEC = 30
+ACCESS_TOKEN_WAIT_SEC = 15
+ACCESS_TOKEN_POLL_INTERVAL_SEC = 0.25
+
+
+class AccessTokenRefreshTimeout(Exception):
+    """The access token was not refreshed in time by the lease holder"""
+
+
+def issue_bot_access_token(client_id: str, client_secret: str, service_account: str, private_key: str) -> dict:
+    return lineworks.auth.get_access_token(client_id, client_secret, service_account, private_key, "bot")
+
+
+class AccessTokenManager():
+    """Access tokens of the domains, shared by the invocations of a container
+
+    - Tokens are kept in process and refreshed ahead of the expiry.
+    - A refresh is single-flight: in process by a lock per domain, across
+      containers by a conditional-write lease on the access token item.
+    - While another container holds the lease, a still valid token is
+      reused, otherwise the refreshed token is waited for.
+    """
+    def __init__(self,
+                 access_token_repo: BaseAccessTokenRepository,
+                 bot_client_cred_repo: BaseBotClientCredentialRepository,
+                 install_app_repo: BaseInstalledAppRepository,
+                 refresh_margin_sec: float = ACCESS_TOKEN_REFRESH_MARGIN_SEC,
+                 lease_sec: float = ACCESS_TOKEN_LEASE_SEC,
+                 wait_sec: float = ACCESS_TOKEN_WAIT_SEC,
+                 issue_func: Callable[[str, str, str, str], dict] = issue_bot_access_token,
+                 clock: Callable[[], float] = time.time,
+                 ):
+        self.access_token_repo = access_token_repo
+        self.bot_client_cred_repo = bot_client_cred_repo
+        self.install_app_repo = install_app_repo
+        self.refresh_margin_sec = refresh_margin_sec
+        self.lease_sec = lease_sec
+        self.wait_sec = wait_sec
+        self.issue_func = issue_func
+        self.clock = clock
+
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._domain_locks: Dict[str, threading.Lock] = {}
+        self._tokens: Dict[str, AccessToken] = {}
+        self.refresh_count = 0
+
+    def _domain_lock(self, domain_id: str) -> threading.Lock:
+        with self._lock:
+            if domain_id not in self._domain_locks:
+                self._domain_locks[domain_id] = threading.Lock()
+            return self._domain_locks[domain_id]
+
+    def _is_fresh(self, access_token: Optional[AccessToken], current_time: float) -> bool:
+        return access_token is not None and access_token.expired_at - self.refresh_margin_sec > current_time
+
+    @staticmethod
+    def _is_valid(access_token: Optional[AccessToken], current_time: float) -> bool:
+        return access_token is not None and access_token.expired_at > current_time
+
+    def get_access_token(self, bot_info: BotInfo, domain_id: str) -> Optional[AccessToken]:
+        """Get the access token of the domain (None if the client credential is not set)"""
+        access_token = self._tokens.get(domain_id)
+        if self._is_fresh(access_token, self.clock()):
+            return access_token
+
+        with self._domain_lock(domain_id):
+            access_token = self._tokens.get(domain_id)
+            if self._is_fresh(access_token, self.clock()):
+                return access_token
+
+            access_token = self._get_or_refresh(bot_info, domain_id)
+            if access_token is not None:
+                self._tokens[domain_id] = access_token
+            return access_token
+
+    def invalidate(self, domain_id: str, access_token: Optional[str] = None):
+        """Drop the token of the domain (e.g. the API rejected it)
+
+        :param access_token: the rejected token. The stored token is also
+            deleted if it is still this one, so that the next get refreshes it.
+        """
+        with self._lock:
+            kept = self._tokens.get(domain_id)
+            if access_token is None or (kept is not None and kept.access_token == access_token):
+                self._tokens.pop(domain_id, None)
+        if access_token is not None:
+            self.access_token_repo.delete_access_token_item(domain_id, access_token)
+
+    def _get_or_refresh(self, bot_info: BotInfo, domain_id: str) -> Optional[AccessToken]:
+        deadline = time.monotonic() + self.wait_sec
+        while True:
+            current_time = self.clock()
+            access_token = self.access_token_repo.get_access_token_item(domain_id, use_cache=False)
+            if self._is_fresh(access_token, current_time):
+                return access_token
+
+            if self.access_token_repo.acquire_refresh_lease(domain_id, self.owner, current_time + self.lease_sec, current_time):
+                return self._refresh(bot_info, domain_id)
+
+            # another container is refreshing
+            if self._is_valid(access_token, current_time):
+                return access_token
+            if time.monotonic() >= deadline:
+                raise AccessTokenRefreshTimeout("Access token of {} was not refreshed in {} sec".format(domain_id, self.wait_sec))
+            time.sleep(ACCESS_TOKEN_POLL_INTERVAL_SEC)
+
+    def _refresh(self, bot_info: BotInfo, domain_id: str) -> Optional[AccessToken]:
+        try:
+            access_token = self._issue(bot_info, domain_id)
+        except Exception:
+            self.access_token_repo.release_refresh_lease(domain_id, self.owner)
+            raise
+        if access_token is None:
+            self.access_token_repo.release_refresh_lease(domain_id, self.owner)
+            return None
+
+        # Put access token (the lease is released by the put)
+        self.access_token_repo.put_access_token_item(access_token)
+        self.refresh_count += 1
+        return access_token
+
+    def _issue(self, bot_info: BotInfo, domain_id: str) -> Optional[AccessToken]:
+        client_cred = self.bot_client_cred_repo.get_bot_client_credential(bot_info.bot_id, bot_info.provider_domain_id)
+        if client_cred is None:
+            return None
+
+        # Eco app
+        installed_app = self.install_app_repo.get_installed_app(domain_id)
+        if installed_app is None:
+            raise Exception("Installed App does not exist.")
+
+        current_time = self.clock()
+        res = self.issue_func(client_cred.client_id,
+                              client_cred.client_secret,
+                              installed_app.service_account,
+                              client_cred.private_key)
+        return AccessToken(
+            domain_id=domain_id,
+            access_token=res["access_token"],
+            created_at=current_time,
+            expired_at=current_time + int(res["expires_in"])
+        )
+
+
+@lru_cache(maxsize=None)
+def get_access_token_manager(access_token_table_name: str, bot_client_cred_table_name: str, installed_app_table_name: str) -> AccessTokenManager:
+    """AccessTokenManager of the tables, kept by the container so that the access tokens are reused across invocations"""
+    return AccessTokenManager(
+        DynamoDBAccessTokenRepository(access_token_table_name),
+        DynamoDBBotClientCredentialRepository(bot_client_cred_table_name),
+        DynamoDBInstalledAppRepository(installed_app_table_name),
+    )
@@ -1,33 +1,85 @@
-from typing import List, Union, Optional
+import hashlib
+from typing import List, Dict, Tuple, Union, Optional
 from datetime import datetime
 
 from ..models import (
     WBGT,
+    WBGTImportFingerprint,
+)
+from ..datastore.wbgt import (
+    BaseWBGTRepository,
+    BaseWBGTImportFingerprintRepository,
+    BaseWBGTPrefSummaryRepository,
 )
-from ..datastore.wbgt import BaseWBGTRepository
 from ..service.wbgt import WBGTService
-from ..lib.wbgt_data import WBGTData
+from .wbgt_prediction import WBGTPredictionApplication
+from ..lib.wbgt_data import WBGTData, WBGTDataNotModified
 
 
 MAX_IMPORT_COUNT_BY_POINT = 10   # for 24h
+IMPORT_TIME_SLOT_COUNT = 8   # time keys from the head of yohou_all.csv
+TTL_REFRESH_PERIOD = 60 * 60 * 24   # rewrite unchanged points once a day so that they do not expire
 
 class WBGTImporterApplication():
-    def __init__(self, wbgt_repo: BaseWBGTRepository, wbgt_svc: WBGTService, wbgt_data_lib: WBGTData):
+    def __init__(self,
+                 wbgt_repo: BaseWBGTRepository,
+                 wbgt_svc: WBGTService,
+                 wbgt_data_lib: WBGTData,
+                 wbgt_import_fingerprint_repo: Optional[BaseWBGTImportFingerprintRepository] = None,
+                 ttl_refresh_sec: int = TTL_REFRESH_PERIOD,
+                 wbgt_pred_app: Optional[WBGTPredictionApplication] = None,
+                 wbgt_pref_summary_repo: Optional[BaseWBGTPrefSummaryRepository] = None,
+                 ):
         self.wbgt_repo = wbgt_repo
         self.wbgt_svc = wbgt_svc
         self.wbgt_data_lib = wbgt_data_lib
+        self.wbgt_import_fingerprint_repo = wbgt_import_fingerprint_repo
+        self.ttl_refresh_sec = ttl_refresh_sec
+        self.wbgt_pred_app = wbgt_pred_app
+        self.wbgt_pref_summary_repo = wbgt_pref_summary_repo
+
+    def create_fingerprint(self, values: List[Tuple[str, float]]) -> str:
+        h = hashlib.blake2b(digest_size=8)
+        for time_key, value in values:
+            h.update("{}={};".format(time_key, value).encode())
+        return h.hexdigest()
 
-    def load_wbgt_pred_data(self):
+    def create_import_version(self, fingerprints: Dict[str, WBGTImportFingerprint]) -> str:
+        # changes only when the imported values change (not by the TTL refresh)
+        h = hashlib.blake2b(digest_size=8)
+        for point_id in sorted(fingerprints):
+            h.update("{}={};".format(point_id, fingerprints[point_id].fingerprint).encode())
+        return h.hexdigest()
+
+    def load_wbgt_pred_data(self, force: bool = False):
         current_timestamp = datetime.now().timestamp()
 
-        newest_pred_data = []
         # Download
-        data = self.wbgt_data_lib.get_yohou_all()
-        count = 0
-        for time_key, points in data.items():
-            if count >= 8:
-                break
-            for point_id, value  in points.items():
+        values_by_point: Dict[str, List[Tuple[str, float]]] = {}
+        try:
+            for time_key, point_id, value in self.wbgt_data_lib.iter_yohou_all(IMPORT_TIME_SLOT_COUNT, only_modified=not force):
+                if point_id not in values_by_point:
+                    values_by_point[point_id] = []
+                values_by_point[point_id].append((time_key, value))
+        except WBGTDataNotModified:
+            # same as the last import
+            return None
+
+        # Detect changed points
+        fingerprints = {}
+        if self.wbgt_import_fingerprint_repo is not None and not force:
+            fingerprints = self.wbgt_import_fingerprint_repo.get_import_fingerprints()
+
+        newest_pred_data = []
+        for point_id, values in values_by_point.items():
+            fingerprint = self.create_fingerprint(values)
+            prev = fingerprints.get(point_id)
+            if prev is not None and prev.fingerprint == fingerprint \
+                    and current_timestamp - prev.written_timestamp < self.ttl_refresh_sec:
+                # unchanged and TTL is still far enough
+                continue
+
+            for time_key, value in values:
                 wbgt_raw = {
                     "wbgt_key": self.wbgt_svc.create_wbgt_key(point_id, time_key),
                     "point_id": point_id,
@@ -37,7 +89,62 @@ class WBGTImporterApplication():
                 }
                 wbgt = WBGT.parse_obj(wbgt_raw)
                 newest_pred_data.append(wbgt)
-            count += 1
+            fingerprints[point_id] = WBGTImportFingerprint(
+                point_id=point_id,
+                fingerprint=fingerprint,
+                written_timestamp=current_timestamp,
+            )
 
         # Save
-        self.wbgt_repo.put_wbgt_list(newest_pred_data)
+        stats = self.wbgt_repo.put_wbgt_list(newest_pred_data)
+        if len(newest_pred_data) > 0:
+            import_version = self.create_import_version(fingerprints)
+            if self.wbgt_pref_summary_repo is not None and self.wbgt_pred_app is not None:
+                self.write_pref_summaries(values_by_point, import_version, int(current_timestamp))
+            if self.wbgt_import_fingerprint_repo is not None:
+                # after the rows and the summaries are written
+                self.wbgt_import_fingerprint_repo.put_import_fingerprints(fingerprints, import_version)
+        # the source is cached (and skipped by the next run) only once everything is written
+        self.wbgt_data_lib.commit()
+        return stats
+
+    def write_pref_summaries(self, values_by_point: Dict[str, List[Tuple[str, float]]], import_version: str, imported_at: int):
+        """Write the daily summaries of the prefectures for the days of the imported values
+
+        The values outside of the imported time slots are taken from the
+        previous summary of the day, or from the WBGT data if there is none.
+        """
+        slot_values_by_day: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for point_id, values in values_by_point.items():
+            for time_key, value in values:
+                # time_key: yyyymmddhh (hh: 01-24 of the day)
+                day_values = slot_values_by_day.setdefault(time_key[:8], {})
+                day_values.setdefault(point_id, {})[time_key] = float(value) / 10.0
+
+        wbgt_prefs = self.wbgt_pred_app.wbgt_pref_point_repo.get_wbgt_pref_points()
+        points_by_pref = self.wbgt_pred_app.get_points_of_prefectures(wbgt_prefs)
+        summaries = []
+        for date_key, imported_values in sorted(slot_values_by_day.items()):
+            d = datetime.strptime(date_key, "%Y%m%d").date()
+            time_keys = self.wbgt_svc.get_daily_time_keys(date_key)
+            prev_summaries = self.wbgt_pref_summary_repo.get_pref_summaries([p.pref_key for p in wbgt_prefs], d)
+
+            slot_values: Dict[str, Dict[str, float]] = {}
+            missing_keys = []
+            for wbgt_pref in wbgt_prefs:
+                prev = prev_summaries.get(wbgt_pref.pref_key)
+                for point in points_by_pref[wbgt_pref.pref_key]:
+                    values = dict(prev.slot_values.get(point.point_id, {})) if prev is not None else {}
+                    values.update(imported_values.get(point.point_id, {}))
+                    slot_values[point.point_id] = values
+                    if prev is None:
+                        missing_keys.extend(
+                            self.wbgt_svc.create_wbgt_key(point.point_id, time_key) for time_key in time_keys if time_key not in values
+                        )
+
+            if len(missing_keys) > 0:
+                for wbgt in self.wbgt_repo.get_wbgt_many(missing_keys).values():
+                    slot_values[wbgt.point_id][wbgt.time_key] = wbgt.value
+
+            summaries.extend(self.wbgt_pred_app.build_prefecture_summaries(wbgt_prefs, d, import_version, imported_at, slot_values))
+        return self.wbgt_pref_summary_repo.put_pref_summaries(summaries)
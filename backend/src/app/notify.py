@@ -1,8 +1,186 @@
-from ..datastore.wbgt import (
-    InMemoryWBGTPrefPointRepository,
-    InMemoryWBGTPointRepository,
-    InMemoryWBGTPointRepository,
-)
-from ..service.wbgt import (
-    WBGTService
+import json
+import threading
+from collections import OrderedDict
+from typing import List
+
+from ..models import (
+    DomainNoticeContent,
 )
+
+NOTIFY_MESSAGE_CACHE_SIZE = 256
+
+
+NOTIFY_TEXT_GUIDE = """
+【暑さ指数 (WBGT) の目安】
+31以上: 危険
+28以上31未満: 厳重警戒
+25以上28未満: 警戒
+25未満: 注意
+
+※ 配信の停止は「配信設定」から行います。
+"""
+
+NOTIFY_TEXT_POINT_INFO_FMT = """
+予想される {} の観測地点別の日最高暑さ指数 (WBGT) は以下の通りです。
+
+{}
+"""
+
+
+def create_message_contents(notice_content: DomainNoticeContent) -> list:
+    return [
+        {
+            "content": {
+                "type": "flex",
+                "altText": "{} の予測です。".format(notice_content.prefecture.pref_name_ja),
+                "contents": {
+                    "type": "bubble",
+                    "body": {
+                        "type": "box",
+                        "layout": "vertical",
+                        "contents": [
+                            {
+                                "text": "{}".format(notice_content.day.strftime("%m/%d")),
+                                "type": "text",
+                                "size": "lg"
+                            },
+                            {
+                                "layout": "vertical",
+                                "type": "box",
+                                "contents": [
+                                    {
+                                        "text": "{}".format(notice_content.alert_level.alert_level_subtitle_ja),
+                                        "type": "text",
+                                        "size": "lg",
+                                        "style": "normal",
+                                        "align": "center",
+                                    }
+                                ]
+                            },
+                            {
+                                "layout": "vertical",
+                                "type": "box",
+                                "contents": [
+                                    {
+                                        "text": "{}".format(notice_content.alert_level.alert_level_title_ja),
+                                        "type": "text",
+                                        "style": "normal",
+                                        "align": "center",
+                                        "wrap": True,
+                                        "size": "xl",
+                                        "gravity": "center",
+                                        "color": "{}".format(notice_content.alert_level.alert_level_text_color)
+                                    }
+                                ],
+                                "backgroundColor": "{}".format(notice_content.alert_level.alert_level_background_color),
+                                "spacing": "none",
+                                "margin": "md",
+                                "borderWidth": "none",
+                                "cornerRadius": "none"
+                            },
+                            {
+                                "layout": "vertical",
+                                "type": "box",
+                                "contents": [
+                                    {
+                                        "text": "の予測です",
+                                        "type": "text",
+                                        "size": "md",
+                                        "style": "normal",
+                                        "align": "end",
+                                    }
+                                ],
+                                "spacing": "none",
+                                "margin": "md"
+                            },
+                            {
+                                "layout": "vertical",
+                                "type": "box",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "{}".format(notice_content.alert_level.alert_level_description_ja),
+                                        "wrap": True,
+                                        "decoration": "none"
+                                    }
+                                ],
+                                "borderWidth": "none",
+                                "margin": "sm"
+                            },
+                            {
+                                "layout": "vertical",
+                                "type": "box",
+                                "contents": [
+                                    {
+                                        "text": NOTIFY_TEXT_POINT_INFO_FMT.format(
+                                            notice_content.prefecture.pref_name_ja,
+                                            ', '.join([ "{}{}".format(content_point.point.point_name_ja, content_point.max_wbgt.value) for content_point in notice_content.points])
+                                        ),
+                                        "wrap": True,
+                                        "type": "text"
+                                    },
+                                    {
+                                        "text": NOTIFY_TEXT_GUIDE,
+                                        "wrap": True,
+                                        "type": "text"
+                                    }
+                                ],
+                                "borderWidth": "none",
+                                "margin": "lg"
+                            },
+                            {
+                                "action": {
+                                    "type": "uri",
+                                    "label": "熱中症予防対策を確認",
+                                    "uri": "https://www.wbgt.env.go.jp/sp/heatillness.php"
+                                },
+                                "type": "button",
+                                "style": "link"
+                            }
+                        ]
+                    }
+                }
+            }
+        }
+    ]
+
+
+class NotifyMessageRenderer():
+    """Render the notify messages once per distinct content
+
+    The message only depends on the prefecture, the day, the alert level
+    and the values of the points, not on the recipient. The serialized
+    JSON bytes are cached per content and posted as is to every recipient.
+    A renderer is kept by the container (LRU of max_size contents).
+    """
+    def __init__(self, max_size: int = NOTIFY_MESSAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, List[bytes]]" = OrderedDict()
+        self.render_count = 0
+
+    @staticmethod
+    def content_key(notice_content: DomainNoticeContent) -> tuple:
+        return (
+            notice_content.prefecture.pref_key,
+            notice_content.day,
+            notice_content.alert_level.alert_level_key,
+            tuple((p.point.point_id, p.max_wbgt.value) for p in notice_content.points),
+        )
+
+    def render(self, notice_content: DomainNoticeContent) -> List[bytes]:
+        """Serialized message contents (JSON bytes of the request body)"""
+        key = self.content_key(notice_content)
+        with self._lock:
+            rendered = self._cache.get(key)
+            if rendered is not None:
+                self._cache.move_to_end(key)
+                return rendered
+
+        rendered = [json.dumps(msg_content).encode() for msg_content in create_message_contents(notice_content)]
+        with self._lock:
+            self.render_count += 1
+            self._cache[key] = rendered
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return rendered
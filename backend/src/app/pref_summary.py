@@ -0,0 +1,68 @@
+from datetime import date
+
+from ..models import (
+    PrefectureSummary,
+)
+from ..datastore.wbgt import (
+    BaseWBGTPrefPointRepository,
+    BaseWBGTImportFingerprintRepository,
+    BaseWBGTPrefSummaryRepository,
+)
+from .wbgt_prediction import WBGTPredictionApplication
+
+
+class PrefectureSummaryApplication():
+    """Daily summaries of the prefectures for a notify run
+
+    The importer writes the summaries of the imported days. user_set_list
+    checks them once per run against the current import version (and
+    computes the missing or outdated ones from the WBGT data), so that
+    notice_list reads a single item per prefecture.
+    """
+    def __init__(self,
+                 wbgt_pred_app: WBGTPredictionApplication,
+                 wbgt_pref_point_repo: BaseWBGTPrefPointRepository,
+                 wbgt_pref_summary_repo: BaseWBGTPrefSummaryRepository,
+                 wbgt_import_fingerprint_repo: BaseWBGTImportFingerprintRepository,
+                 ):
+        self.wbgt_pred_app = wbgt_pred_app
+        self.wbgt_pref_point_repo = wbgt_pref_point_repo
+        self.wbgt_pref_summary_repo = wbgt_pref_summary_repo
+        self.wbgt_import_fingerprint_repo = wbgt_import_fingerprint_repo
+        self.computed_count = 0
+
+    def get_import_version(self, d: date) -> str:
+        import_version = self.wbgt_import_fingerprint_repo.get_import_version()
+        if import_version is None:
+            # imported before the versions: the same for all the invocations of the day
+            return "legacy-{}".format(d.strftime("%Y%m%d"))
+        return import_version
+
+    def ensure_summaries(self, d: date) -> str:
+        """Compute and store the summaries of the prefectures which are missing or outdated
+
+        :return: import version of the summaries
+        """
+        import_version = self.get_import_version(d)
+        wbgt_prefs = self.wbgt_pref_point_repo.get_wbgt_pref_points()
+        summaries = self.wbgt_pref_summary_repo.get_pref_summaries([p.pref_key for p in wbgt_prefs], d)
+        outdated = [
+            p for p in wbgt_prefs
+            if p.pref_key not in summaries or summaries[p.pref_key].import_version != import_version
+        ]
+        if len(outdated) > 0:
+            self.wbgt_pref_summary_repo.put_pref_summaries(self.wbgt_pred_app.summarize_prefectures(outdated, d, import_version))
+            self.computed_count += len(outdated)
+        return import_version
+
+    def get_summary(self, pref_key: str, d: date, import_version: str) -> PrefectureSummary:
+        """Get the summary of the prefecture (a newer import than the run is also accepted)"""
+        summary = self.wbgt_pref_summary_repo.get_pref_summary(pref_key, d)
+        if summary is None:
+            wbgt_pref = self.wbgt_pref_point_repo.get_wbgt_pref_point(pref_key)
+            if wbgt_pref is None:
+                raise Exception("WBGT data is null.")
+            summary = self.wbgt_pred_app.summarize_prefectures([wbgt_pref], d, import_version)[0]
+            self.wbgt_pref_summary_repo.put_pref_summaries([summary])
+            self.computed_count += 1
+        return summary
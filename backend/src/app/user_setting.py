@@ -1,21 +1,11 @@
-from typing import List, Dict, Union, Optional
-from datetime import date
+from typing import Iterator, List, Dict, Union, Optional
 
 from ..models import (
-    WBGT,
-    WBGTPoint,
-    WBGTPrefPoint,
-    WBGTAlertLevel,
     UserSetting,
 )
-from ..datastore.wbgt import (
-    BaseWBGTAlertLevelRepository,
-)
 from ..datastore.user_setting import (
     BaseUserSettingRepository,
 )
-from ..service.wbgt import WBGTService
-from ..lib.wbgt_data import WBGTData
 
 
 class UserSettingApplication():
@@ -36,6 +26,9 @@ class UserSettingApplication():
     def delete_user_settings_w_domain_id(self, domain_id: str):
         self.user_setting_repo.delete_user_setting_w_domain_id(domain_id)
 
+    def iter_user_settings_of_prefecture(self, pref_key: str, page_size: Optional[int] = None) -> Iterator[List[UserSetting]]:
+        return self.user_setting_repo.iter_user_settings_of_prefecture(pref_key, page_size)
+
     def classify_user_setting_into_prefecture(self) -> Dict[str, List[UserSetting]]:
         users_pref = {}
         user_settings = self.get_all_user_settings()
@@ -1,4 +1,4 @@
-from typing import List, Union, Optional
+from typing import List, Dict, Union, Optional
 from datetime import date
 
 from ..models import (
@@ -7,6 +7,8 @@ from ..models import (
     WBGTPrefPoint,
     WBGTAlertLevel,
     UserSetting,
+    NoticeContentPoint,
+    PrefectureSummary,
 )
 from ..datastore.wbgt import (
     BaseWBGTPointRepository,
@@ -15,7 +17,7 @@ from ..datastore.wbgt import (
     BaseWBGTRepository,
 )
 from ..service.wbgt import WBGTService
-from ..lib.wbgt_data import WBGTData
+from ..service.forecast import ForecastMatrix
 
 
 class WBGTPredictionApplication():
@@ -33,13 +35,10 @@ class WBGTPredictionApplication():
         self.wbgt_svc = wbgt_svc
 
     def check_alert_level(self, wbgt: WBGT) -> Optional[WBGTAlertLevel]:
-        rst = None
-        wbgt_alert_levels = self.wbgt_alert_level_repo.get_wbgt_alert_levels()
-        for alert_level in wbgt_alert_levels:
-            if alert_level.min_value <= wbgt.value and alert_level.max_value >= wbgt.value:
-                if rst is None or alert_level.priority > rst.priority:
-                    rst = alert_level
-        return rst
+        return self.wbgt_alert_level_repo.get_wbgt_alert_level_index().classify(wbgt.value)
+
+    def check_alert_levels(self, wbgt_list: List[WBGT]) -> List[Optional[WBGTAlertLevel]]:
+        return self.wbgt_alert_level_repo.get_wbgt_alert_level_index().classify_many([w.value for w in wbgt_list])
 
     def get_wbgt_points_of_prefecture(self, pref_key: str) -> List[WBGTPoint]:
         pref = self.wbgt_pref_point_repo.get_wbgt_pref_point(pref_key)
@@ -52,28 +51,137 @@ class WBGTPredictionApplication():
         return point_list
 
     def get_daily_wbgt_of_point(self, wbgt_point: WBGTPoint, d: date) -> List[WBGT]:
+        return self.get_daily_wbgt_of_points([wbgt_point], d).get(wbgt_point.point_id, [])
+
+    def get_daily_wbgt_of_points(self, wbgt_points: List[WBGTPoint], d: date) -> Dict[str, List[WBGT]]:
         date_key = self.wbgt_svc.convert_to_date_key(d)
-        wbgt_list = []
-        for time_key in self.wbgt_svc.get_daily_time_keys(date_key):
-            wbgt = self.wbgt_repo.get_wbgt(self.wbgt_svc.create_wbgt_key(wbgt_point.point_id, time_key))
-            if wbgt is not None:
-                wbgt_list.append(wbgt)
-        return wbgt_list
+        time_keys = self.wbgt_svc.get_daily_time_keys(date_key)
+        wbgt_keys = []
+        for wbgt_point in wbgt_points:
+            for time_key in time_keys:
+                wbgt_keys.append(self.wbgt_svc.create_wbgt_key(wbgt_point.point_id, time_key))
+
+        # fetch all points of the day at once
+        wbgts = self.wbgt_repo.get_wbgt_many(wbgt_keys)
+
+        rst = {}
+        for wbgt_point in wbgt_points:
+            wbgt_list = []
+            for time_key in time_keys:
+                wbgt = wbgts.get(self.wbgt_svc.create_wbgt_key(wbgt_point.point_id, time_key))
+                if wbgt is not None:
+                    wbgt_list.append(wbgt)
+            rst[wbgt_point.point_id] = wbgt_list
+        return rst
 
     def predict_daily_wbgt_of_prefecture(self, wbgt_pref: WBGTPrefPoint, d: date) -> List[WBGT]:
-        wbgt_list = []
+        wbgt_points = []
         for wbgt_point_id in wbgt_pref.points:
             wbgt_point = self.wbgt_point_repo.get_wbgt_point(wbgt_point_id)
-            wbgts = self.predict_daily_wbgt_of_point(wbgt_point, d)
-            for wbgt in wbgts:
-                if wbgt is not None:
-                    wbgt_list.append(wbgt)
+            if wbgt_point is not None:
+                wbgt_points.append(wbgt_point)
+
+        wbgt_list = []
+        for wbgts in self.predict_daily_wbgt_of_points(wbgt_points, d).values():
+            wbgt_list.extend(wbgts)
         return wbgt_list
 
     def predict_daily_wbgt_of_point(self, wbgt_point: WBGTPoint, d: date) -> List[WBGT]:
         wbgt_list = self.get_daily_wbgt_of_point(wbgt_point, d)
         return wbgt_list
 
+    def predict_daily_wbgt_of_points(self, wbgt_points: List[WBGTPoint], d: date) -> Dict[str, List[WBGT]]:
+        return self.get_daily_wbgt_of_points(wbgt_points, d)
+
+    def get_points_of_prefectures(self, wbgt_prefs: List[WBGTPrefPoint]) -> Dict[str, List[WBGTPoint]]:
+        points_by_pref: Dict[str, List[WBGTPoint]] = {}
+        for wbgt_pref in wbgt_prefs:
+            points_by_pref[wbgt_pref.pref_key] = [
+                p for p in (self.wbgt_point_repo.get_wbgt_point(point_id) for point_id in wbgt_pref.points) if p is not None
+            ]
+        return points_by_pref
+
+    def summarize_prefectures(self, wbgt_prefs: List[WBGTPrefPoint], d: date, import_version: str) -> List[PrefectureSummary]:
+        """Daily prediction of the prefectures from the WBGT data (all the points are fetched at once)"""
+        points_by_pref = self.get_points_of_prefectures(wbgt_prefs)
+        daily_wbgts = self.predict_daily_wbgt_of_points([p for points in points_by_pref.values() for p in points], d)
+
+        matrix = self.create_forecast_matrix(wbgt_prefs, points_by_pref, d)
+        matrix.set_values((w.point_id, w.time_key, w.value) for wbgt_list in daily_wbgts.values() for w in wbgt_list)
+        imported_at = max([0] + [w.updated_timestamp for wbgt_list in daily_wbgts.values() for w in wbgt_list])
+        return self.summarize_forecast_matrix(matrix, wbgt_prefs, points_by_pref, d, import_version, imported_at)
+
+    def build_prefecture_summaries(self,
+                                   wbgt_prefs: List[WBGTPrefPoint],
+                                   d: date,
+                                   import_version: str,
+                                   imported_at: int,
+                                   slot_values: Dict[str, Dict[str, float]],
+                                   ) -> List[PrefectureSummary]:
+        """Daily prediction of the prefectures from the values of the day (point_id -> {time_key: value})"""
+        points_by_pref = self.get_points_of_prefectures(wbgt_prefs)
+        matrix = self.create_forecast_matrix(wbgt_prefs, points_by_pref, d)
+        matrix.set_values((point_id, time_key, value) for point_id, values in slot_values.items() for time_key, value in values.items())
+        return self.summarize_forecast_matrix(matrix, wbgt_prefs, points_by_pref, d, import_version, imported_at)
+
+    def create_forecast_matrix(self, wbgt_prefs: List[WBGTPrefPoint], points_by_pref: Dict[str, List[WBGTPoint]], d: date) -> ForecastMatrix:
+        time_keys = self.wbgt_svc.get_daily_time_keys(self.wbgt_svc.convert_to_date_key(d))
+        return ForecastMatrix(
+            [(p.pref_key, [point.point_id for point in points_by_pref[p.pref_key]]) for p in wbgt_prefs],
+            time_keys,
+        )
+
+    def summarize_forecast_matrix(self,
+                                  matrix: ForecastMatrix,
+                                  wbgt_prefs: List[WBGTPrefPoint],
+                                  points_by_pref: Dict[str, List[WBGTPoint]],
+                                  d: date,
+                                  import_version: str,
+                                  imported_at: int,
+                                  ) -> List[PrefectureSummary]:
+        alert_level_index = self.wbgt_alert_level_repo.get_wbgt_alert_level_index()
+
+        # daily maxima of all the points and the prefectures at once
+        maxima, max_slots, has_value = matrix.point_maxima()
+        pref_priorities = matrix.pref_reduce_max(alert_level_index.classify_priorities(maxima), -1).tolist()
+        maxima, max_slots, has_value = maxima.tolist(), max_slots.tolist(), has_value.tolist()
+        rows = matrix.values.tolist()
+
+        summaries = []
+        for i, wbgt_pref in enumerate(wbgt_prefs):
+            point_and_wbgt_list = []
+            pref_slot_values = {}
+            offset = int(matrix.pref_offsets[i])
+            for row, point in enumerate(points_by_pref[wbgt_pref.pref_key], offset):
+                if not has_value[row]:
+                    continue
+                # NaN != NaN: the missing time slots are skipped
+                pref_slot_values[point.point_id] = {k: v for k, v in zip(matrix.time_keys, rows[row]) if v == v}
+                max_time_key = matrix.time_keys[max_slots[row]]
+                point_and_wbgt_list.append(
+                    NoticeContentPoint(
+                        point=point,
+                        max_wbgt=WBGT(
+                            wbgt_key=self.wbgt_svc.create_wbgt_key(point.point_id, max_time_key),
+                            point_id=point.point_id,
+                            time_key=max_time_key,
+                            value=maxima[row],
+                            updated_timestamp=imported_at,
+                        ),
+                    )
+                )
+            summaries.append(PrefectureSummary(
+                pref_key=wbgt_pref.pref_key,
+                day=d,
+                import_version=import_version,
+                imported_at=imported_at,
+                prefecture=wbgt_pref,
+                points=point_and_wbgt_list,
+                alert_level=alert_level_index.get_alert_level_of_priority(pref_priorities[i]) if pref_priorities[i] >= 0 else None,
+                slot_values=pref_slot_values,
+            ))
+        return summaries
+
     def get_max_wbgt(self, wbgt_list: List[WBGT]) -> Union[WBGT, None]:
         max_wbgt = None
         for wbgt in wbgt_list:
@@ -100,44 +208,37 @@ class WBGTPredictionApplication():
         return max_alert_level
 
     def is_notify_target(self, user_setting: UserSetting, target_alert_level: WBGTAlertLevel):
-        user_alert_level = self.wbgt_alert_level_repo.get_wbgt_alert_level(user_setting.alert_level_key)
-        if user_alert_level == None:
+        user_priority = self.wbgt_alert_level_repo.get_wbgt_alert_level_index().get_priority(user_setting.alert_level_key)
+        if user_priority is None:
             return False
-        return target_alert_level.priority >= user_alert_level.priority
+        return target_alert_level.priority >= user_priority
+
+    def group_notify_targets(self, user_settings: List[UserSetting], target_alert_level: WBGTAlertLevel) -> Dict[str, List[str]]:
+        """Group the user ids of the notify targets by domain id (the order of the users is kept)"""
+        targets: Dict[str, List[str]] = {}
+        for user_setting in user_settings:
+            if self.is_notify_target(user_setting, target_alert_level):
+                targets.setdefault(user_setting.domain_id, []).append(user_setting.user_id)
+        return targets
 
 
 if __name__ == '__main__':
-    import json
-    import os
     from datetime import datetime, timedelta, timezone
     from .import_wbgt import WBGTImporterApplication
+    from ..lib.wbgt_data import WBGTData
     from ..datastore.wbgt import (
-        InMemoryWBGTPointRepository,
-        InMemoryWBGTPrefPointRepository,
-        InMemoryWBGTAlertLevelRepository,
         InMemoryWBGTRepository,
     )
+    from ..datastore import static_data
 
     current_datetime = datetime.now(timezone(timedelta(hours=9)))
     current_time = current_datetime.time()
     day = current_datetime.date()
     #day += timedelta(days=1)
 
-    wbgt_points_json_file = os.path.join(os.path.dirname(__file__), '../data/wbgt_points.json')
-    wbgt_pref_points_json_file = os.path.join(os.path.dirname(__file__), '../data/wbgt_pref.json')
-    wbgt_alert_level_json_file = os.path.join(os.path.dirname(__file__), '../data/wbgt_alert_levels.json')
-
-    with open(wbgt_points_json_file) as f:
-        wbgt_points_data = json.load(f)
-    wbgt_point_repo = InMemoryWBGTPointRepository(wbgt_points_data)
-
-    with open(wbgt_pref_points_json_file) as f:
-        wbgt_pref_points_data = json.load(f)
-    wbgt_pref_point_repo = InMemoryWBGTPrefPointRepository(wbgt_pref_points_data)
-
-    with open(wbgt_alert_level_json_file) as f:
-        wbgt_alert_level_data = json.load(f)
-    wbgt_alert_level_repo = InMemoryWBGTAlertLevelRepository(wbgt_alert_level_data)
+    wbgt_point_repo = static_data.get_wbgt_point_repo()
+    wbgt_pref_point_repo = static_data.get_wbgt_pref_point_repo()
+    wbgt_alert_level_repo = static_data.get_wbgt_alert_level_repo()
 
     wbgt_repo = InMemoryWBGTRepository()
 
@@ -153,9 +254,10 @@ if __name__ == '__main__':
     wbgt_pred_service = WBGTPredictionApplication(wbgt_point_repo, wbgt_pref_point_repo, wbgt_repo, wbgt_alert_level_repo, wbgt_svc)
     wbgt_points = wbgt_pred_service.get_wbgt_points_of_prefecture("osaka")
     alert_level_list = []
+    daily_wbgts = wbgt_pred_service.predict_daily_wbgt_of_points(wbgt_points, day)
     for point in wbgt_points:
         print(point)
-        wbgt_list = wbgt_pred_service.predict_daily_wbgt_of_point(point, day)
+        wbgt_list = daily_wbgts[point.point_id]
         max_wbgt = wbgt_pred_service.get_max_wbgt(wbgt_list)
         print(max_wbgt)
         if max_wbgt is not None:
@@ -142,7 +142,7 @@ class DynamoDBInstalledAppRepository(BaseInstalledAppRepository):
 # AccessToken
 class BaseAccessTokenRepository(BaseClass):
     @abstractmethod
-    def get_access_token_item(self, domain_id: str) -> Optional[AccessToken]:
+    def get_access_token_item(self, domain_id: str, use_cache: bool = True) -> Optional[AccessToken]:
         pass
 
     @abstractmethod
@@ -150,45 +150,109 @@ class BaseAccessTokenRepository(BaseClass):
         pass
 
     @abstractmethod
-    def delete_access_token_item(self, domain_id: str):
+    def delete_access_token_item(self, domain_id: str, access_token: Optional[str] = None):
+        """Delete the access token of the domain (only if it is still access_token, if set)"""
+        pass
+
+    @abstractmethod
+    def acquire_refresh_lease(self, domain_id: str, owner: str, lease_expires_at: float, current_time: float) -> bool:
+        """Take the lease to refresh the access token of the domain (False if another owner holds it)"""
+        pass
+
+    @abstractmethod
+    def release_refresh_lease(self, domain_id: str, owner: str):
         pass
 
 
 class InMemoryAccessTokenRepository(BaseAccessTokenRepository):
     def __init__(self):
         self.access_tokens = {}
+        self.leases = {}
 
-    def get_access_token_item(self, domain_id: str) -> Optional[AccessToken]:
+    def get_access_token_item(self, domain_id: str, use_cache: bool = True) -> Optional[AccessToken]:
         return self.access_tokens.get(domain_id)
 
     def put_access_token_item(self, access_token: AccessToken):
         self.access_tokens[access_token.domain_id] = access_token
+        self.leases.pop(access_token.domain_id, None)
 
-    def delete_access_token_item(self, domain_id: str):
+    def delete_access_token_item(self, domain_id: str, access_token: Optional[str] = None):
         if domain_id in self.access_tokens:
+            if access_token is not None and self.access_tokens[domain_id].access_token != access_token:
+                return
             del self.access_tokens[domain_id]
 
+    def acquire_refresh_lease(self, domain_id: str, owner: str, lease_expires_at: float, current_time: float) -> bool:
+        lease = self.leases.get(domain_id)
+        if lease is not None and lease[0] != owner and lease[1] >= current_time:
+            return False
+        self.leases[domain_id] = (owner, lease_expires_at)
+        return True
+
+    def release_refresh_lease(self, domain_id: str, owner: str):
+        lease = self.leases.get(domain_id)
+        if lease is not None and lease[0] == owner:
+            del self.leases[domain_id]
+
 
 class DynamoDBAccessTokenRepository(BaseAccessTokenRepository):
     def __init__(self, table_name: str):
         self.table_name = table_name
         self.in_memory_repo = InMemoryAccessTokenRepository()
 
-    def get_access_token_item(self, domain_id: str) -> Optional[AccessToken]:
-        cache = self.in_memory_repo.get_access_token_item(domain_id)
-        if cache is not None:
-            return cache
-
-        _raw = dynamodb.get_item(self.table_name, {"domain_id": domain_id})
-        if _raw is not None:
+    def get_access_token_item(self, domain_id: str, use_cache: bool = True) -> Optional[AccessToken]:
+        """
+        :param use_cache: False to read the latest item (consistent read)
+        """
+        if use_cache:
+            cache = self.in_memory_repo.get_access_token_item(domain_id)
+            if cache is not None:
+                return cache
+
+        _raw = dynamodb.get_item(self.table_name, {"domain_id": domain_id}, consistent_read=not use_cache)
+        # the item only has the lease until the first token is put
+        if _raw is not None and "access_token" in _raw:
             access_token = AccessToken.parse_obj(_raw)
             self.in_memory_repo.put_access_token_item(access_token)
             return access_token
+        return None
 
     def put_access_token_item(self, access_token: AccessToken):
+        # the lease attributes are removed by the put
         dynamodb.put_item(self.table_name, access_token.dict())
         self.in_memory_repo.put_access_token_item(access_token)
 
-    def delete_access_token_item(self, domain_id: str):
-        dynamodb.delete_item(self.table_name, {"domain_id": domain_id})
-        self.in_memory_repo.delete_access_token_item(domain_id)
+    def delete_access_token_item(self, domain_id: str, access_token: Optional[str] = None):
+        if access_token is None:
+            dynamodb.delete_item(self.table_name, {"domain_id": domain_id})
+        else:
+            # not the token refreshed by another container in the meantime
+            dynamodb.delete_item(
+                self.table_name,
+                {"domain_id": domain_id},
+                condition_expression="access_token = :access_token",
+                expression_attribute_values={":access_token": access_token},
+            )
+        self.in_memory_repo.delete_access_token_item(domain_id, access_token)
+
+    def acquire_refresh_lease(self, domain_id: str, owner: str, lease_expires_at: float, current_time: float) -> bool:
+        return dynamodb.update_item(
+            self.table_name,
+            {"domain_id": domain_id},
+            "SET lease_owner = :owner, lease_expires_at = :expires_at",
+            condition_expression="attribute_not_exists(lease_expires_at) OR lease_expires_at < :now OR lease_owner = :owner",
+            expression_attribute_values={
+                ":owner": owner,
+                ":expires_at": lease_expires_at,
+                ":now": current_time,
+            },
+        )
+
+    def release_refresh_lease(self, domain_id: str, owner: str):
+        dynamodb.update_item(
+            self.table_name,
+            {"domain_id": domain_id},
+            "REMOVE lease_owner, lease_expires_at",
+            condition_expression="lease_owner = :owner",
+            expression_attribute_values={":owner": owner},
+        )
@@ -0,0 +1,62 @@
+import json
+import os
+from functools import lru_cache
+from typing import Optional
+
+from .wbgt import (
+    BaseWBGTPointRepository,
+    BaseWBGTPrefPointRepository,
+    InMemoryWBGTPointRepository,
+    InMemoryWBGTPrefPointRepository,
+    BundleWBGTPointRepository,
+    BundleWBGTPrefPointRepository,
+    InMemoryWBGTAlertLevelRepository,
+)
+from ..lib.wbgt_bundle import WBGTStaticBundle, WBGTBundleError
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+WBGT_POINTS_JSON_FILE = os.path.join(DATA_DIR, 'wbgt_points.json')
+WBGT_PREF_POINTS_JSON_FILE = os.path.join(DATA_DIR, 'wbgt_pref.json')
+WBGT_ALERT_LEVEL_JSON_FILE = os.path.join(DATA_DIR, 'wbgt_alert_levels.json')
+WBGT_STATIC_BUNDLE_FILE = os.path.join(DATA_DIR, 'wbgt_static.bin')
+
+
+def _load_json(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+# The static data are loaded lazily once per Lambda container
+# and shared across invocations. The repositories must not be modified.
+
+@lru_cache(maxsize=None)
+def get_wbgt_static_bundle() -> Optional[WBGTStaticBundle]:
+    """Memory-mapped bundle generated by export_wbgt_json_data.py (None if unavailable)"""
+    if not os.path.exists(WBGT_STATIC_BUNDLE_FILE):
+        return None
+    try:
+        return WBGTStaticBundle.open(WBGT_STATIC_BUNDLE_FILE)
+    except WBGTBundleError:
+        # fall back to json
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_wbgt_point_repo() -> BaseWBGTPointRepository:
+    bundle = get_wbgt_static_bundle()
+    if bundle is not None:
+        return BundleWBGTPointRepository(bundle)
+    return InMemoryWBGTPointRepository(_load_json(WBGT_POINTS_JSON_FILE))
+
+
+@lru_cache(maxsize=None)
+def get_wbgt_pref_point_repo() -> BaseWBGTPrefPointRepository:
+    bundle = get_wbgt_static_bundle()
+    if bundle is not None:
+        return BundleWBGTPrefPointRepository(bundle)
+    return InMemoryWBGTPrefPointRepository(_load_json(WBGT_PREF_POINTS_JSON_FILE))
+
+
+@lru_cache(maxsize=None)
+def get_wbgt_alert_level_repo() -> InMemoryWBGTAlertLevelRepository:
+    return InMemoryWBGTAlertLevelRepository(_load_json(WBGT_ALERT_LEVEL_JSON_FILE))
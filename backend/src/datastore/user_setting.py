@@ -1,11 +1,13 @@
 from abc import abstractmethod
 from .base import BaseClass
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from ..models import (
     UserSetting,
 )
 from ..lib.aws import dynamodb
 
+USER_SETTING_SCAN_SEGMENTS = 4
+
 
 class BaseUserSettingRepository(BaseClass):
     @abstractmethod
@@ -16,6 +18,11 @@ class BaseUserSettingRepository(BaseClass):
     def get_all_user_settings(self) -> List[UserSetting]:
         pass
 
+    @abstractmethod
+    def iter_user_settings_of_prefecture(self, pref_key: str, page_size: Optional[int] = None) -> Iterator[List[UserSetting]]:
+        """User settings of the prefecture, page by page"""
+        pass
+
     @abstractmethod
     def put_user_setting(self, user_setting: UserSetting):
         pass
@@ -37,6 +44,13 @@ class InMemoryUserSettingRepository(BaseUserSettingRepository):
     def get_all_user_settings(self) -> List[UserSetting]:
         return list(self.user_settings.values())
 
+    def iter_user_settings_of_prefecture(self, pref_key: str, page_size: Optional[int] = None) -> Iterator[List[UserSetting]]:
+        user_settings = [u for u in self.user_settings.values() if u.pref_key == pref_key]
+        if page_size is None:
+            page_size = max(len(user_settings), 1)
+        for i in range(0, len(user_settings), page_size):
+            yield user_settings[i:i + page_size]
+
     def put_user_setting(self, user_setting: UserSetting):
         self.user_settings[user_setting.user_id] = UserSetting.parse_obj(user_setting)
 
@@ -47,8 +61,9 @@ class InMemoryUserSettingRepository(BaseUserSettingRepository):
 
 
 class DynamoDBUserSettingRepository(BaseUserSettingRepository):
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, pref_key_index_name: str = "PrefKey"):
         self.table_name = table_name
+        self.pref_key_index_name = pref_key_index_name
 
     def get_user_setting(self, user_id: str) -> Optional[UserSetting]:
         user_setting_raw = dynamodb.get_item(self.table_name, {"user_id": user_id})
@@ -56,22 +71,26 @@ class DynamoDBUserSettingRepository(BaseUserSettingRepository):
             return UserSetting.parse_obj(user_setting_raw)
 
     def get_all_user_settings(self) -> List[UserSetting]:
-        user_settings_raw = dynamodb.get_items(self.table_name)
+        user_settings_raw = dynamodb.get_items(self.table_name, total_segments=USER_SETTING_SCAN_SEGMENTS)
         user_setting_list = []
         for user_setting_raw in user_settings_raw:
             if user_setting_raw is not None:
                 user_setting_list.append(UserSetting.parse_obj(user_setting_raw))
         return user_setting_list
 
+    def iter_user_settings_of_prefecture(self, pref_key: str, page_size: Optional[int] = None) -> Iterator[List[UserSetting]]:
+        for page in dynamodb.query_pages(self.table_name, {"pref_key": pref_key}, self.pref_key_index_name, page_size):
+            yield [UserSetting.parse_obj(user_setting_raw) for user_setting_raw in page]
+
     def put_user_setting(self, user_setting: UserSetting):
         dynamodb.put_item(self.table_name, user_setting.dict())
 
     def delete_user_setting_w_domain_id(self, domain_id):
-        user_settings_raw = dynamodb.query(self.table_name, {"domain_id": domain_id}, "DomainID")
+        # all the pages, only the keys
+        user_settings_raw = dynamodb.query(self.table_name, {"domain_id": domain_id}, "DomainID", projection_expression="user_id")
         keys = []
         for user_setting_raw in user_settings_raw:
             if user_setting_raw is not None:
-                user_setting = UserSetting.parse_obj(user_setting_raw)
-                keys.append({"user_id": user_setting.user_id})
+                keys.append({"user_id": user_setting_raw["user_id"]})
         # delete
         dynamodb.delete_items(self.table_name, keys)
@@ -1,13 +1,19 @@
+import struct
 from abc import abstractmethod
+from bisect import bisect_left
+from datetime import date, datetime
 from .base import BaseClass
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
 from ..models import (
     WBGT,
     WBGTPoint,
     WBGTPrefPoint,
     WBGTAlertLevel,
+    WBGTImportFingerprint,
+    PrefectureSummary,
 )
 from ..lib.aws import dynamodb
+from ..lib.wbgt_bundle import WBGTStaticBundle
 
 
 class BaseWBGTPrefPointRepository(BaseClass):
@@ -33,6 +39,29 @@ class InMemoryWBGTPrefPointRepository(BaseWBGTPrefPointRepository):
         return list(self.wbgt_pref_points.values())
 
 
+class BundleWBGTPrefPointRepository(BaseWBGTPrefPointRepository):
+    """Prefectures read from the memory-mapped static bundle on lookup"""
+    def __init__(self, bundle: WBGTStaticBundle):
+        self.bundle = bundle
+        self.wbgt_pref_points = {}
+
+    def get_wbgt_pref_point(self, pref_key: str) -> WBGTPrefPoint:
+        cache = self.wbgt_pref_points.get(pref_key)
+        if cache is not None:
+            return cache
+
+        d = self.bundle.get_pref(pref_key)
+        if d is None:
+            return None
+        # the bundle is built from validated data
+        _item = WBGTPrefPoint.construct(**d)
+        self.wbgt_pref_points[pref_key] = _item
+        return _item
+
+    def get_wbgt_pref_points(self) -> List[WBGTPrefPoint]:
+        return [WBGTPrefPoint.construct(**d) for d in self.bundle.iter_prefs()]
+
+
 class BaseWBGTPointRepository(BaseClass):
     @abstractmethod
     def get_wbgt_points(self) -> List[WBGTPoint]:
@@ -56,6 +85,126 @@ class InMemoryWBGTPointRepository(BaseWBGTPointRepository):
         return list(self.wbgt_points.values())
 
 
+class BundleWBGTPointRepository(BaseWBGTPointRepository):
+    """Points read from the memory-mapped static bundle on lookup"""
+    def __init__(self, bundle: WBGTStaticBundle):
+        self.bundle = bundle
+        self.wbgt_points = {}
+
+    def get_wbgt_point(self, point_id: str) -> WBGTPoint:
+        cache = self.wbgt_points.get(point_id)
+        if cache is not None:
+            return cache
+
+        d = self.bundle.get_point(point_id)
+        if d is None:
+            return None
+        # the bundle is built from validated data
+        _item = WBGTPoint.construct(**d)
+        self.wbgt_points[point_id] = _item
+        return _item
+
+    def get_wbgt_points(self) -> List[WBGTPoint]:
+        return [WBGTPoint.construct(**d) for d in self.bundle.iter_points()]
+
+
+class WBGTAlertLevelIndex():
+    """Immutable index to classify WBGT values into alert levels
+
+    The [min_value, max_value] ranges of the alert levels are split into
+    elementary slots by their sorted boundaries: slot 2i+1 is the boundary
+    b[i] itself and slot 2i is the open range (b[i-1], b[i]).
+    The level with the highest priority is precomputed for each slot,
+    so a lookup is a single bisect.
+    """
+    def __init__(self, alert_levels: List[WBGTAlertLevel]):
+        boundaries = set()
+        for alert_level in alert_levels:
+            boundaries.add(alert_level.min_value)
+            boundaries.add(alert_level.max_value)
+        self._boundaries: Tuple[float, ...] = tuple(sorted(boundaries))
+
+        slots = []
+        for i in range(2 * len(self._boundaries) + 1):
+            slots.append(self.__find_alert_level(alert_levels, self.__representative_value(i)))
+        self._slots: Tuple[Optional[WBGTAlertLevel], ...] = tuple(slots)
+
+        self._priorities: Dict[str, int] = {a.alert_level_key: a.priority for a in alert_levels}
+        self._levels_by_priority: Dict[int, WBGTAlertLevel] = {}
+        for alert_level in alert_levels:
+            if alert_level.priority not in self._levels_by_priority:
+                self._levels_by_priority[alert_level.priority] = alert_level
+        self._slot_priorities = None
+
+    def __representative_value(self, slot: int) -> float:
+        b = self._boundaries
+        if len(b) == 0:
+            return 0
+        i = slot // 2
+        if slot % 2 == 1:
+            return b[i]
+        if i == 0:
+            return b[0] - 1
+        if i == len(b):
+            return b[-1] + 1
+        return (b[i - 1] + b[i]) / 2
+
+    @staticmethod
+    def __find_alert_level(alert_levels: List[WBGTAlertLevel], value: float) -> Optional[WBGTAlertLevel]:
+        rst = None
+        for alert_level in alert_levels:
+            if alert_level.min_value <= value and alert_level.max_value >= value:
+                if rst is None or alert_level.priority > rst.priority:
+                    rst = alert_level
+        return rst
+
+    def classify(self, value: float) -> Optional[WBGTAlertLevel]:
+        if value != value:
+            # NaN
+            return None
+        i = bisect_left(self._boundaries, value)
+        if i < len(self._boundaries) and self._boundaries[i] == value:
+            return self._slots[2 * i + 1]
+        return self._slots[2 * i]
+
+    def classify_many(self, values: Sequence[float]) -> List[Optional[WBGTAlertLevel]]:
+        """Classify an array of WBGT values in one call"""
+        return [self._slots[s] if s >= 0 else None for s in self.classify_slots(values).tolist()]
+
+    def classify_slots(self, values: Sequence[float]):
+        """Slot numbers of an array of WBGT values (-1 for NaN)"""
+        # numpy is only needed for the vectorized lookup
+        import numpy as np
+
+        v = np.asarray(values, dtype=np.float64)
+        b = np.asarray(self._boundaries, dtype=np.float64)
+        if len(b) == 0:
+            return np.zeros(v.shape, dtype=np.int64)
+        i = np.searchsorted(b, v, side="left")
+        exact = (i < len(b)) & (b[np.minimum(i, len(b) - 1)] == v)
+        slots = 2 * i + exact
+        slots[np.isnan(v)] = -1
+        return slots
+
+    def classify_priorities(self, values: Sequence[float]):
+        """Alert level priorities of an array of WBGT values (-1 for no alert level or NaN)"""
+        import numpy as np
+
+        if self._slot_priorities is None:
+            self._slot_priorities = np.asarray([a.priority if a is not None else -1 for a in self._slots], dtype=np.int64)
+        slots = self.classify_slots(values)
+        return np.where(slots >= 0, self._slot_priorities[np.maximum(slots, 0)], -1)
+
+    def get_alert_level_of_priority(self, priority: int) -> Optional[WBGTAlertLevel]:
+        return self._levels_by_priority.get(int(priority))
+
+    def slot_alert_level(self, slot: int) -> Optional[WBGTAlertLevel]:
+        return self._slots[slot] if slot >= 0 else None
+
+    def get_priority(self, alert_level_key: str) -> Optional[int]:
+        return self._priorities.get(alert_level_key)
+
+
 class BaseWBGTAlertLevelRepository(BaseClass):
     @abstractmethod
     def get_wbgt_alert_levels(self) -> List[WBGTAlertLevel]:
@@ -65,12 +214,20 @@ class BaseWBGTAlertLevelRepository(BaseClass):
     def get_wbgt_alert_level(self, alert_level_key) -> Optional[WBGTAlertLevel]:
         pass
 
+    @abstractmethod
+    def get_wbgt_alert_level_index(self) -> WBGTAlertLevelIndex:
+        pass
+
 
 class InMemoryWBGTAlertLevelRepository(BaseWBGTAlertLevelRepository):
     def __init__(self, data: List[Dict]):
         self.wbgt_alert_levels = {}
         for d in data:
             self.wbgt_alert_levels[d["alert_level_key"]] =  WBGTAlertLevel.parse_obj(d)
+        self.wbgt_alert_level_index = WBGTAlertLevelIndex(list(self.wbgt_alert_levels.values()))
+
+    def get_wbgt_alert_level_index(self) -> WBGTAlertLevelIndex:
+        return self.wbgt_alert_level_index
 
     def get_wbgt_alert_levels(self) -> List[WBGTAlertLevel]:
         return list(self.wbgt_alert_levels.values())
@@ -84,6 +241,10 @@ class BaseWBGTRepository(BaseClass):
     def get_wbgt(self, wbgt_key: str) -> Optional[WBGT]:
         pass
 
+    @abstractmethod
+    def get_wbgt_many(self, wbgt_keys: List[str]) -> Dict[str, WBGT]:
+        pass
+
     @abstractmethod
     def put_wbgt_list(self, wbgt_list: List[WBGT]):
         pass
@@ -103,6 +264,14 @@ class InMemoryWBGTRepository(BaseWBGTRepository):
     def get_wbgt(self, wbgt_key: str) -> Optional[WBGT]:
         return self.wbgt_list.get(wbgt_key)
 
+    def get_wbgt_many(self, wbgt_keys: List[str]) -> Dict[str, WBGT]:
+        rst = {}
+        for wbgt_key in wbgt_keys:
+            wbgt = self.wbgt_list.get(wbgt_key)
+            if wbgt is not None:
+                rst[wbgt_key] = wbgt
+        return rst
+
     def put_wbgt_list(self, wbgt_list: List[WBGT]):
         for w in wbgt_list:
             self.put_wbgt(w)
@@ -127,6 +296,17 @@ class DynamoDBWBGTRepository(BaseWBGTRepository):
                 del wbgt_raw[self.ttl_attr_name]
             return WBGT.parse_obj(wbgt_raw)
 
+    def get_wbgt_many(self, wbgt_keys: List[str]) -> Dict[str, WBGT]:
+        wbgts_raw = dynamodb.batch_get_items(self.table_name, [{"wbgt_key": k} for k in wbgt_keys])
+        rst = {}
+        for wbgt_raw in wbgts_raw:
+            if self.ttl_attr_name in wbgt_raw:
+                # remove ttl attr
+                del wbgt_raw[self.ttl_attr_name]
+            wbgt = WBGT.parse_obj(wbgt_raw)
+            rst[wbgt.wbgt_key] = wbgt
+        return rst
+
     def put_wbgt_list(self, wbgt_list: List[WBGT]):
         items = []
         for w in wbgt_list:
@@ -134,7 +314,301 @@ class DynamoDBWBGTRepository(BaseWBGTRepository):
             i = w.dict()
             i[self.ttl_attr_name] = w.updated_timestamp + self.ttl_sec
             items.append(i)
-        dynamodb.put_items(self.table_name, items)
+        return dynamodb.put_items(self.table_name, items)
 
     def put_wbgt(self, wbgt: WBGT):
         dynamodb.put_item(self.table_name, wbgt.dict())
+
+
+SERIES_KEY_SUFFIX = "series"
+SERIES_SLOT_HOURS = 3
+SERIES_MISSING_VALUE = -32768
+# int64 updated_timestamp + int16 tenths of the slots (little endian)
+SERIES_HEADER_FORMAT = "<q"
+SERIES_HEADER_SIZE = struct.calcsize(SERIES_HEADER_FORMAT)
+
+
+def time_key_to_hours(time_key: str) -> int:
+    """Hours since 0001-01-01 of a time key (yyyymmddhh, hh: 01-24)"""
+    return datetime.strptime(time_key[:8], "%Y%m%d").toordinal() * 24 + int(time_key[8:])
+
+
+def hours_to_time_key(hours: int) -> str:
+    day, hour = divmod(hours, 24)
+    if hour == 0:
+        # 24 of the previous day
+        day -= 1
+        hour = 24
+    return "{}{:02}".format(date.fromordinal(day).strftime("%Y%m%d"), hour)
+
+
+def pack_series(updated_timestamp: int, values: Sequence[Optional[float]]) -> bytes:
+    """Pack the values of the slots as int16 tenths (None: missing)"""
+    tenths = [SERIES_MISSING_VALUE if v is None else int(round(v * 10)) for v in values]
+    return struct.pack(SERIES_HEADER_FORMAT + "{}h".format(len(tenths)), int(updated_timestamp), *tenths)
+
+
+def unpack_series(data: bytes) -> Tuple[int, List[Optional[float]]]:
+    (updated_timestamp,) = struct.unpack_from(SERIES_HEADER_FORMAT, data)
+    count = (len(data) - SERIES_HEADER_SIZE) // 2
+    tenths = struct.unpack_from("<{}h".format(count), data, SERIES_HEADER_SIZE)
+    return updated_timestamp, [None if t == SERIES_MISSING_VALUE else t / 10 for t in tenths]
+
+
+class PackedDynamoDBWBGTRepository(BaseWBGTRepository):
+    """WBGT data held as one item per point ({point_id}_series)
+
+    The item holds the slots from start_time_key (every 3 hours) as a
+    binary attribute of int16 tenths, so that a day of a point is a single
+    small item read without Decimal conversion. A write merges the values
+    with the slots of the previous imports still within the TTL.
+    The points without a series, and the slots before the start of the
+    series, are read from the item per slot format (DynamoDBWBGTRepository),
+    so the format can be switched at any import: the slots written before
+    the switch are still read, while the slots after the start are a
+    single item read.
+    """
+    def __init__(self, table_name: str, ttl_attr_name: str = "expired_at", ttl_sec: int = TREE_DAYS_PERIOD):
+        self.table_name = table_name
+        self.ttl_attr_name = ttl_attr_name
+        self.ttl_sec = ttl_sec
+        self.item_repo = DynamoDBWBGTRepository(table_name, ttl_attr_name, ttl_sec)
+
+    @staticmethod
+    def create_series_key(point_id: str) -> str:
+        return "{}_{}".format(point_id, SERIES_KEY_SUFFIX)
+
+    @staticmethod
+    def split_wbgt_key(wbgt_key: str) -> Tuple[str, str]:
+        point_id, time_key = wbgt_key.rsplit("_", 1)
+        return point_id, time_key
+
+    def get_series_many(self, point_ids: List[str]) -> Dict[str, Tuple[int, int, Dict[str, float]]]:
+        """point_id -> (updated_timestamp, hours of start_time_key, {time_key: value})"""
+        _raws = dynamodb.batch_get_items(
+            self.table_name,
+            [{"wbgt_key": self.create_series_key(point_id)} for point_id in point_ids],
+            projection_expression="wbgt_key, start_time_key, series",
+        )
+        rst = {}
+        for _raw in _raws:
+            data = _raw["series"]
+            # boto3 Binary
+            updated_timestamp, values = unpack_series(getattr(data, "value", data))
+            start = time_key_to_hours(_raw["start_time_key"])
+            point_id = _raw["wbgt_key"][:-len(SERIES_KEY_SUFFIX) - 1]
+            rst[point_id] = (updated_timestamp, start, {
+                hours_to_time_key(start + i * SERIES_SLOT_HOURS): v for i, v in enumerate(values) if v is not None
+            })
+        return rst
+
+    def get_wbgt(self, wbgt_key: str) -> Optional[WBGT]:
+        return self.get_wbgt_many([wbgt_key]).get(wbgt_key)
+
+    def get_wbgt_many(self, wbgt_keys: List[str]) -> Dict[str, WBGT]:
+        keys_by_point: Dict[str, List[Tuple[str, str]]] = {}
+        for wbgt_key in wbgt_keys:
+            point_id, time_key = self.split_wbgt_key(wbgt_key)
+            keys_by_point.setdefault(point_id, []).append((wbgt_key, time_key))
+
+        series = self.get_series_many(list(keys_by_point))
+        rst = {}
+        legacy_keys = []
+        for point_id, keys in keys_by_point.items():
+            if point_id not in series:
+                legacy_keys.extend(k for k, _ in keys)
+                continue
+            updated_timestamp, start, values = series[point_id]
+            for wbgt_key, time_key in keys:
+                if time_key not in values:
+                    if time_key_to_hours(time_key) < start:
+                        # written before the switch to the packed format
+                        legacy_keys.append(wbgt_key)
+                    # otherwise not imported yet
+                else:
+                    rst[wbgt_key] = WBGT(
+                        wbgt_key=wbgt_key,
+                        point_id=point_id,
+                        time_key=time_key,
+                        value=values[time_key],
+                        updated_timestamp=updated_timestamp,
+                    )
+        if len(legacy_keys) > 0:
+            rst.update(self.item_repo.get_wbgt_many(legacy_keys))
+        return rst
+
+    def put_wbgt_list(self, wbgt_list: List[WBGT]):
+        wbgts_by_point: Dict[str, List[WBGT]] = {}
+        for wbgt in wbgt_list:
+            wbgts_by_point.setdefault(wbgt.point_id, []).append(wbgt)
+        prev_series = self.get_series_many(list(wbgts_by_point)) if len(wbgts_by_point) > 0 else {}
+
+        items = []
+        for point_id, wbgts in wbgts_by_point.items():
+            updated_timestamp = int(max(w.updated_timestamp for w in wbgts))
+            new_hours = {time_key_to_hours(w.time_key): w.value for w in wbgts}
+            # the previous slots within the TTL, overwritten by the new ones
+            oldest = min(new_hours) - self.ttl_sec // 3600
+            values = {}
+            if point_id in prev_series:
+                for time_key, value in prev_series[point_id][2].items():
+                    hours = time_key_to_hours(time_key)
+                    if hours >= oldest and (hours - min(new_hours)) % SERIES_SLOT_HOURS == 0:
+                        values[hours] = value
+            values.update(new_hours)
+
+            start, end = min(values), max(values)
+            items.append({
+                "wbgt_key": self.create_series_key(point_id),
+                "start_time_key": hours_to_time_key(start),
+                "series": pack_series(updated_timestamp, [values.get(h) for h in range(start, end + 1, SERIES_SLOT_HOURS)]),
+                self.ttl_attr_name: updated_timestamp + self.ttl_sec,
+            })
+        return dynamodb.put_items(self.table_name, items)
+
+    def put_wbgt(self, wbgt: WBGT):
+        self.put_wbgt_list([wbgt])
+
+
+def create_dynamodb_wbgt_repository(table_name: str, storage_format: str = "item") -> BaseWBGTRepository:
+    """WBGT repository of the storage format ("item": an item per slot, "packed": an item per point)"""
+    if storage_format == "packed":
+        return PackedDynamoDBWBGTRepository(table_name)
+    if storage_format == "item":
+        return DynamoDBWBGTRepository(table_name)
+    raise Exception("Unknown WBGT storage format: {}".format(storage_format))
+
+
+class BaseWBGTImportFingerprintRepository(BaseClass):
+    @abstractmethod
+    def get_import_fingerprints(self) -> Dict[str, WBGTImportFingerprint]:
+        pass
+
+    @abstractmethod
+    def put_import_fingerprints(self, fingerprints: Dict[str, WBGTImportFingerprint], import_version: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def get_import_version(self) -> Optional[str]:
+        pass
+
+
+class InMemoryWBGTImportFingerprintRepository(BaseWBGTImportFingerprintRepository):
+    def __init__(self):
+        self.fingerprints = {}
+        self.import_version = None
+
+    def get_import_fingerprints(self) -> Dict[str, WBGTImportFingerprint]:
+        return dict(self.fingerprints)
+
+    def put_import_fingerprints(self, fingerprints: Dict[str, WBGTImportFingerprint], import_version: Optional[str] = None):
+        self.fingerprints = dict(fingerprints)
+        self.import_version = import_version
+
+    def get_import_version(self) -> Optional[str]:
+        return self.import_version
+
+
+IMPORT_FINGERPRINT_KEY = "__import_fingerprints__"
+
+class DynamoDBWBGTImportFingerprintRepository(BaseWBGTImportFingerprintRepository):
+    """Fingerprints of all points held in a single item of the WBGT table"""
+    def __init__(self, table_name: str, key_attr_name: str = "wbgt_key", key: str = IMPORT_FINGERPRINT_KEY):
+        self.table_name = table_name
+        self.key_attr_name = key_attr_name
+        self.key = key
+
+    def get_import_fingerprints(self) -> Dict[str, WBGTImportFingerprint]:
+        _raw = dynamodb.get_item(self.table_name, {self.key_attr_name: self.key})
+        if _raw is None:
+            return {}
+        rst = {}
+        for point_id, (fingerprint, written_timestamp) in _raw.get("points", {}).items():
+            rst[point_id] = WBGTImportFingerprint(
+                point_id=point_id,
+                fingerprint=fingerprint,
+                written_timestamp=written_timestamp,
+            )
+        return rst
+
+    def put_import_fingerprints(self, fingerprints: Dict[str, WBGTImportFingerprint], import_version: Optional[str] = None):
+        item = {
+            self.key_attr_name: self.key,
+            # compact form: point_id -> [fingerprint, written_timestamp]
+            "points": {f.point_id: [f.fingerprint, f.written_timestamp] for f in fingerprints.values()},
+        }
+        if import_version is not None:
+            item["import_version"] = import_version
+        dynamodb.put_item(self.table_name, item)
+
+    def get_import_version(self) -> Optional[str]:
+        _raw = dynamodb.get_item(self.table_name, {self.key_attr_name: self.key}, consistent_read=True)
+        if _raw is None:
+            return None
+        return _raw.get("import_version")
+
+
+class BaseWBGTPrefSummaryRepository(BaseClass):
+    @abstractmethod
+    def get_pref_summary(self, pref_key: str, day: date) -> Optional[PrefectureSummary]:
+        pass
+
+    @abstractmethod
+    def get_pref_summaries(self, pref_keys: List[str], day: date) -> Dict[str, PrefectureSummary]:
+        pass
+
+    @abstractmethod
+    def put_pref_summaries(self, summaries: List[PrefectureSummary]):
+        pass
+
+
+class InMemoryWBGTPrefSummaryRepository(BaseWBGTPrefSummaryRepository):
+    def __init__(self):
+        self.summaries: Dict[Tuple[str, date], PrefectureSummary] = {}
+
+    def get_pref_summary(self, pref_key: str, day: date) -> Optional[PrefectureSummary]:
+        return self.summaries.get((pref_key, day))
+
+    def get_pref_summaries(self, pref_keys: List[str], day: date) -> Dict[str, PrefectureSummary]:
+        return {k: self.summaries[(k, day)] for k in pref_keys if (k, day) in self.summaries}
+
+    def put_pref_summaries(self, summaries: List[PrefectureSummary]):
+        for summary in summaries:
+            self.summaries[(summary.pref_key, summary.day)] = summary
+
+
+class DynamoDBWBGTPrefSummaryRepository(BaseWBGTPrefSummaryRepository):
+    """Daily summaries of the prefectures (pref_key, day), expire with the WBGT data"""
+    def __init__(self, table_name: str, ttl_attr_name: str = "expired_at", ttl_sec: int = TREE_DAYS_PERIOD):
+        self.table_name = table_name
+        self.ttl_attr_name = ttl_attr_name
+        self.ttl_sec = ttl_sec
+
+    def get_pref_summary(self, pref_key: str, day: date) -> Optional[PrefectureSummary]:
+        _raw = dynamodb.get_item(self.table_name, {"pref_key": pref_key, "day": day.isoformat()})
+        if _raw is None:
+            return None
+        return PrefectureSummary.parse_raw(_raw["summary"])
+
+    def get_pref_summaries(self, pref_keys: List[str], day: date) -> Dict[str, PrefectureSummary]:
+        _raws = dynamodb.batch_get_items(self.table_name, [{"pref_key": k, "day": day.isoformat()} for k in pref_keys])
+        rst = {}
+        for _raw in _raws:
+            summary = PrefectureSummary.parse_raw(_raw["summary"])
+            rst[summary.pref_key] = summary
+        return rst
+
+    def put_pref_summaries(self, summaries: List[PrefectureSummary]):
+        items = [
+            {
+                "pref_key": s.pref_key,
+                "day": s.day.isoformat(),
+                "import_version": s.import_version,
+                "imported_at": s.imported_at,
+                # JSON, so that the floats are kept as is
+                "summary": s.json(),
+                self.ttl_attr_name: int(datetime.combine(s.day, datetime.min.time()).timestamp()) + self.ttl_sec,
+            }
+            for s in summaries
+        ]
+        return dynamodb.put_items(self.table_name, items)
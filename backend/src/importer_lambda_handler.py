@@ -1,39 +1,81 @@
 import os
-from requests.structures import CaseInsensitiveDict
-from datetime import datetime, timedelta
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, EventBridgeEvent
 
 
 from .datastore.wbgt import (
-    DynamoDBWBGTRepository,
+    create_dynamodb_wbgt_repository,
+    DynamoDBWBGTImportFingerprintRepository,
+    DynamoDBWBGTPrefSummaryRepository,
 )
+from .datastore import static_data
 from .service.wbgt import (
     WBGTService
 )
 from .app.import_wbgt import (
     WBGTImporterApplication
 )
-from .lib.wbgt_data import WBGTData
+from .app.wbgt_prediction import (
+    WBGTPredictionApplication,
+)
+from .lib.wbgt_data import (
+    WBGTData,
+    YOHOU_ALL_URL,
+    LocalFileSourceCache,
+    S3SourceCache,
+)
 
 logger = Logger()
 
+WBGT_SOURCE_CACHE_DIR = "/tmp/wbgt_source_cache"
+
 
 def import_wbgt():
     wbgt_table_name = os.environ.get("TABLE_WBGT")
     if wbgt_table_name is None:
         raise Exception("Please set TABLE_WBGT env")
+    wbgt_pref_summary_table_name = os.environ.get("TABLE_WBGT_PREF_SUMMARY")
+    if wbgt_pref_summary_table_name is None:
+        raise Exception("Please set TABLE_WBGT_PREF_SUMMARY env")
 
-    wbgt_repo = DynamoDBWBGTRepository(wbgt_table_name)
+    wbgt_repo = create_dynamodb_wbgt_repository(wbgt_table_name, os.environ.get("WBGT_STORAGE_FORMAT", "item"))
+    wbgt_import_fingerprint_repo = DynamoDBWBGTImportFingerprintRepository(wbgt_table_name)
+    wbgt_pref_summary_repo = DynamoDBWBGTPrefSummaryRepository(wbgt_pref_summary_table_name)
     wbgt_svc = WBGTService()
-    wbgt_data_lib = WBGTData()
+
+    # the daily summaries of the prefectures are written from the imported values
+    wbgt_pred_app = WBGTPredictionApplication(
+        static_data.get_wbgt_point_repo(),
+        static_data.get_wbgt_pref_point_repo(),
+        wbgt_repo,
+        static_data.get_wbgt_alert_level_repo(),
+        wbgt_svc,
+    )
+
+    # keep the last downloaded source in S3 if a bucket is set, otherwise in /tmp
+    source_cache_bucket_name = os.environ.get("BUCKET_WBGT_SOURCE_CACHE")
+    if source_cache_bucket_name is not None:
+        source_cache = S3SourceCache(source_cache_bucket_name)
+    else:
+        source_cache = LocalFileSourceCache(WBGT_SOURCE_CACHE_DIR)
+    wbgt_data_lib = WBGTData(
+        url=os.environ.get("WBGT_SOURCE_URL", YOHOU_ALL_URL),
+        cache=source_cache,
+        timeout=float(os.environ.get("WBGT_SOURCE_TIMEOUT", 30)),
+        retry_count=int(os.environ.get("WBGT_SOURCE_RETRY_COUNT", 3)),
+    )
 
     # load wbgt points
-    wbgt_importer = WBGTImporterApplication(wbgt_repo, wbgt_svc, wbgt_data_lib)
-    wbgt_importer.load_wbgt_pred_data()
+    wbgt_importer = WBGTImporterApplication(wbgt_repo, wbgt_svc, wbgt_data_lib, wbgt_import_fingerprint_repo,
+                                            wbgt_pred_app=wbgt_pred_app, wbgt_pref_summary_repo=wbgt_pref_summary_repo)
+    stats = wbgt_importer.load_wbgt_pred_data()
+    if stats is None:
+        logger.info("WBGT source is not modified. Skip import.")
+    else:
+        logger.info("Import stats: {}".format(stats))
 
 
 # You can continue to use other utilities just as before
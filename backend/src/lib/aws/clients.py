@@ -0,0 +1,140 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 32
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+####################################
+# Shared boto3 clients #
+####################################
+
+class AWSClientRegistry():
+    """Process-wide registry of boto3 clients and resources
+
+    A Lambda container keeps the registry across warm invocations, so the
+    session setup, credential resolution and queue URL lookup are paid once.
+    Clients are thread safe and shared. Resources are not thread safe,
+    so each thread gets its own resource (and Table handles).
+    Tests can inject stubbed clients with set_client / set_resource.
+    """
+    def __init__(self,
+                 max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+                 retry_mode: str = DEFAULT_RETRY_MODE,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 ):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.configure(max_pool_connections, retry_mode, max_attempts)
+
+    def configure(self,
+                  max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+                  retry_mode: str = DEFAULT_RETRY_MODE,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                  ):
+        """Set the client config. Already created clients are dropped."""
+        with self._lock:
+            self.config = Config(
+                max_pool_connections=max_pool_connections,
+                retries={"mode": retry_mode, "max_attempts": max_attempts},
+            )
+            self.reset()
+
+    def reset(self):
+        """Drop all clients, resources and cached handles"""
+        with self._lock:
+            self._session: Optional[boto3.session.Session] = None
+            self._clients: Dict[str, object] = {}
+            self._resource_overrides: Dict[str, object] = {}
+            self._queue_urls: Dict[str, str] = {}
+            # thread local resources are invalidated by the generation
+            self._generation = getattr(self, "_generation", 0) + 1
+
+    def _get_session(self) -> boto3.session.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = boto3.session.Session()
+            return self._session
+
+    def get_client(self, service_name: str):
+        client = self._clients.get(service_name)
+        if client is not None:
+            return client
+        with self._lock:
+            if service_name not in self._clients:
+                self._clients[service_name] = self._get_session().client(service_name, config=self.config)
+            return self._clients[service_name]
+
+    def set_client(self, service_name: str, client):
+        with self._lock:
+            self._clients[service_name] = client
+
+    def _thread_cache(self) -> dict:
+        cache = getattr(self._local, "cache", None)
+        if cache is None or cache["generation"] != self._generation:
+            cache = {"generation": self._generation, "resources": {}, "tables": {}}
+            self._local.cache = cache
+        return cache
+
+    def get_resource(self, service_name: str):
+        override = self._resource_overrides.get(service_name)
+        if override is not None:
+            return override
+        resources = self._thread_cache()["resources"]
+        if service_name not in resources:
+            with self._lock:
+                # session is not thread safe while creating clients
+                resources[service_name] = self._get_session().resource(service_name, config=self.config)
+        return resources[service_name]
+
+    def set_resource(self, service_name: str, resource):
+        with self._lock:
+            self._resource_overrides[service_name] = resource
+            self._generation += 1
+
+    def get_table(self, table_name: str):
+        tables = self._thread_cache()["tables"]
+        if table_name not in tables:
+            tables[table_name] = self.get_resource("dynamodb").Table(table_name)
+        return tables[table_name]
+
+    def get_queue_url(self, queue_name: str) -> str:
+        url = self._queue_urls.get(queue_name)
+        if url is not None:
+            return url
+        url = self.get_client("sqs").get_queue_url(QueueName=queue_name)["QueueUrl"]
+        with self._lock:
+            self._queue_urls[queue_name] = url
+        return url
+
+    def set_queue_url(self, queue_name: str, url: str):
+        with self._lock:
+            self._queue_urls[queue_name] = url
+
+
+registry = AWSClientRegistry(
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS)),
+    retry_mode=os.environ.get("AWS_RETRY_MODE", DEFAULT_RETRY_MODE),
+    max_attempts=int(os.environ.get("AWS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+)
+
+
+def get_client(service_name: str):
+    return registry.get_client(service_name)
+
+
+def get_resource(service_name: str):
+    return registry.get_resource(service_name)
+
+
+def get_table(table_name: str):
+    return registry.get_table(table_name)
+
+
+def get_queue_url(queue_name: str) -> str:
+    return registry.get_queue_url(queue_name)
@@ -1,25 +1,70 @@
-import boto3
 import botocore.exceptions
 from boto3.dynamodb.conditions import Key
-from typing import List, Optional
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from typing import Iterator, List, Optional
 import json
+import queue
+import threading
+import time
+import random
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from . import clients
+
+BATCH_GET_ITEM_MAX_KEYS = 100
+BATCH_WRITE_ITEM_MAX_ITEMS = 25
+BATCH_RETRY_COUNT_MAX = 8
+BATCH_GET_MAX_WORKERS = 4
+BATCH_WRITE_MAX_WORKERS = 8
+SCAN_TOTAL_SEGMENTS = 4
 
 def decimal_default_proc(obj):
     if isinstance(obj, Decimal):
         return float(obj)
     raise TypeError
 
+
+def to_dynamodb_value(obj):
+    """Convert floats to Decimal for DynamoDB (same as json round trip with parse_float=Decimal)"""
+    if isinstance(obj, float):
+        return Decimal(repr(obj))
+    if isinstance(obj, dict):
+        return {k: to_dynamodb_value(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_dynamodb_value(v) for v in obj]
+    return obj
+
+
+class BatchWriteStats():
+    """Stats of a batch write call"""
+    def __init__(self, item_count: int = 0, request_count: int = 0, retry_count: int = 0, elapsed_sec: float = 0.0):
+        self.item_count = item_count
+        self.request_count = request_count
+        self.retry_count = retry_count
+        self.elapsed_sec = elapsed_sec
+
+    @property
+    def items_per_sec(self) -> float:
+        if self.elapsed_sec <= 0:
+            return 0.0
+        return self.item_count / self.elapsed_sec
+
+    def __repr__(self):
+        return "BatchWriteStats(items={}, requests={}, retries={}, elapsed={:.3f}s, items/s={:.1f})".format(
+            self.item_count, self.request_count, self.retry_count, self.elapsed_sec, self.items_per_sec)
+
 ####################################
 # DynamoDB #
 ####################################
-def get_item(table_name: str, key: dict) -> Optional[dict]:
+def get_item(table_name: str, key: dict, consistent_read: bool = False) -> Optional[dict]:
     """
     Get item from DynamoDB table
     """
-    table = boto3.resource("dynamodb").Table(table_name)
+    table = clients.get_table(table_name)
     response = table.get_item(
-        Key=key
+        Key=key,
+        ConsistentRead=consistent_read,
     )
 
     if "Item" in response:
@@ -30,31 +75,223 @@ def get_item(table_name: str, key: dict) -> Optional[dict]:
         return None
 
 
-def get_items(table_name: str) -> list:
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _serialize(item: dict) -> dict:
+    return {k: _serializer.serialize(v) for k, v in item.items()}
+
+
+def _deserialize(item: dict) -> dict:
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+def _backoff(attempt: int, base: float = 0.05, cap: float = 2.0):
+    # full jitter
+    time.sleep(random.uniform(0, min(cap, base * (2 ** attempt))))
+
+
+def _batch_get_chunk(table_name: str, keys: List[dict], projection_expression: Optional[str] = None) -> list:
+    # the low level client is thread safe and shares its connection pool
+    client = clients.get_client("dynamodb")
+    request = {"Keys": [_serialize(k) for k in keys]}
+    if projection_expression is not None:
+        request["ProjectionExpression"] = projection_expression
+    request_items = {table_name: request}
+
+    items = []
+    for i in range(BATCH_RETRY_COUNT_MAX):
+        response = client.batch_get_item(RequestItems=request_items)
+        items.extend(_deserialize(item) for item in response.get("Responses", {}).get(table_name, []))
+
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return items
+        # retry unprocessed keys
+        _backoff(i)
+
+    raise Exception("BatchGetItem retry over. unprocessed keys: {}".format(len(request_items[table_name]["Keys"])))
+
+
+def batch_get_items(table_name: str, keys: List[dict], projection_expression: Optional[str] = None, max_workers: int = BATCH_GET_MAX_WORKERS) -> list:
     """
-    Get items from DynamoDB table
+    Get items from DynamoDB table by BatchGetItem
+
+    Keys are split into chunks of 100 and the chunks are fetched concurrently.
+    The order of the returned items is not guaranteed.
     """
-    table = boto3.resource("dynamodb").Table(table_name)
-    response = table.scan()
+    # BatchGetItem rejects duplicated keys
+    unique_keys = []
+    seen = set()
+    for key in keys:
+        k = tuple(sorted(key.items()))
+        if k not in seen:
+            seen.add(k)
+            unique_keys.append(key)
 
-    if "Items" in response:
-        data = response['Items']
-        # レスポンスに LastEvaluatedKey が含まれなくなるまでループ処理を実行する
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            if "Items" in response:
-                data.extend(response['Items'])
-        return data
-    else:
+    chunks = list(_chunks(unique_keys, BATCH_GET_ITEM_MAX_KEYS))
+    if len(chunks) == 0:
         return []
+    if len(chunks) == 1 or max_workers <= 1:
+        items = []
+        for chunk in chunks:
+            items.extend(_batch_get_chunk(table_name, chunk, projection_expression))
+        return items
+
+    items = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        futures = [executor.submit(_batch_get_chunk, table_name, chunk, projection_expression) for chunk in chunks]
+        for future in futures:
+            items.extend(future.result())
+    return items
+
+
+def scan_pages(table_name: str,
+               projection_expression: Optional[str] = None,
+               expression_attribute_names: Optional[dict] = None,
+               page_size: Optional[int] = None,
+               segment: Optional[int] = None,
+               total_segments: Optional[int] = None,
+               ) -> Iterator[list]:
+    """
+    Scan items from DynamoDB table page by page (follows LastEvaluatedKey)
+
+    :param page_size: max items of a page (Limit)
+    :param segment: segment to scan of the parallel scan (0 <= segment < total_segments)
+    """
+    table = clients.get_table(table_name)
+    _params = dict()
+    if projection_expression is not None:
+        _params["ProjectionExpression"] = projection_expression
+    if expression_attribute_names is not None:
+        _params["ExpressionAttributeNames"] = expression_attribute_names
+    if page_size is not None:
+        _params["Limit"] = page_size
+    if total_segments is not None:
+        _params["Segment"] = segment
+        _params["TotalSegments"] = total_segments
+
+    while True:
+        response = table.scan(**_params)
+        items = response.get("Items", [])
+        if len(items) > 0:
+            yield items
+        # レスポンスに LastEvaluatedKey が含まれなくなるまでループ処理を実行する
+        if "LastEvaluatedKey" not in response:
+            return
+        _params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
 
+def parallel_scan_pages(table_name: str,
+                        total_segments: int = SCAN_TOTAL_SEGMENTS,
+                        projection_expression: Optional[str] = None,
+                        expression_attribute_names: Optional[dict] = None,
+                        page_size: Optional[int] = None,
+                        ) -> Iterator[list]:
+    """
+    Scan items from DynamoDB table by a parallel scan (Segment / TotalSegments)
 
-def query(table_name: str, key: dict, index_name: Optional[str] = None) -> list:
+    The segments are scanned concurrently and the pages are yielded as they arrive
+    (the order of the pages is not guaranteed).
     """
-    Query items from DynamoDB table
+    if total_segments <= 1:
+        yield from scan_pages(table_name, projection_expression, expression_attribute_names, page_size)
+        return
+
+    pages: "queue.Queue" = queue.Queue(maxsize=total_segments * 2)
+    stopped = threading.Event()
+    done = object()
+
+    def _put(item) -> bool:
+        # bounded queue: wait for the consumer unless it stopped
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _scan_segment(segment: int):
+        try:
+            for page in scan_pages(table_name, projection_expression, expression_attribute_names, page_size, segment, total_segments):
+                if not _put(page):
+                    return
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(done)
+
+    executor = ThreadPoolExecutor(max_workers=total_segments)
+    try:
+        for segment in range(total_segments):
+            executor.submit(_scan_segment, segment)
+
+        remaining = total_segments
+        while remaining > 0:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # the consumer stopped early or failed
+        stopped.set()
+        executor.shutdown(wait=False)
+
+
+def get_items(table_name: str,
+              total_segments: int = 1,
+              projection_expression: Optional[str] = None,
+              expression_attribute_names: Optional[dict] = None,
+              ) -> list:
     """
-    table = boto3.resource("dynamodb").Table(table_name)
+    Get items from DynamoDB table
+
+    :param total_segments: segments of the parallel scan (1: serial scan)
+    """
+    data = []
+    for page in parallel_scan_pages(table_name, total_segments, projection_expression, expression_attribute_names):
+        data.extend(page)
+    return data
+
+
+def query(table_name: str,
+          key: dict,
+          index_name: Optional[str] = None,
+          projection_expression: Optional[str] = None,
+          expression_attribute_names: Optional[dict] = None,
+          ) -> list:
+    """
+    Query items from DynamoDB table (all the pages)
+    """
+    data = []
+    for page in query_pages(table_name, key, index_name, projection_expression=projection_expression, expression_attribute_names=expression_attribute_names):
+        data.extend(page)
+    return data
+
+
+def query_pages(table_name: str,
+                key: dict,
+                index_name: Optional[str] = None,
+                page_size: Optional[int] = None,
+                projection_expression: Optional[str] = None,
+                expression_attribute_names: Optional[dict] = None,
+                ) -> Iterator[list]:
+    """
+    Query items from DynamoDB table page by page (follows LastEvaluatedKey)
+
+    :param page_size: max items of a page (Limit)
+    """
+    table = clients.get_table(table_name)
     key_conditions = None
     for k, v in key.items():
         kc = Key(k).eq(v)
@@ -67,43 +304,93 @@ def query(table_name: str, key: dict, index_name: Optional[str] = None) -> list:
     _params["KeyConditionExpression"] = key_conditions
     if index_name is not None:
         _params["IndexName"] = index_name
+    if page_size is not None:
+        _params["Limit"] = page_size
+    if projection_expression is not None:
+        _params["ProjectionExpression"] = projection_expression
+    if expression_attribute_names is not None:
+        _params["ExpressionAttributeNames"] = expression_attribute_names
+
+    while True:
+        response = table.query(**_params)
+        items = response.get("Items", [])
+        if len(items) > 0:
+            yield items
+        if "LastEvaluatedKey" not in response:
+            return
+        _params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
 
-    response = table.query(**_params)
+def _serialize_write_request(request: dict) -> dict:
+    if "PutRequest" in request:
+        return {"PutRequest": {"Item": _serialize(request["PutRequest"]["Item"])}}
+    return {"DeleteRequest": {"Key": _serialize(request["DeleteRequest"]["Key"])}}
 
-    if "Items" in response:
-        return response['Items']
+
+def _batch_write_chunk(table_name: str, requests: List[dict]) -> BatchWriteStats:
+    # the low level client is thread safe and shares its connection pool
+    client = clients.get_client("dynamodb")
+    request_items = {table_name: [_serialize_write_request(r) for r in requests]}
+
+    stats = BatchWriteStats(item_count=len(requests))
+    for i in range(BATCH_RETRY_COUNT_MAX):
+        response = client.batch_write_item(RequestItems=request_items)
+        stats.request_count += 1
+
+        request_items = response.get("UnprocessedItems")
+        if not request_items:
+            return stats
+        # retry unprocessed items
+        stats.retry_count += 1
+        _backoff(i)
+
+    raise Exception("BatchWriteItem retry over. unprocessed items: {}".format(len(request_items[table_name])))
+
+
+def batch_write_items(table_name: str, requests: List[dict], max_workers: int = BATCH_WRITE_MAX_WORKERS) -> BatchWriteStats:
+    """
+    Write items to DynamoDB table by BatchWriteItem
+
+    Requests are split into chunks of 25 and written concurrently.
+    Requests must not contain duplicated keys.
+
+    :param requests: write requests (e.g. {"PutRequest": {"Item": item}}, {"DeleteRequest": {"Key": key}})
+    :return: stats of the call
+    """
+    start = time.perf_counter()
+    stats = BatchWriteStats()
+
+    chunks = list(_chunks(requests, BATCH_WRITE_ITEM_MAX_ITEMS))
+    if len(chunks) > 1 and max_workers > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = [executor.submit(_batch_write_chunk, table_name, chunk) for chunk in chunks]
+            results = [future.result() for future in futures]
     else:
-        return []
+        results = [_batch_write_chunk(table_name, chunk) for chunk in chunks]
 
+    for r in results:
+        stats.item_count += r.item_count
+        stats.request_count += r.request_count
+        stats.retry_count += r.retry_count
+    stats.elapsed_sec = time.perf_counter() - start
+    return stats
 
-def put_items(table_name: str, items: List[dict]):
+
+def put_items(table_name: str, items: List[dict], max_workers: int = BATCH_WRITE_MAX_WORKERS) -> BatchWriteStats:
     """
     Put items from DynamoDB table
     """
-    table = boto3.resource("dynamodb").Table(table_name)
-
-    with table.batch_writer() as writer:
-        try:
-            for item in items:
-                _params = dict()
-                _params["Item"] = json.loads(json.dumps(item), parse_float=Decimal)
-
-                table.put_item(**_params)
-        except botocore.exceptions.ClientError as e:
-            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                # 条件NG
-                pass
-            else:
-                raise
+    requests = [{"PutRequest": {"Item": to_dynamodb_value(item)}} for item in items]
+    return batch_write_items(table_name, requests, max_workers)
 
 
 def put_item(table_name: str, item: dict, condition_expression: Optional[str] = None, expression_attribute_values: Optional[dict] = None):
     """
     Put item from DynamoDB table
     """
-    table = boto3.resource("dynamodb").Table(table_name)
+    table = clients.get_table(table_name)
     _params = dict()
-    _params["Item"] = json.loads(json.dumps(item), parse_float=Decimal)
+    _params["Item"] = to_dynamodb_value(item)
     if condition_expression is not None:
         _params["ConditionExpression"] = condition_expression
 
@@ -120,31 +407,48 @@ def put_item(table_name: str, item: dict, condition_expression: Optional[str] =
             raise
 
 
-def delete_items(table_name: str, keys: List[dict]):
+def update_item(table_name: str, key: dict, update_expression: str, condition_expression: Optional[str] = None, expression_attribute_values: Optional[dict] = None, expression_attribute_names: Optional[dict] = None) -> bool:
     """
-    Delete items from DynamoDB table
+    Update item of DynamoDB table
+
+    :return: False if the condition is not satisfied
     """
-    table = boto3.resource("dynamodb").Table(table_name)
+    table = clients.get_table(table_name)
+    _params = dict()
+    _params["Key"] = key
+    _params["UpdateExpression"] = update_expression
+    if condition_expression is not None:
+        _params["ConditionExpression"] = condition_expression
 
-    with table.batch_writer() as writer:
-        try:
-            for key in keys:
-                _params = dict()
-                _params["Key"] = key
-                table.delete_item(**_params)
-        except botocore.exceptions.ClientError as e:
-            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                # 条件NG
-                pass
-            else:
-                raise
+    if expression_attribute_values is not None:
+        _params["ExpressionAttributeValues"] = to_dynamodb_value(expression_attribute_values)
+
+    if expression_attribute_names is not None:
+        _params["ExpressionAttributeNames"] = expression_attribute_names
+
+    try:
+        table.update_item(**_params)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            # 条件NG
+            return False
+        raise
+    return True
+
+
+def delete_items(table_name: str, keys: List[dict], max_workers: int = BATCH_WRITE_MAX_WORKERS) -> BatchWriteStats:
+    """
+    Delete items from DynamoDB table
+    """
+    requests = [{"DeleteRequest": {"Key": to_dynamodb_value(key)}} for key in keys]
+    return batch_write_items(table_name, requests, max_workers)
 
 
 def delete_item(table_name: str, key: dict, condition_expression: Optional[str] = None, expression_attribute_values: Optional[dict] = None):
     """
     Delete item from DynamoDB table
     """
-    table = boto3.resource("dynamodb").Table(table_name)
+    table = clients.get_table(table_name)
     _params = dict()
     _params["Key"] = key
     if condition_expression is not None:
@@ -0,0 +1,52 @@
+import botocore.exceptions
+from typing import Optional
+
+from . import clients
+
+
+####################################
+# S3 #
+####################################
+
+def get_object_bytes(bucket_name: str, key: str) -> Optional[bytes]:
+    """
+    Get object body from S3 bucket (None if the object does not exist)
+    """
+    s3 = clients.get_client("s3")
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return response["Body"].read()
+
+
+def download_file(bucket_name: str, key: str, file_path: str) -> bool:
+    """
+    Download object from S3 bucket to a file (False if the object does not exist)
+    """
+    s3 = clients.get_client("s3")
+    try:
+        s3.download_file(bucket_name, key, file_path)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return False
+        raise
+    return True
+
+
+def put_object_bytes(bucket_name: str, key: str, body: bytes):
+    """
+    Put object to S3 bucket
+    """
+    s3 = clients.get_client("s3")
+    s3.put_object(Bucket=bucket_name, Key=key, Body=body)
+
+
+def upload_file(bucket_name: str, key: str, file_path: str):
+    """
+    Upload a file to S3 bucket
+    """
+    s3 = clients.get_client("s3")
+    s3.upload_file(file_path, bucket_name, key)
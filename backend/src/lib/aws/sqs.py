@@ -1,22 +1,41 @@
-import boto3
 import botocore.exceptions
-from boto3.dynamodb.conditions import Key
-from typing import List, Optional
-import json
-from decimal import Decimal
+from typing import List
+
+from . import clients
 
 
 ####################################
 # SQS #
 ####################################
 
-def send_queue_message(queue_name: str, message: str):
-    sqs = boto3.resource('sqs')
-    queue = sqs.get_queue_by_name(QueueName=queue_name)
+def send_queue_message(queue_name: str, message: str, delay_seconds: int = 0):
+    sqs = clients.get_client("sqs")
+
+    _params = dict()
+    if delay_seconds > 0:
+        _params["DelaySeconds"] = delay_seconds
 
     try:
-        queue.send_message(
+        sqs.send_message(
+            QueueUrl=clients.get_queue_url(queue_name),
             MessageBody=message,
+            **_params,
         )
     except botocore.exceptions.ClientError:
         raise
+
+
+def send_queue_message_batch(queue_name: str, entries: List[dict]) -> List[dict]:
+    """
+    Send up to 10 messages by SendMessageBatch
+
+    :param entries: [{"Id": ..., "MessageBody": ..., "DelaySeconds": ...(optional)}]
+    :return: failed entries of the response
+    """
+    sqs = clients.get_client("sqs")
+
+    response = sqs.send_message_batch(
+        QueueUrl=clients.get_queue_url(queue_name),
+        Entries=entries,
+    )
+    return response.get("Failed", [])
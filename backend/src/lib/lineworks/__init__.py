@@ -1 +1 @@
-from . import bot, auth, util, base
+from . import bot, auth, util, base, ratelimit, session
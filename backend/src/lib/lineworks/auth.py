@@ -1,10 +1,14 @@
 import json
+import hashlib
+import threading
 
-import jwt
 from datetime import datetime
+from typing import Dict, Tuple
 import urllib
 import requests
 
+from . import session as http_session
+
 
 BASE_AUTH_URL = 'https://auth.worksmobile.com/oauth2/v2.0'
 
@@ -14,6 +18,46 @@ class AuthRequestError(Exception):
     """
 
 
+class PrivateKeyCache():
+    """Parsed private keys for signing, keyed by the credential
+
+    Loading a PEM RSA key is much more expensive than signing with it,
+    so each key is parsed once per container. A rotated key has a new
+    fingerprint and is parsed again.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: Dict[Tuple[str, str], object] = {}
+
+    @staticmethod
+    def _fingerprint(privatekey: str) -> str:
+        return hashlib.sha256(privatekey.encode()).hexdigest()
+
+    def get(self, client_id: str, privatekey: str):
+        key = (client_id, self._fingerprint(privatekey))
+        private_key = self._keys.get(key)
+        if private_key is not None:
+            return private_key
+
+        # cryptography is loaded only when a token is issued
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        private_key = load_pem_private_key(privatekey.encode(), password=None)
+        with self._lock:
+            # drop the old keys of the client
+            for k in [k for k in self._keys if k[0] == client_id]:
+                del self._keys[k]
+            self._keys[key] = private_key
+        return private_key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+
+
+private_key_cache = PrivateKeyCache()
+
+
 def __get_jwt(client_id: str, service_account: str, privatekey: str) -> str:
     """Generate JWT for access token
 
@@ -22,6 +66,9 @@ def __get_jwt(client_id: str, service_account: str, privatekey: str) -> str:
     :param privatekey: Private Key
     :return: JWT
     """
+    # jwt (and cryptography) is loaded only when a token is issued
+    import jwt
+
     current_time = datetime.now().timestamp()
     iss = client_id
     sub = service_account
@@ -34,7 +81,7 @@ def __get_jwt(client_id: str, service_account: str, privatekey: str) -> str:
             "sub": sub,
             "iat": iat,
             "exp": exp
-        }, privatekey, algorithm="RS256")
+        }, private_key_cache.get(client_id, privatekey), algorithm="RS256")
 
     return jws
 
@@ -69,7 +116,7 @@ def get_access_token(client_id: str, client_secret: str, service_account: str, p
 
     form_data = params
 
-    r = requests.post(url=url, data=form_data, headers=headers)
+    r = http_session.get_session().post(url=url, data=form_data, headers=headers, timeout=http_session.get_timeout())
 
     try:
         r.raise_for_status()
@@ -96,7 +143,7 @@ def refresh_access_token(client_id, client_secret, refresh_token):
 
     form_data = params
 
-    r = requests.post(url=ACCESS_TOKEN_URI, data=form_data, headers=headers)
+    r = http_session.get_session().post(url=ACCESS_TOKEN_URI, data=form_data, headers=headers, timeout=http_session.get_timeout())
 
     try:
         r.raise_for_status()
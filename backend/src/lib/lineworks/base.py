@@ -1,7 +1,12 @@
 import json
 import time
+from typing import Optional, Tuple
+
 import requests
 
+from . import session as http_session
+from .ratelimit import RateLimiter, parse_retry_after, jittered_backoff
+
 
 BASE_API_URL = "https://www.worksapis.com/v1.0"
 RETRY_COUNT_MAX = 5
@@ -21,53 +26,125 @@ class BotApiRequestError(BotApiBaseError):
     """
 
 
+class BotApiRequestDeferred(BotApiBaseError):
+    """Bot API リクエスト Deferred (rate limited, retry after `retry_after` seconds)
+    """
+    def __init__(self, *args, retry_after: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
 class BaseApi():
-    def __init__(self, access_token: str, request_try_count=RETRY_COUNT_MAX):
+    def __init__(self,
+                 access_token: str,
+                 request_try_count=RETRY_COUNT_MAX,
+                 session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 rate_limit_key: str = "",
+                 max_wait_sec: Optional[float] = None,
+                 timeout: Optional[Tuple[float, float]] = None,
+                 ):
+        """
+        :param session: requests session (the shared session of the container if None)
+        :param rate_limiter: token buckets shared by the clients (no client side limit if None)
+        :param rate_limit_key: key of the token bucket (e.g. "{bot_id}:{domain_id}")
+        :param max_wait_sec: BotApiRequestDeferred is raised instead of waiting longer than this (always wait if None)
+        :param timeout: (connect, read) timeout seconds of a request (the default of the shared session if None)
+        """
         self.access_token = access_token
         self.request_try_count = request_try_count
+        self.session = session if session is not None else http_session.get_session()
+        self.timeout = timeout if timeout is not None else http_session.get_timeout()
+        self.rate_limiter = rate_limiter
+        self.rate_limit_key = rate_limit_key
+        self.max_wait_sec = max_wait_sec
 
         self.headers = {
           'Content-Type' : 'application/json',
           'Authorization' : "Bearer {}".format(access_token)
         }
 
-    def __http(self, func, **kwargs) -> dict:
+    def __wait(self, wait: float, response: Optional[requests.Response] = None):
+        if self.max_wait_sec is not None and wait > self.max_wait_sec:
+            # let the caller requeue the request
+            raise BotApiRequestDeferred(retry_after=wait, response=response)
+        if wait > 0:
+            time.sleep(wait)
+
+    def __http(self, func, idempotent: bool = True, **kwargs) -> dict:
+        """
+        :param idempotent: False for a request which must not be sent twice (POST):
+            it is retried only when it could not be sent (connection error or connect timeout)
+        """
+        bucket = None
+        if self.rate_limiter is not None:
+            bucket = self.rate_limiter.get_bucket(self.rate_limit_key)
+
         res = None
+        error = None
         for i in range(self.request_try_count):
+            if bucket is not None:
+                wait = bucket.reserve()
+                if self.max_wait_sec is not None and wait > self.max_wait_sec:
+                    bucket.cancel()
+                self.__wait(wait, res)
+
             try:
                 # Reply message
-                r = func(headers=self.headers, allow_redirects=False, **kwargs)
+                r = func(headers=self.headers, allow_redirects=False, timeout=self.timeout, **kwargs)
                 res = r
                 r.raise_for_status()
-                if r.text is not None and r.text != "":
-                    return r.json()
-                return r.text
             except requests.RequestException as e:
-                body = e.response.json()
-                status_code = e.response.status_code
-                if status_code == 429:
+                error = e
+                wait = jittered_backoff(i)
+                if e.response is None:
+                    # Connection error or timeout.
+                    if not idempotent and not isinstance(e, (requests.ConnectionError, requests.ConnectTimeout)):
+                        # e.g. read timeout: the request may have been accepted
+                        raise BotApiRequestError(e, request=e.request)
+                elif e.response.status_code == 429:
                     # Requests over rate limit.
-                    pass
+                    retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                    if bucket is not None:
+                        # the next reservation waits for Retry-After
+                        bucket.on_throttled(retry_after)
+                    elif retry_after is not None:
+                        wait = max(wait, retry_after)
                 else:
-                    raise BotApiRequestError(response=e.response)
+                    raise BotApiRequestError(request=e.request, response=e.response)
 
-                # wait and retry
-                time.sleep(2 ** i)
-            else:
-                break
+                if i + 1 < self.request_try_count:
+                    # wait and retry
+                    self.__wait(wait, e.response)
+                continue
+
+            if bucket is not None:
+                bucket.on_success()
+            if r.text is None or r.text == "":
+                return r.text
+            try:
+                return r.json()
+            except ValueError as e:
+                # the request succeeded: not retried
+                raise BotApiRequestError(e, request=r.request, response=r)
         if res is not None:
             raise BotApiRequestRetryOver(response=res)
+        raise BotApiRequestRetryOver(error, request=getattr(error, "request", None))
 
     def get(self, path: str, params: dict) -> dict:
         url = "{}{}".format(BASE_API_URL, path)
 
-        res = self.__http(requests.get, url=url, params=params)
+        res = self.__http(self.session.get, url=url, params=params)
         return res
 
     def post(self, path: str, data: dict) -> dict:
-        url = "{}{}".format(BASE_API_URL, path)
-
         form_data = json.dumps(data)
 
-        res = self.__http(requests.post, url=url, data=form_data)
+        return self.post_raw(path, form_data.encode())
+
+    def post_raw(self, path: str, body: bytes) -> dict:
+        """POST a serialized JSON body as is"""
+        url = "{}{}".format(BASE_API_URL, path)
+
+        res = self.__http(self.session.post, idempotent=False, url=url, data=body)
         return res
@@ -1,15 +1,23 @@
 import json
+import time
 
 import hashlib
 import hmac
 from base64 import b64encode, b64decode
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional, Tuple, Union
 
 import requests
 
 from . import base
+from . import session as http_session
+from .ratelimit import RateLimiter, default_limiter
 
 
 BASE_API_URL = "https://www.worksapis.com/v1.0"
+SEND_MAX_WORKERS = 8
+# requests which would wait longer than this are deferred to the caller
+SEND_MAX_WAIT_SEC = 5.0
 
 
 def validate_request(body: bytes, signature: str, bot_secret: str) -> bool:
@@ -33,10 +41,12 @@ def validate_request(body: bytes, signature: str, bot_secret: str) -> bool:
 
 
 class BotApi(base.BaseApi):
-    def send_message_to_user(self, content: dict, bot_id: str, user_id: str):
-        """メッセージ送信"""
+    def send_message_to_user(self, content: Union[dict, bytes], bot_id: str, user_id: str):
+        """メッセージ送信 (content: dict or serialized JSON bytes)"""
         path = "/bots/{}/users/{}/messages".format(bot_id, user_id)
 
+        if isinstance(content, bytes):
+            return self.post_raw(path, content)
         return self.post(path, content)
 
 
@@ -55,7 +65,7 @@ class BotApi(base.BaseApi):
               'Authorization' : "Bearer {}".format(access_token)
             }
 
-        r = requests.get(url=url, headers=headers)
+        r = http_session.get_session().get(url=url, headers=headers, timeout=http_session.get_timeout())
 
         try:
             r.raise_for_status()
@@ -78,7 +88,7 @@ class BotApi(base.BaseApi):
         }
         form_data = json.dumps(params)
 
-        r = requests.post(url=url, data=form_data, headers=headers)
+        r = http_session.get_session().post(url=url, data=form_data, headers=headers, timeout=http_session.get_timeout())
 
         try:
             r.raise_for_status()
@@ -88,6 +98,111 @@ class BotApi(base.BaseApi):
         return r.json()
 
 
+class SendResult():
+    """Result of sending messages to a user"""
+    def __init__(self, user_id: str, ok: bool, error: Optional[Exception] = None, elapsed_sec: float = 0.0):
+        self.user_id = user_id
+        self.ok = ok
+        self.error = error
+        self.elapsed_sec = elapsed_sec
+
+    @property
+    def deferred(self) -> bool:
+        """The request was not sent because of the rate limit (retry after `retry_after` seconds)"""
+        return isinstance(self.error, base.BotApiRequestDeferred)
+
+    @property
+    def unauthorized(self) -> bool:
+        """The access token was rejected (401)"""
+        return isinstance(self.error, base.BotApiRequestError) and self.error.response is not None \
+            and self.error.response.status_code == 401
+
+    @property
+    def retry_after(self) -> float:
+        if isinstance(self.error, base.BotApiRequestDeferred):
+            return self.error.retry_after
+        return 0.0
+
+    def __repr__(self):
+        return "SendResult(user_id={}, ok={}, error={!r}, elapsed={:.3f}s)".format(
+            self.user_id, self.ok, self.error, self.elapsed_sec)
+
+
+class ConcurrentMessageSender():
+    """Send messages to users from a bounded thread pool
+
+    The workers share the session of the container and a BotApi per access token.
+    Requests are throttled by the token bucket of the rate limit key
+    (e.g. "{bot_id}:{domain_id}"). A request which would wait longer than
+    max_wait_sec is not sent and reported as deferred, so that the caller
+    can requeue it.
+    Use it as a context manager, so that the workers are shut down on exit.
+    """
+    def __init__(self,
+                 max_workers: int = SEND_MAX_WORKERS,
+                 request_try_count: int = base.RETRY_COUNT_MAX,
+                 rate_limiter: Optional[RateLimiter] = default_limiter,
+                 max_wait_sec: Optional[float] = SEND_MAX_WAIT_SEC,
+                 ):
+        self.max_workers = max_workers
+        self.request_try_count = request_try_count
+        self.rate_limiter = rate_limiter
+        self.max_wait_sec = max_wait_sec
+
+        # the pool size of the shared session bounds the concurrent connections
+        self.session = http_session.get_session()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._bot_apis: Dict[Tuple[str, str], BotApi] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _get_bot_api(self, access_token: str, rate_limit_key: str) -> "BotApi":
+        # called from the submitting thread only
+        bot_api = self._bot_apis.get((access_token, rate_limit_key))
+        if bot_api is None:
+            bot_api = BotApi(access_token,
+                             request_try_count=self.request_try_count,
+                             session=self.session,
+                             rate_limiter=self.rate_limiter,
+                             rate_limit_key=rate_limit_key,
+                             max_wait_sec=self.max_wait_sec)
+            self._bot_apis[(access_token, rate_limit_key)] = bot_api
+        return bot_api
+
+    def submit(self, contents: List[Union[dict, bytes]], access_token: str, bot_id: str, user_id: str, rate_limit_key: Optional[str] = None) -> Future:
+        """Send the contents to a user in the background
+
+        :param rate_limit_key: key of the token bucket (bot_id if None)
+        :return: future of SendResult
+        """
+        if rate_limit_key is None:
+            rate_limit_key = bot_id
+        bot_api = self._get_bot_api(access_token, rate_limit_key)
+        return self._executor.submit(self._send, bot_api, contents, bot_id, user_id)
+
+    def send_to_users(self, contents: List[Union[dict, bytes]], access_token: str, bot_id: str, user_ids: List[str], rate_limit_key: Optional[str] = None) -> List[SendResult]:
+        """Send the contents to the users concurrently and wait for the results"""
+        futures = [self.submit(contents, access_token, bot_id, user_id, rate_limit_key) for user_id in user_ids]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _send(bot_api: "BotApi", contents: List[Union[dict, bytes]], bot_id: str, user_id: str) -> SendResult:
+        start = time.perf_counter()
+        try:
+            for content in contents:
+                bot_api.send_message_to_user(content, bot_id, user_id)
+        except Exception as e:
+            return SendResult(user_id, False, e, time.perf_counter() - start)
+        return SendResult(user_id, True, None, time.perf_counter() - start)
+
+
 def upload_file(url, file_data, access_token):
     headers = {
         'Authorization' : "Bearer {}".format(access_token),
@@ -97,7 +212,7 @@ def upload_file(url, file_data, access_token):
         'FileData': file_data,
     }
 
-    r = requests.post(url=url, files=file, headers=headers, timeout=180)
+    r = http_session.get_session().post(url=url, files=file, headers=headers, timeout=(http_session.get_timeout()[0], 180))
 
     try:
         r.raise_for_status()
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+DEFAULT_RATE = 10.0  # requests per second
+DEFAULT_MIN_RATE = 0.5
+DEFAULT_BURST = 10
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.1
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 30.0
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Parse Retry-After header (delay seconds or HTTP date) into seconds"""
+    if value is None or value == "":
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, retry_at - now)
+
+
+def jittered_backoff(attempt: int, base: float = BACKOFF_BASE_SEC, cap: float = BACKOFF_MAX_SEC) -> float:
+    """Backoff seconds with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket():
+    """Token bucket with a rate adapted from the throttled responses
+
+    The rate is halved on every 429 (not below min_rate) and increased
+    step by step on success (not above max_rate).
+    While the server asked to wait (Retry-After), no token is given.
+    """
+    def __init__(self,
+                 rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST,
+                 min_rate: float = DEFAULT_MIN_RATE,
+                 clock=time.monotonic,
+                 ):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it (0 if it is available now)"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self._tokens -= 1.0
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    def cancel(self):
+        """Give back a reserved token which was not used"""
+        with self._lock:
+            self._tokens = min(float(self.burst), self._tokens + 1.0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE_STEP)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+            # drop the burst, requests are spaced by the new rate
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+
+class RateLimiter():
+    """Token buckets keyed by the caller (e.g. "{bot_id}:{domain_id}")
+
+    A process-wide limiter is shared by the API clients of a Lambda container.
+    """
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, min_rate: float = DEFAULT_MIN_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def get_bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            return bucket
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst, self.min_rate)
+            return self._buckets[key]
+
+
+default_limiter = RateLimiter()
@@ -0,0 +1,91 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_CONNECTIONS = 4  # number of hosts (API, auth, file storage)
+DEFAULT_POOL_MAXSIZE = 16  # connections per host
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30.0
+
+
+####################################
+# Shared HTTP session #
+####################################
+
+class HTTPSessionPool():
+    """Process-wide requests session with keep-alive connection pools
+
+    A Lambda container keeps the session across warm invocations, so the
+    TCP and TLS handshakes to the API servers are paid once per connection
+    instead of once per request. The session is shared by the threads.
+    Tests can inject a session with set_session.
+    """
+    def __init__(self,
+                 pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 ):
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self.configure(pool_connections, pool_maxsize, connect_timeout, read_timeout)
+
+    def configure(self,
+                  pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                  pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                  connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                  read_timeout: float = DEFAULT_READ_TIMEOUT,
+                  ):
+        """Set the pool sizes and timeouts. The current session is closed."""
+        with self._lock:
+            self.pool_connections = pool_connections
+            self.pool_maxsize = pool_maxsize
+            self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+            self._close()
+
+    def reset(self):
+        """Close the session (a new one is created on the next use)"""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._session is not None:
+            self._session.close()
+        self._session = None
+
+    def get_session(self) -> requests.Session:
+        session = self._session
+        if session is not None:
+            return session
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def set_session(self, session: requests.Session):
+        with self._lock:
+            self._close()
+            self._session = session
+
+
+registry = HTTPSessionPool(
+    pool_connections=int(os.environ.get("LW_HTTP_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS)),
+    pool_maxsize=int(os.environ.get("LW_HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE)),
+    connect_timeout=float(os.environ.get("LW_HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+    read_timeout=float(os.environ.get("LW_HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+)
+
+
+def get_session() -> requests.Session:
+    return registry.get_session()
+
+
+def get_timeout() -> Tuple[float, float]:
+    return registry.timeout
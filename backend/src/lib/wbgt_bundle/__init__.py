@@ -0,0 +1,190 @@
+"""Compact binary bundle of the WBGT points and prefectures
+
+Layout (little endian):
+    header          MAGIC, version, counts and section offsets (HEADER)
+    string offsets  u32 * (string count + 1)
+    string data     interned UTF-8 strings
+    points          fixed-layout records sorted by point_id (POINT_RECORD)
+    prefectures     fixed-layout records sorted by pref_key (PREF_RECORD)
+    pref points     u32 point record index * point count, grouped by prefecture
+
+The bundle is memory-mapped and records are read on lookup,
+so nothing is parsed when the bundle is opened.
+"""
+import mmap
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"WBGTSDB\0"
+BUNDLE_VERSION = 1
+
+# magic, version, reserved, string count, point count, pref count,
+# offsets of string offsets, string data, points, prefectures, pref points
+HEADER = struct.Struct("<8sHHIIIIIIII")
+# point_id, point_key, pref_key, point_name_ja (string ids)
+POINT_RECORD = struct.Struct("<IIII")
+# pref_key, pref_name_ja (string ids), start and count in pref points
+PREF_RECORD = struct.Struct("<IIII")
+U32 = struct.Struct("<I")
+
+
+class WBGTBundleError(Exception):
+    """Invalid bundle"""
+
+
+class _StringTable():
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def intern(self, s: str) -> int:
+        if s not in self.ids:
+            self.ids[s] = len(self.strings)
+            self.strings.append(s.encode("utf-8"))
+        return self.ids[s]
+
+
+def build_bundle(points: List[dict], prefs: List[dict]) -> bytes:
+    """Build a bundle from the contents of wbgt_points.json and wbgt_pref.json"""
+    strings = _StringTable()
+
+    points = sorted(points, key=lambda p: p["point_id"].encode("utf-8"))
+    point_index = {p["point_id"]: i for i, p in enumerate(points)}
+    point_records = b"".join(
+        POINT_RECORD.pack(
+            strings.intern(p["point_id"]),
+            strings.intern(p["point_key"]),
+            strings.intern(p["pref_key"]),
+            strings.intern(p["point_name_ja"]),
+        ) for p in points)
+
+    pref_records = []
+    pref_points = []
+    for pref in sorted(prefs, key=lambda p: p["pref_key"].encode("utf-8")):
+        start = len(pref_points)
+        for point_id in pref["points"]:
+            pref_points.append(point_index[point_id])
+        pref_records.append(PREF_RECORD.pack(
+            strings.intern(pref["pref_key"]),
+            strings.intern(pref["pref_name_ja"]),
+            start,
+            len(pref["points"]),
+        ))
+
+    string_offsets = [0]
+    for s in strings.strings:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    sections = [
+        b"".join(U32.pack(o) for o in string_offsets),
+        b"".join(strings.strings),
+        point_records,
+        b"".join(pref_records),
+        b"".join(U32.pack(i) for i in pref_points),
+    ]
+    offsets = []
+    pos = HEADER.size
+    for section in sections:
+        offsets.append(pos)
+        pos += len(section)
+
+    header = HEADER.pack(MAGIC, BUNDLE_VERSION, 0, len(strings.strings), len(points), len(pref_records), *offsets)
+    return header + b"".join(sections)
+
+
+def write_bundle(points: List[dict], prefs: List[dict], path: str):
+    with open(path, "wb") as f:
+        f.write(build_bundle(points, prefs))
+
+
+class WBGTStaticBundle():
+    def __init__(self, buf):
+        self.buf = memoryview(buf)
+        if len(self.buf) < HEADER.size:
+            raise WBGTBundleError("bundle is too short")
+        (magic, version, _,
+         self.string_count, self.point_count, self.pref_count,
+         self.string_offsets_offset, self.string_data_offset,
+         self.points_offset, self.prefs_offset, self.pref_points_offset) = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise WBGTBundleError("invalid magic")
+        if version != BUNDLE_VERSION:
+            raise WBGTBundleError("unsupported version: {}".format(version))
+
+    @classmethod
+    def open(cls, path: str) -> "WBGTStaticBundle":
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf)
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        start, = U32.unpack_from(self.buf, self.string_offsets_offset + string_id * U32.size)
+        end, = U32.unpack_from(self.buf, self.string_offsets_offset + (string_id + 1) * U32.size)
+        return bytes(self.buf[self.string_data_offset + start:self.string_data_offset + end])
+
+    def string(self, string_id: int) -> str:
+        return self._string_bytes(string_id).decode("utf-8")
+
+    def _point_record(self, index: int) -> Tuple[int, int, int, int]:
+        return POINT_RECORD.unpack_from(self.buf, self.points_offset + index * POINT_RECORD.size)
+
+    def _pref_record(self, index: int) -> Tuple[int, int, int, int]:
+        return PREF_RECORD.unpack_from(self.buf, self.prefs_offset + index * PREF_RECORD.size)
+
+    def _find(self, key: str, count: int, record) -> Optional[int]:
+        # binary search over the records sorted by the first string
+        target = key.encode("utf-8")
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(record(mid)[0]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < count and self._string_bytes(record(lo)[0]) == target:
+            return lo
+        return None
+
+    def _point_dict(self, index: int) -> dict:
+        point_id, point_key, pref_key, point_name_ja = self._point_record(index)
+        return {
+            "point_id": self.string(point_id),
+            "point_key": self.string(point_key),
+            "pref_key": self.string(pref_key),
+            "point_name_ja": self.string(point_name_ja),
+        }
+
+    def _pref_dict(self, index: int) -> dict:
+        pref_key, pref_name_ja, _, _ = self._pref_record(index)
+        return {
+            "pref_key": self.string(pref_key),
+            "pref_name_ja": self.string(pref_name_ja),
+            "points": [self.string(self._point_record(i)[0]) for i in self.pref_point_indexes(index)],
+        }
+
+    def pref_point_indexes(self, pref_index: int) -> List[int]:
+        _, _, start, count = self._pref_record(pref_index)
+        base = self.pref_points_offset + start * U32.size
+        return [U32.unpack_from(self.buf, base + i * U32.size)[0] for i in range(count)]
+
+    def get_point(self, point_id: str) -> Optional[dict]:
+        i = self._find(point_id, self.point_count, self._point_record)
+        return self._point_dict(i) if i is not None else None
+
+    def get_pref(self, pref_key: str) -> Optional[dict]:
+        i = self._find(pref_key, self.pref_count, self._pref_record)
+        return self._pref_dict(i) if i is not None else None
+
+    def get_points_of_pref(self, pref_key: str) -> List[dict]:
+        i = self._find(pref_key, self.pref_count, self._pref_record)
+        if i is None:
+            return []
+        return [self._point_dict(p) for p in self.pref_point_indexes(i)]
+
+    def iter_points(self) -> Iterator[dict]:
+        for i in range(self.point_count):
+            yield self._point_dict(i)
+
+    def iter_prefs(self) -> Iterator[dict]:
+        for i in range(self.pref_count):
+            yield self._pref_dict(i)
@@ -1,33 +1,92 @@
-import json
-import datetime
-from typing import List, Dict
-from io import StringIO
-import requests
-import pandas as pd
+import csv
+import io
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
 
-import urllib.request
-import ssl
+from .cache import BaseSourceCache, LocalFileSourceCache, S3SourceCache
+from .fetch import (
+    ConditionalFetcher,
+    WBGTDataFetchError,
+    WBGTDataNotModified,
+    DEFAULT_TIMEOUT,
+    DEFAULT_RETRY_COUNT,
+)
 
 WBGT_DATETIME_STR_FORMAT = '%Y%m%d%H'
 YOHOU_ALL_URL = "https://www.wbgt.env.go.jp/prev15WG/dl/yohou_all.csv"
 
+# point id, issued time, then one column per time key
+YOHOU_ALL_FIRST_VALUE_COLUMN = 2
+
+
+def _parse_value(raw: str) -> float:
+    raw = raw.strip()
+    if raw == "":
+        # missing value
+        return 0.0
+    return float(raw)
+
+
+def parse_yohou_all(stream: BinaryIO, max_time_slots: Optional[int] = None) -> Iterator[Tuple[str, str, float]]:
+    """Parse yohou_all.csv row by row
+
+    :param stream: binary stream of yohou_all.csv
+    :param max_time_slots: number of time key columns to read from the head (all if None)
+    :return: iterator of (time_key, point_id, value)
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    time_keys = [h.strip() for h in header[YOHOU_ALL_FIRST_VALUE_COLUMN:]]
+    if max_time_slots is not None:
+        time_keys = time_keys[:max_time_slots]
+
+    for row in reader:
+        if len(row) == 0:
+            continue
+        point_id = row[0].strip()
+        if point_id == "":
+            continue
+        values = row[YOHOU_ALL_FIRST_VALUE_COLUMN:]
+        for i, time_key in enumerate(time_keys):
+            yield time_key, point_id, _parse_value(values[i]) if i < len(values) else 0.0
+
+
 class WBGTData():
-    def __init__(self):
-        pass
+    def __init__(self,
+                 url: str = YOHOU_ALL_URL,
+                 cache: Optional[BaseSourceCache] = None,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 retry_count: int = DEFAULT_RETRY_COUNT,
+                 ):
+        self.fetcher = ConditionalFetcher(url, cache=cache, timeout=timeout, retry_count=retry_count)
+
+    def iter_yohou_all(self, max_time_slots: Optional[int] = None, only_modified: bool = False) -> Iterator[Tuple[str, str, float]]:
+        """Stream yohou_all.csv
+
+        :param max_time_slots: number of time key columns to read from the head (all if None)
+        :param only_modified: raise WBGTDataNotModified if the source is not modified since the cached download
+        :return: iterator of (time_key, point_id, value)
+        """
+        with self.fetcher.fetch(body_if_not_modified=not only_modified) as res:
+            if only_modified and not res.modified:
+                raise WBGTDataNotModified(res.meta)
+            yield from parse_yohou_all(res.body, max_time_slots)
+
+    def commit(self):
+        """Save the last streamed source to the cache, so that the next iter_yohou_all(only_modified=True) skips it
+
+        Call it after the source has been imported.
+        """
+        self.fetcher.commit()
 
     def get_yohou_all(self) -> Dict:
-        ctx = ssl.create_default_context()
-        ctx.options |= 0x4  # ssl.OP_LEGACY_SERVER_CONNECT
-        with urllib.request.urlopen(YOHOU_ALL_URL, context=ctx) as res:
-            res_body = res.read()
-
-        rst = res_body.decode()
-
-        df = pd.read_csv(StringIO(rst), sep=",", encoding="ascii", index_col=0, header=0)
-        df = df.fillna(0)
-        df = df.drop(df.columns[[0]], axis=1)
-        json_data = df.to_json()
-        rst = json.loads(json_data)
+        rst = {}
+        for time_key, point_id, value in self.iter_yohou_all():
+            if time_key not in rst:
+                rst[time_key] = {}
+            rst[time_key][point_id] = value
         return rst
 
 
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+from abc import ABCMeta, abstractmethod
+from typing import BinaryIO, Optional
+
+import botocore.exceptions
+
+from ..aws import s3
+
+
+class BaseSourceCache(metaclass=ABCMeta):
+    """Cache of the last downloaded source body and its validators (ETag, Last-Modified)"""
+    @abstractmethod
+    def get_meta(self) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def open_body(self) -> Optional[BinaryIO]:
+        pass
+
+    @abstractmethod
+    def put(self, meta: dict, body_path: str):
+        pass
+
+
+class LocalFileSourceCache(BaseSourceCache):
+    def __init__(self, cache_dir: str, name: str = "yohou_all.csv"):
+        self.body_path = os.path.join(cache_dir, name)
+        self.meta_path = os.path.join(cache_dir, "{}.meta.json".format(name))
+
+    def get_meta(self) -> Optional[dict]:
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.body_path):
+            return None
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def open_body(self) -> Optional[BinaryIO]:
+        if not os.path.exists(self.body_path):
+            return None
+        return open(self.body_path, "rb")
+
+    def put(self, meta: dict, body_path: str):
+        os.makedirs(os.path.dirname(self.body_path), exist_ok=True)
+        if os.path.abspath(body_path) != os.path.abspath(self.body_path):
+            shutil.copyfile(body_path, self.body_path)
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f)
+
+
+class S3SourceCache(BaseSourceCache):
+    """Keeps the source in S3, with a local copy for the current container"""
+    def __init__(self, bucket_name: str, key: str = "yohou_all.csv", local_dir: str = "/tmp/wbgt_source_cache"):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.meta_key = "{}.meta.json".format(key)
+        self.local_cache = LocalFileSourceCache(local_dir, os.path.basename(key))
+
+    def get_meta(self) -> Optional[dict]:
+        try:
+            body = s3.get_object_bytes(self.bucket_name, self.meta_key)
+        except botocore.exceptions.ClientError as e:
+            # a missing key is AccessDenied without s3:ListBucket: no cache yet
+            if e.response['Error']['Code'] not in ('AccessDenied', '403'):
+                raise
+            return None
+        if body is None:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            # broken meta: download again
+            return None
+
+    def open_body(self) -> Optional[BinaryIO]:
+        local_meta = self.local_cache.get_meta()
+        meta = self.get_meta()
+        if meta is None:
+            return None
+        if local_meta != meta:
+            os.makedirs(os.path.dirname(self.local_cache.body_path), exist_ok=True)
+            if not s3.download_file(self.bucket_name, self.key, self.local_cache.body_path):
+                return None
+            self.local_cache.put(meta, self.local_cache.body_path)
+        return self.local_cache.open_body()
+
+    def put(self, meta: dict, body_path: str):
+        s3.upload_file(self.bucket_name, self.key, body_path)
+        # meta last, so that it never points to an old body
+        s3.put_object_bytes(self.bucket_name, self.meta_key, json.dumps(meta).encode())
+        self.local_cache.put(meta, body_path)
@@ -0,0 +1,161 @@
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from typing import BinaryIO, Optional, Tuple
+
+from .cache import BaseSourceCache
+
+DEFAULT_TIMEOUT = 30  # sec
+DEFAULT_RETRY_COUNT = 3
+DEFAULT_RETRY_WAIT = 1.0  # sec, doubled on each retry
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class WBGTDataFetchError(Exception):
+    """Download error of the WBGT source"""
+
+
+class WBGTDataNotModified(Exception):
+    """The WBGT source is not modified since the last download"""
+
+
+class FetchResult():
+    def __init__(self, modified: bool, body: Optional[BinaryIO], meta: Optional[dict] = None):
+        self.modified = modified
+        self.body = body
+        self.meta = meta
+
+    def close(self):
+        if self.body is not None:
+            self.body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def create_legacy_ssl_context() -> ssl.SSLContext:
+    ctx = ssl.create_default_context()
+    ctx.options |= 0x4  # ssl.OP_LEGACY_SERVER_CONNECT
+    return ctx
+
+
+class ConditionalFetcher():
+    """HTTP GET with If-None-Match / If-Modified-Since, timeout and retry
+
+    Without a cache, the response is streamed as is.
+    With a cache, the body is spooled to a file and kept pending: it is
+    stored in the cache by commit() once it has been processed, and the
+    validators of the cached body are sent on the next fetch. A body that
+    is never committed is downloaded again on the next fetch.
+    """
+    def __init__(self,
+                 url: str,
+                 cache: Optional[BaseSourceCache] = None,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 retry_count: int = DEFAULT_RETRY_COUNT,
+                 retry_wait: float = DEFAULT_RETRY_WAIT,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 ):
+        self.url = url
+        self.cache = cache
+        self.timeout = timeout
+        self.retry_count = retry_count
+        self.retry_wait = retry_wait
+        self.ssl_context = ssl_context if ssl_context is not None else create_legacy_ssl_context()
+        self._pending: Optional[Tuple[dict, str]] = None
+
+    def __is_retryable(self, e: Exception) -> bool:
+        if isinstance(e, urllib.error.HTTPError):
+            return e.code >= 500
+        return isinstance(e, (urllib.error.URLError, socket.timeout, ConnectionError))
+
+    def fetch(self, conditional: bool = True, body_if_not_modified: bool = True) -> FetchResult:
+        """Fetch the source
+
+        :param conditional: send the validators of the cached body
+        :param body_if_not_modified: open the cached body when the source is not modified
+        :return: result (must be closed)
+        """
+        self.discard()
+        for i in range(self.retry_count + 1):
+            try:
+                return self.__fetch(conditional, body_if_not_modified)
+            except Exception as e:
+                if not self.__is_retryable(e):
+                    raise WBGTDataFetchError(e) from e
+                if i >= self.retry_count:
+                    raise WBGTDataFetchError("retry over: {}".format(e)) from e
+            # wait and retry
+            time.sleep(self.retry_wait * (2 ** i))
+
+    def __fetch(self, conditional: bool, body_if_not_modified: bool) -> FetchResult:
+        headers = {}
+        cached_meta = self.cache.get_meta() if self.cache is not None else None
+        if conditional and cached_meta is not None:
+            if cached_meta.get("etag"):
+                headers["If-None-Match"] = cached_meta["etag"]
+            if cached_meta.get("last_modified"):
+                headers["If-Modified-Since"] = cached_meta["last_modified"]
+
+        req = urllib.request.Request(self.url, headers=headers)
+        context = self.ssl_context if self.url.startswith("https") else None
+        try:
+            res = urllib.request.urlopen(req, timeout=self.timeout, context=context)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            e.close()
+            if not body_if_not_modified:
+                return FetchResult(False, None, cached_meta)
+            body = self.cache.open_body()
+            if body is None:
+                # cache is lost
+                return self.__fetch(False, body_if_not_modified)
+            return FetchResult(False, body, cached_meta)
+
+        meta = {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if self.cache is None:
+            return FetchResult(True, res, meta)
+
+        # spool to file, saved to cache on commit
+        fd, tmp_path = tempfile.mkstemp(suffix=".csv")
+        try:
+            with res, os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(res, f, COPY_BUFFER_SIZE)
+            body = open(tmp_path, "rb")
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self._pending = (meta, tmp_path)
+        return FetchResult(True, body, meta)
+
+    def commit(self):
+        """Save the body of the last fetch to the cache (after it has been processed)"""
+        if self._pending is None:
+            return
+        meta, tmp_path = self._pending
+        self.cache.put(meta, tmp_path)
+        self.discard()
+
+    def discard(self):
+        """Drop the body of the last fetch without saving it"""
+        if self._pending is None:
+            return
+        _, tmp_path = self._pending
+        self._pending = None
+        if os.path.exists(tmp_path):
+            # an opened body is still readable after remove
+            os.remove(tmp_path)
@@ -1,28 +1,15 @@
 import os
-import urllib.parse
-import json
-
-from datetime import datetime, timedelta
 
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver, Response, content_types, CORSConfig
-from aws_lambda_powertools.event_handler.exceptions import (
-    NotFoundError,
-)
+from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 from .models import (
-    NoticeList,
-    NoticeContentPoint,
-    NoticeContent,
-    AccessToken,
-    BotClientCredential,
     InstalledApp,
 )
 from .datastore.bot_api_cred import (
     DynamoDBBotInfoRepository,
-    DynamoDBBotClientCredentialRepository,
     DynamoDBInstalledAppRepository,
     DynamoDBAccessTokenRepository,
 )
@@ -33,6 +20,7 @@ from .app.user_setting import (
     UserSettingApplication
 )
 
+from .app.access_token import get_access_token_manager
 from .lib import lineworks
 
 logger = Logger()
@@ -72,8 +60,6 @@ def post_bot_callback():
     header_botid = headers["x-works-botid"]
     header_sig = headers["x-works-signature"]
 
-    current_time = datetime.now().timestamp()
-
     access_token_table_name = os.environ.get("TABLE_ACCESS_TOKEN")
     if access_token_table_name is None:
         raise Exception("Please set TABLE_ACCESS_TOKEN env")
@@ -95,9 +81,7 @@ def post_bot_callback():
         raise Exception("Please set LW_BOT_ID env")
 
     bot_info_repo = DynamoDBBotInfoRepository(bot_info_table_name)
-    bot_client_cred_repo = DynamoDBBotClientCredentialRepository(bot_client_cred_table_name)
-    install_app_repo = DynamoDBInstalledAppRepository(installed_app_table_name)
-    access_token_repo = DynamoDBAccessTokenRepository(access_token_table_name)
+    access_token_manager = get_access_token_manager(access_token_table_name, bot_client_cred_table_name, installed_app_table_name)
 
     # Check bot id
     if header_botid != bot_id:
@@ -125,36 +109,11 @@ def post_bot_callback():
         }
     }
 
-    # Get access token
-    access_token_obj = access_token_repo.get_access_token_item(domain_id)
-    # Check existence and expiration
-    if access_token_obj is None or access_token_obj.expired_at < current_time:
-        # Renew access token
-        client_cred = bot_client_cred_repo.get_bot_client_credential(bot_info.bot_id, bot_info.provider_domain_id)
-        if client_cred is None:
-            logger.warn("A client credential is not set. Please set values")
-            return
-
-        # Eco app
-        installed_app = install_app_repo.get_installed_app(domain_id)
-        if installed_app is None:
-            raise Exception("Installed App does not exist.")
-        service_account = installed_app.service_account
-
-        res = lineworks.auth.get_access_token(client_cred.client_id,
-                                              client_cred.client_secret,
-                                              service_account,
-                                              client_cred.private_key,
-                                              "bot")
-        access_token_obj = AccessToken(
-            bot_id=bot_info.bot_id,
-            domain_id=domain_id,
-            access_token=res["access_token"],
-            created_at=current_time,
-            expired_at=current_time + int(res["expires_in"])
-        )
-        # Put access token
-        access_token_repo.put_access_token_item(access_token_obj)
+    # Get access token (refreshed ahead of the expiry by a single container)
+    access_token_obj = access_token_manager.get_access_token(bot_info, domain_id)
+    if access_token_obj is None:
+        logger.warn("A client credential is not set. Please set values")
+        return
 
     bot_api = lineworks.bot.BotApi(access_token_obj.access_token)
 
@@ -166,6 +125,9 @@ def post_bot_callback():
         return {}
     except Exception as e:
         logger.exception(e)
+        if isinstance(e, lineworks.base.BotApiRequestError) and e.response is not None and e.response.status_code == 401:
+            # a revoked token is not reused by the next invocations of the container
+            access_token_manager.invalidate(domain_id, access_token_obj.access_token)
         raise
 
 
@@ -218,6 +180,10 @@ def eco_uninstall_callback_handler():
     if access_token_table_name is None:
         raise Exception("Please set TABLE_ACCESS_TOKEN env")
 
+    bot_client_cred_table_name = os.environ.get("TABLE_BOT_CLIENT_CRED")
+    if bot_client_cred_table_name is None:
+        raise Exception("Please set TABLE_BOT_CLIENT_CRED env")
+
     user_setting_table_name = os.environ.get("TABLE_USER_SETTING")
     if user_setting_table_name is None:
         raise Exception("Please set TABLE_USER_SETTING env")
@@ -240,6 +206,8 @@ def eco_uninstall_callback_handler():
 
     # delete access token
     access_token_repo.delete_access_token_item(domain_id)
+    # drop the access token kept by the container
+    get_access_token_manager(access_token_table_name, bot_client_cred_table_name, installed_app_table_name).invalidate(domain_id)
 
     # delete user settings
     user_setting_app.delete_user_settings_w_domain_id(domain_id)
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 import datetime
 
@@ -65,6 +65,12 @@ class WBGT(BaseModel):
     updated_timestamp: int  # unix time
 
 
+class WBGTImportFingerprint(BaseModel):
+    point_id: str
+    fingerprint: str  # hash of the hourly values of the point
+    written_timestamp: int  # unix time
+
+
 class UserSetting(BaseModel):
     user_id: str
     domain_id: str
@@ -72,16 +78,38 @@ class UserSetting(BaseModel):
     alert_level_key: str
 
 
-class NoticeList(BaseModel):
+class NoticeListGroup(BaseModel):
     pref_key: str
     user_settings: List[UserSetting]
 
 
+class NoticeList(BaseModel):
+    groups: List[NoticeListGroup]
+    # the prefecture summaries of the run (not set by the old messages)
+    day: Optional[datetime.date] = None
+    import_version: Optional[str] = None
+    # requeued with the failed groups only
+    retry_count: int = 0
+
+
 class NoticeContentPoint(BaseModel):
     point: WBGTPoint
     max_wbgt: WBGT
 
 
+class PrefectureSummary(BaseModel):
+    """Daily prediction of a prefecture, written by the importer"""
+    pref_key: str
+    day: datetime.date
+    import_version: str
+    imported_at: int  # unix time of the source import
+    prefecture: WBGTPrefPoint
+    points: List[NoticeContentPoint]  # daily maximum of the points
+    alert_level: Optional[WBGTAlertLevel]
+    # point_id -> {time_key: value} of the day (merged by the next import)
+    slot_values: Dict[str, Dict[str, float]] = {}
+
+
 class NoticeContent(BaseModel):
     day: datetime.date
     points: List[NoticeContentPoint]
@@ -89,3 +117,13 @@ class NoticeContent(BaseModel):
     prefecture: WBGTPrefPoint
     user_setting: UserSetting
 
+
+
+class DomainNoticeContent(BaseModel):
+    """Notice content for the users of a domain (the content is shared by the users)"""
+    day: datetime.date
+    points: List[NoticeContentPoint]
+    alert_level: WBGTAlertLevel
+    prefecture: WBGTPrefPoint
+    domain_id: str
+    user_ids: List[str]
@@ -1,139 +1,168 @@
-import os
 import json
-from requests.structures import CaseInsensitiveDict
-from datetime import datetime, timedelta, time, timezone
+import os
+from datetime import date
+from typing import List
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, SQSEvent
 
 
 from .datastore.wbgt import (
-    DynamoDBWBGTRepository,
-    InMemoryWBGTPointRepository,
-    InMemoryWBGTPrefPointRepository,
-    InMemoryWBGTAlertLevelRepository,
-)
-from .datastore.bot_api_cred import (
-    DynamoDBBotInfoRepository,
-    DynamoDBBotClientCredentialRepository,
-    DynamoDBInstalledAppRepository,
-    DynamoDBAccessTokenRepository,
-)
-from .datastore.user_setting import (
-    DynamoDBUserSettingRepository,
+    create_dynamodb_wbgt_repository,
+    DynamoDBWBGTPrefSummaryRepository,
+    DynamoDBWBGTImportFingerprintRepository,
 )
+from .datastore import static_data
 from .service.wbgt import (
     WBGTService
 )
 from .app.wbgt_prediction import (
     WBGTPredictionApplication,
 )
-from .app.user_setting import (
-    UserSettingApplication
+from .app.pref_summary import (
+    PrefectureSummaryApplication,
 )
-
-from .service.publisher import SQSMessagePublisher
+from .service.publisher import SQSMessagePublisher, BatchSQSMessagePublisher
 from .models import (
     NoticeList,
-    NoticeContentPoint,
-    NoticeContent,
-    AccessToken,
-    BotClientCredential,
+    NoticeListGroup,
+    PrefectureSummary,
+    DomainNoticeContent,
 )
-from .service.publisher import SQSMessagePublisher
 
 logger = Logger()
 
+# upper limit of the recipients in a notify message
+NOTICE_MAX_USERS_PER_MESSAGE = 50
+# the failed groups of a message are requeued this many times, then sent to the dead letter queue
+NOTICE_LIST_RETRY_COUNT_MAX = 3
+NOTICE_LIST_RETRY_DELAY_SEC = 60
+
+
+class NoticeSkipped(Exception):
+    """The notices of the prefecture can not be created (a retry fails the same way)"""
+
+
+def parse_notice_list(message: str) -> NoticeList:
+    """Parse a notice list message (a message of a single prefecture is also accepted)"""
+    notice_list = json.loads(message)
+    if "groups" in notice_list:
+        return NoticeList.parse_obj(notice_list)
+    return NoticeList(groups=[NoticeListGroup.parse_obj(notice_list)])
+
 
 def notice_list(message: str):
     wbgt_table_name = os.environ.get("TABLE_WBGT")
     if wbgt_table_name is None:
         raise Exception("Please set TABLE_WBGT env")
+    wbgt_pref_summary_table_name = os.environ.get("TABLE_WBGT_PREF_SUMMARY")
+    if wbgt_pref_summary_table_name is None:
+        raise Exception("Please set TABLE_WBGT_PREF_SUMMARY env")
 
     queue_notify_alert_name = os.environ.get("QUEUE_NOTIFY_ALERT")
     if queue_notify_alert_name is None:
         raise Exception("Please set QUEUE_NOTIFY_ALERT env")
 
-    notice_list = NoticeList.parse_raw(message)
-
-    current_datetime = datetime.now(timezone(timedelta(hours=9)))
-    current_time = current_datetime.time()
-    day = current_datetime.date()
-
-    base = time(15, 0, 0)
-    if current_time >= base:
-        # get data of next day
-        day += timedelta(days=1)
-
-    wbgt_svc = WBGTService()
-
-    wbgt_points_json_file = os.path.join(os.path.dirname(__file__), 'data/wbgt_points.json')
-    wbgt_pref_points_json_file = os.path.join(os.path.dirname(__file__), 'data/wbgt_pref.json')
-    wbgt_alert_level_json_file = os.path.join(os.path.dirname(__file__), 'data/wbgt_alert_levels.json')
+    queue_notice_list_name = os.environ.get("QUEUE_NOTICE_LIST")
+    if queue_notice_list_name is None:
+        raise Exception("Please set QUEUE_NOTICE_LIST env")
 
-    with open(wbgt_points_json_file) as f:
-        wbgt_points_data = json.load(f)
-    wbgt_point_repo = InMemoryWBGTPointRepository(wbgt_points_data)
+    queue_notice_list_dlq_name = os.environ.get("QUEUE_NOTICE_LIST_DLQ")
+    if queue_notice_list_dlq_name is None:
+        raise Exception("Please set QUEUE_NOTICE_LIST_DLQ env")
 
-    with open(wbgt_pref_points_json_file) as f:
-        wbgt_pref_points_data = json.load(f)
-    wbgt_pref_point_repo = InMemoryWBGTPrefPointRepository(wbgt_pref_points_data)
+    notice_list = parse_notice_list(message)
 
-    with open(wbgt_alert_level_json_file) as f:
-        wbgt_alert_level_data = json.load(f)
-    wbgt_alert_level_repo = InMemoryWBGTAlertLevelRepository(wbgt_alert_level_data)
+    wbgt_point_repo = static_data.get_wbgt_point_repo()
+    wbgt_pref_point_repo = static_data.get_wbgt_pref_point_repo()
+    wbgt_alert_level_repo = static_data.get_wbgt_alert_level_repo()
 
-    wbgt_repo = DynamoDBWBGTRepository(wbgt_table_name)
+    wbgt_repo = create_dynamodb_wbgt_repository(wbgt_table_name, os.environ.get("WBGT_STORAGE_FORMAT", "item"))
+    wbgt_pref_summary_repo = DynamoDBWBGTPrefSummaryRepository(wbgt_pref_summary_table_name)
+    wbgt_import_fingerprint_repo = DynamoDBWBGTImportFingerprintRepository(wbgt_table_name)
 
     wbgt_svc = WBGTService()
     wbgt_pred_service = WBGTPredictionApplication(wbgt_point_repo, wbgt_pref_point_repo, wbgt_repo, wbgt_alert_level_repo, wbgt_svc)
-
-    # daily prediction
-    wbgt_pref = wbgt_pref_point_repo.get_wbgt_pref_point(notice_list.pref_key)
-    logger.info(wbgt_pref)
-    if wbgt_pref is None:
-        raise Exception("WBGT data is null.")
-    wbgt_points = wbgt_pred_service.get_wbgt_points_of_prefecture(notice_list.pref_key)
-    logger.info(wbgt_points)
-
-    alert_level_list = []
-    point_and_wbgt_list = []
-    for point in wbgt_points:
-        logger.info(point)
-        wbgt_list = wbgt_pred_service.predict_daily_wbgt_of_point(point, day)
-        logger.info(wbgt_list)
-        max_wbgt = wbgt_pred_service.get_max_wbgt(wbgt_list)
-        if max_wbgt is not None:
-            alert_level = wbgt_pred_service.check_alert_level(max_wbgt)
-            alert_level_list.append(alert_level)
-            point_and_wbgt_list.append(
-                NoticeContentPoint(
-                    point=point,
-                    max_wbgt=max_wbgt,
-                )
-            )
-    logger.info(alert_level_list)
-    logger.info(point_and_wbgt_list)
-    if len(alert_level_list) == 0:
-        raise Exception("Alert level is None")
-
-    max_alert_level = wbgt_pred_service.get_max_alert_level(alert_level_list)
-
-    message_publisher = SQSMessagePublisher(queue_notify_alert_name)
-    # Notify
-    for user_setting in notice_list.user_settings:
-        if wbgt_pred_service.is_notify_target(user_setting, max_alert_level):
-            notice_content = NoticeContent(
-                day=day,
-                points=point_and_wbgt_list,
-                alert_level=max_alert_level,
-                prefecture=wbgt_pref,
-                user_setting=user_setting,
+    pref_summary_app = PrefectureSummaryApplication(wbgt_pred_service, wbgt_pref_point_repo, wbgt_pref_summary_repo, wbgt_import_fingerprint_repo)
+
+    day = notice_list.day
+    import_version = notice_list.import_version
+    if day is None or import_version is None:
+        # a message without the summaries of the run
+        day = wbgt_svc.get_notice_day()
+        import_version = pref_summary_app.get_import_version(day)
+
+    # a group is published only once all of its messages are built. A failing
+    # group does not fail the message (a retry would notify the users of the
+    # other prefectures again): it is requeued alone
+    failed_groups: List[NoticeListGroup] = []
+    with BatchSQSMessagePublisher(queue_notify_alert_name) as message_publisher:
+        for group in notice_list.groups:
+            logger.info("Prefecture: {}, User Settings count: {}".format(group.pref_key, len(group.user_settings)))
+            try:
+                # daily prediction (computed once per run)
+                summary = pref_summary_app.get_summary(group.pref_key, day, import_version)
+                messages = create_notice_messages(group, summary, wbgt_pred_service)
+            except NoticeSkipped as e:
+                logger.warning("Skipped the prefecture: {} ({})".format(group.pref_key, e))
+                continue
+            except Exception:
+                logger.exception("Failed to create the notices of the prefecture: {}".format(group.pref_key))
+                failed_groups.append(group)
+                continue
+            for m in messages:
+                message_publisher.publish(m)
+    logger.info("Published messages: {}, requests: {}".format(message_publisher.sent_count, message_publisher.request_count))
+
+    if len(failed_groups) > 0:
+        requeue_failed_groups(notice_list, failed_groups, day, import_version, queue_notice_list_name, queue_notice_list_dlq_name)
+
+
+def requeue_failed_groups(notice_list: NoticeList, failed_groups: List[NoticeListGroup], day: date, import_version: str,
+                          queue_notice_list_name: str, queue_notice_list_dlq_name: str):
+    """Requeue the failed groups with the summaries of the run (to the dead letter queue after the retries)"""
+    failed_notice_list = NoticeList(
+        groups=failed_groups,
+        day=day,
+        import_version=import_version,
+        retry_count=notice_list.retry_count + 1,
+    )
+    pref_keys = [g.pref_key for g in failed_groups]
+    if failed_notice_list.retry_count > NOTICE_LIST_RETRY_COUNT_MAX:
+        logger.error("Retry over. Send to the dead letter queue. Prefectures: {}".format(pref_keys))
+        SQSMessagePublisher(queue_notice_list_dlq_name).publish(failed_notice_list.json())
+        return
+
+    delay_seconds = NOTICE_LIST_RETRY_DELAY_SEC * (2 ** notice_list.retry_count)
+    logger.warning("Requeue the failed prefectures: {} (retry: {}, delay: {}s)".format(pref_keys, failed_notice_list.retry_count, delay_seconds))
+    SQSMessagePublisher(queue_notice_list_name).publish(failed_notice_list.json(), delay_seconds)
+
+
+def create_notice_messages(group: NoticeListGroup, summary: PrefectureSummary, wbgt_pred_service: WBGTPredictionApplication) -> List[str]:
+    logger.info(summary)
+    if summary.alert_level is None:
+        # no value of the day in the summary of the import
+        raise NoticeSkipped("Alert level is None")
+
+    # Notify (one message per domain, the content is shared by the users of the domain)
+    messages = []
+    notify_targets = wbgt_pred_service.group_notify_targets(group.user_settings, summary.alert_level)
+    for domain_id, user_ids in notify_targets.items():
+        logger.info("DomainID: {}, Users count: {}".format(domain_id, len(user_ids)))
+        for i in range(0, len(user_ids), NOTICE_MAX_USERS_PER_MESSAGE):
+            notice_content = DomainNoticeContent(
+                day=summary.day,
+                points=summary.points,
+                alert_level=summary.alert_level,
+                prefecture=summary.prefecture,
+                domain_id=domain_id,
+                user_ids=user_ids[i:i + NOTICE_MAX_USERS_PER_MESSAGE],
             )
             logger.info(notice_content)
-            message_publisher.publish(notice_content.json())
+            messages.append(notice_content.json())
+    return messages
 
 
 # You can continue to use other utilities just as before
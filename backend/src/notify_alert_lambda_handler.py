@@ -1,66 +1,58 @@
 import os
 import json
-from requests.structures import CaseInsensitiveDict
-from datetime import datetime, timedelta, time
+import math
+from concurrent.futures import Future
+from typing import List, Tuple
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, SQSEvent
 
 
-from .datastore.wbgt import (
-    DynamoDBWBGTRepository,
-    InMemoryWBGTPointRepository,
-    InMemoryWBGTPrefPointRepository,
-    InMemoryWBGTAlertLevelRepository,
-)
 from .datastore.bot_api_cred import (
     DynamoDBBotInfoRepository,
-    DynamoDBBotClientCredentialRepository,
-    DynamoDBInstalledAppRepository,
-    DynamoDBAccessTokenRepository,
-)
-
-from .service.wbgt import (
-    WBGTService
 )
-from .app.wbgt_prediction import (
-    WBGTPredictionApplication,
-)
-from .service.publisher import SQSMessagePublisher
 from .models import (
-    NoticeList,
-    NoticeContentPoint,
     NoticeContent,
-    AccessToken,
-    BotClientCredential,
+    DomainNoticeContent,
 )
+from .app.access_token import get_access_token_manager
+from .app.notify import NotifyMessageRenderer
 from .lib import lineworks
+from .service.publisher import SQSMessagePublisher, BatchSQSMessagePublisher
 
 logger = Logger()
 
+NOTIFY_SEND_MAX_WORKERS = int(os.environ.get("NOTIFY_SEND_MAX_WORKERS", lineworks.bot.SEND_MAX_WORKERS))
+
+# kept by the container
+message_renderer = NotifyMessageRenderer()
 
-NOTIFY_TEXT_GUIDE = """
-【暑さ指数 (WBGT) の目安】
-31以上: 危険
-28以上31未満: 厳重警戒
-25以上28未満: 警戒
-25未満: 注意
 
-※ 配信の停止は「配信設定」から行います。
-"""
+def parse_notice_content(notice_content_raw: str) -> DomainNoticeContent:
+    """Parse a notify message (a message for a single user is also accepted)"""
+    notice_content = json.loads(notice_content_raw)
+    if "user_setting" not in notice_content:
+        return DomainNoticeContent.parse_obj(notice_content)
 
-NOTIFY_TEXT_POINT_INFO_FMT = """
-予想される {} の観測地点別の日最高暑さ指数 (WBGT) は以下の通りです。
+    single_notice_content = NoticeContent.parse_obj(notice_content)
+    return DomainNoticeContent(
+        day=single_notice_content.day,
+        points=single_notice_content.points,
+        alert_level=single_notice_content.alert_level,
+        prefecture=single_notice_content.prefecture,
+        domain_id=single_notice_content.user_setting.domain_id,
+        user_ids=[single_notice_content.user_setting.user_id],
+    )
 
-{}
-"""
 
-def notify(notice_content_raw: str):
+def notify(notice_content_raw: str, sender: lineworks.bot.ConcurrentMessageSender) -> Tuple[DomainNoticeContent, List[Future]]:
+    """Submit the notify message of a record to the sender
+
+    :return: notice content and futures of the send results of the users
+    """
     logger.info(notice_content_raw)
-    current_time = datetime.now().timestamp()
-    logger.info(current_time)
 
     access_token_table_name = os.environ.get("TABLE_ACCESS_TOKEN")
     if access_token_table_name is None:
@@ -83,181 +75,67 @@ def notify(notice_content_raw: str):
         raise Exception("Please set LW_BOT_ID env")
 
     bot_info_repo = DynamoDBBotInfoRepository(bot_info_table_name)
-    bot_client_cred_repo = DynamoDBBotClientCredentialRepository(bot_client_cred_table_name)
-    install_app_repo = DynamoDBInstalledAppRepository(installed_app_table_name)
-    access_token_repo = DynamoDBAccessTokenRepository(access_token_table_name)
+    access_token_manager = get_access_token_manager(access_token_table_name, bot_client_cred_table_name, installed_app_table_name)
 
-    notice_content = NoticeContent.parse_raw(notice_content_raw)
+    notice_content = parse_notice_content(notice_content_raw)
     logger.info(notice_content)
-    logger.info("UserID: {}".format(notice_content.user_setting.user_id))
+    logger.info("DomainID: {}, Users count: {}".format(notice_content.domain_id, len(notice_content.user_ids)))
 
     # Get bot info
     bot_info = bot_info_repo.get_bot_info(bot_id)
     if bot_info is None:
         raise Exception("Please set Bot Info.")
 
-    # create mssage content
-    msg_contents = [
-        {
-            "content": {
-                "type": "flex",
-                "altText": "{} の予測です。".format(notice_content.prefecture.pref_name_ja),
-                "contents": {
-                    "type": "bubble",
-                    "body": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {
-                                "text": "{}".format(notice_content.day.strftime("%m/%d")),
-                                "type": "text",
-                                "size": "lg"
-                            },
-                            {
-                                "layout": "vertical",
-                                "type": "box",
-                                "contents": [
-                                    {
-                                        "text": "{}".format(notice_content.alert_level.alert_level_subtitle_ja),
-                                        "type": "text",
-                                        "size": "lg",
-                                        "style": "normal",
-                                        "align": "center",
-                                    }
-                                ]
-                            },
-                            {
-                                "layout": "vertical",
-                                "type": "box",
-                                "contents": [
-                                    {
-                                        "text": "{}".format(notice_content.alert_level.alert_level_title_ja),
-                                        "type": "text",
-                                        "style": "normal",
-                                        "align": "center",
-                                        "wrap": True,
-                                        "size": "xl",
-                                        "gravity": "center",
-                                        "color": "{}".format(notice_content.alert_level.alert_level_text_color)
-                                    }
-                                ],
-                                "backgroundColor": "{}".format(notice_content.alert_level.alert_level_background_color),
-                                "spacing": "none",
-                                "margin": "md",
-                                "borderWidth": "none",
-                                "cornerRadius": "none"
-                            },
-                            {
-                                "layout": "vertical",
-                                "type": "box",
-                                "contents": [
-                                    {
-                                        "text": "の予測です",
-                                        "type": "text",
-                                        "size": "md",
-                                        "style": "normal",
-                                        "align": "end",
-                                    }
-                                ],
-                                "spacing": "none",
-                                "margin": "md"
-                            },
-                            {
-                                "layout": "vertical",
-                                "type": "box",
-                                "contents": [
-                                    {
-                                        "type": "text",
-                                        "text": "{}".format(notice_content.alert_level.alert_level_description_ja),
-                                        "wrap": True,
-                                        "decoration": "none"
-                                    }
-                                ],
-                                "borderWidth": "none",
-                                "margin": "sm"
-                            },
-                            {
-                                "layout": "vertical",
-                                "type": "box",
-                                "contents": [
-                                    {
-                                        "text": NOTIFY_TEXT_POINT_INFO_FMT.format(
-                                            notice_content.prefecture.pref_name_ja,
-                                            ', '.join([ "{}{}".format(content_point.point.point_name_ja, content_point.max_wbgt.value) for content_point in notice_content.points])
-                                        ),
-                                        "wrap": True,
-                                        "type": "text"
-                                    },
-                                    {
-                                        "text": NOTIFY_TEXT_GUIDE,
-                                        "wrap": True,
-                                        "type": "text"
-                                    }
-                                ],
-                                "borderWidth": "none",
-                                "margin": "lg"
-                            },
-                            {
-                                "action": {
-                                    "type": "uri",
-                                    "label": "熱中症予防対策を確認",
-                                    "uri": "https://www.wbgt.env.go.jp/sp/heatillness.php"
-                                },
-                                "type": "button",
-                                "style": "link"
-                            }
-                        ]
-                    }
-                }
-            }
-        }
-    ]
+    # rendered once per distinct content and posted as is to the users
+    msg_contents = message_renderer.render(notice_content)
     logger.info(msg_contents)
 
-    # Get access token
-    access_token_obj = access_token_repo.get_access_token_item(notice_content.user_setting.domain_id)
-    # Check existence and expiration
-    if access_token_obj is None or access_token_obj.expired_at < current_time:
-        # Renew access token
-        client_cred = bot_client_cred_repo.get_bot_client_credential(bot_info.bot_id, bot_info.provider_domain_id)
-        if client_cred is None:
-            logger.warn("A client credential is not set. Please set values")
-            return
-
-        # Eco app
-        installed_app = install_app_repo.get_installed_app(notice_content.user_setting.domain_id)
-        if installed_app is None:
-            raise Exception("Installed App does not exist.")
-        service_account = installed_app.service_account
-
-        res = lineworks.auth.get_access_token(client_cred.client_id,
-                                              client_cred.client_secret,
-                                              service_account,
-                                              client_cred.private_key,
-                                              "bot")
-        access_token_obj = AccessToken(
-            bot_id=bot_info.bot_id,
-            domain_id=notice_content.user_setting.domain_id,
-            access_token=res["access_token"],
-            created_at=current_time,
-            expired_at=current_time + int(res["expires_in"])
-        )
-        # Put access token
-        access_token_repo.put_access_token_item(access_token_obj)
-
-    bot_api = lineworks.bot.BotApi(access_token_obj.access_token)
-
-    # send message
-    try:
-        for msg_content in msg_contents:
-            res = bot_api.send_message_to_user(msg_content,
-                                               bot_info.bot_id,
-                                               notice_content.user_setting.user_id)
+    # Get access token (refreshed ahead of the expiry by a single container)
+    access_token_obj = access_token_manager.get_access_token(bot_info, notice_content.domain_id)
+    if access_token_obj is None:
+        logger.warn("A client credential is not set. Please set values")
+        return notice_content, []
+
+    # send message (the access token is shared by the users of the domain)
+    rate_limit_key = "{}:{}".format(bot_info.bot_id, notice_content.domain_id)
+    futures = [sender.submit(msg_contents, access_token_obj.access_token, bot_info.bot_id, user_id, rate_limit_key)
+               for user_id in notice_content.user_ids]
+
+    def invalidate_rejected_token(future: Future):
+        # a revoked token is not reused by the next invocations of the container
+        if future.result().unauthorized:
+            access_token_manager.invalidate(notice_content.domain_id, access_token_obj.access_token)
+
+    for future in futures:
+        future.add_done_callback(invalidate_rejected_token)
+    return notice_content, futures
+
+
+def requeue_deferred(notice_content: DomainNoticeContent, results: List[lineworks.bot.SendResult], message_publisher: SQSMessagePublisher):
+    """Requeue the users deferred by the rate limit instead of waiting in the Lambda"""
+    deferred_results = [r for r in results if r.deferred]
+    if len(deferred_results) == 0:
+        return
+
+    deferred_notice_content = notice_content.copy(update={"user_ids": [r.user_id for r in deferred_results]})
+    delay_seconds = math.ceil(max(r.retry_after for r in deferred_results))
+    logger.info("Requeue deferred users. DomainID: {}, Users count: {}, Delay: {}s".format(
+        notice_content.domain_id, len(deferred_results), delay_seconds))
+    message_publisher.publish(deferred_notice_content.json(), delay_seconds)
+
+
+def log_send_result(result: lineworks.bot.SendResult):
+    if result.ok:
+        logger.info("Sent. UserID: {} ({:.3f}s)".format(result.user_id, result.elapsed_sec))
         return
-    except lineworks.base.BotApiRequestError as e:
-        logger.exception(e)
-        logger.error("{} {} headers: {} body:{}".format(e.request.method, e.request.url, e.request.headers, e.request.body))
-        logger.error("{} headers: {} body: {}".format(e.response.status_code, e.response.headers, e.response.text))
+
+    e = result.error
+    logger.error("Failed to send. UserID: {} error: {!r}".format(result.user_id, e))
+    if isinstance(e, lineworks.base.BotApiRequestError):
+        if e.request is not None:
+            logger.error("{} {} headers: {} body:{}".format(e.request.method, e.request.url, e.request.headers, e.request.body))
+        if e.response is not None:
+            logger.error("{} headers: {} body: {}".format(e.response.status_code, e.response.headers, e.response.text))
 
 
 # You can continue to use other utilities just as before
@@ -267,5 +145,31 @@ def lambda_handler(event: SQSEvent, context: LambdaContext):
     logger.info(event)
     logger.info(event.raw_event)
     logger.info(len(event.raw_event["Records"]))
-    for record in event.records:
-        notify(record.body)
+
+    queue_notify_alert_name = os.environ.get("QUEUE_NOTIFY_ALERT")
+    if queue_notify_alert_name is None:
+        raise Exception("Please set QUEUE_NOTIFY_ALERT env")
+
+    # all the recipients of the batch are sent concurrently
+    jobs = []
+    with lineworks.bot.ConcurrentMessageSender(max_workers=NOTIFY_SEND_MAX_WORKERS) as sender:
+        for record in event.records:
+            logger.info("MessageID: {}".format(record.message_id))
+            jobs.append(notify(record.body, sender))
+
+        job_results = [(notice_content, [future.result() for future in futures]) for notice_content, futures in jobs]
+
+    total_count = 0
+    failed_count = 0
+    deferred_count = 0
+    with BatchSQSMessagePublisher(queue_notify_alert_name) as message_publisher:
+        for notice_content, results in job_results:
+            for result in results:
+                if not result.deferred:
+                    log_send_result(result)
+            requeue_deferred(notice_content, results, message_publisher)
+
+            total_count += len(results)
+            failed_count += len([r for r in results if not r.ok and not r.deferred])
+            deferred_count += len([r for r in results if r.deferred])
+    logger.info("Send results. total: {}, failed: {}, deferred: {}".format(total_count, failed_count, deferred_count))
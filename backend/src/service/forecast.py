@@ -0,0 +1,80 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# numpy is imported on use, so that the handlers which do not predict start fast
+
+
+class ForecastMatrix():
+    """Forecast of the points as a points x time slots array
+
+    The rows are the points grouped by prefecture: the prefecture segment
+    table holds the first row of each prefecture, so the prefecture
+    reductions are a single reduceat over the rows. A point of several
+    prefectures has a row in each of them. Missing values are NaN.
+    """
+    def __init__(self, pref_points: Sequence[Tuple[str, Sequence[str]]], time_keys: Sequence[str]):
+        """
+        :param pref_points: (pref_key, point ids) of the prefectures
+        :param time_keys: time keys of the columns
+        """
+        import numpy as np
+
+        self.pref_keys: List[str] = []
+        self.point_ids: List[str] = []
+        offsets = []
+        for pref_key, point_ids in pref_points:
+            self.pref_keys.append(pref_key)
+            offsets.append(len(self.point_ids))
+            self.point_ids.extend(point_ids)
+        self.pref_offsets = np.asarray(offsets, dtype=np.intp)
+        self.pref_sizes = np.diff(np.append(self.pref_offsets, len(self.point_ids)))
+
+        self.time_keys: List[str] = list(time_keys)
+        self._time_index: Dict[str, int] = {k: i for i, k in enumerate(self.time_keys)}
+        self._point_rows: Dict[str, List[int]] = {}
+        for row, point_id in enumerate(self.point_ids):
+            self._point_rows.setdefault(point_id, []).append(row)
+
+        self.values = np.full((len(self.point_ids), len(self.time_keys)), np.nan, dtype=np.float64)
+
+    def set_values(self, values: Iterable[Tuple[str, str, float]]):
+        """Set (point_id, time_key, value); unknown points and time keys are ignored"""
+        import numpy as np
+
+        rows, cols, vals = [], [], []
+        for point_id, time_key, value in values:
+            col = self._time_index.get(time_key)
+            if col is None:
+                continue
+            for row in self._point_rows.get(point_id, ()):
+                rows.append(row)
+                cols.append(col)
+                vals.append(value)
+        if len(rows) > 0:
+            self.values[np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)] = vals
+
+    def point_maxima(self):
+        """Daily maximum of every row
+
+        :return: (maxima, time slot of the first maximum, has value) arrays
+        """
+        import numpy as np
+
+        has_value = ~np.all(np.isnan(self.values), axis=1)
+        filled = np.where(np.isnan(self.values), -np.inf, self.values)
+        if filled.shape[1] == 0:
+            return np.full(filled.shape[0], np.nan), np.zeros(filled.shape[0], dtype=np.intp), has_value
+        slots = np.argmax(filled, axis=1)
+        maxima = filled[np.arange(filled.shape[0]), slots]
+        maxima[~has_value] = np.nan
+        return maxima, slots, has_value
+
+    def pref_reduce_max(self, row_values, empty_value: float):
+        """Maximum of the rows of each prefecture (empty_value for a prefecture without rows)"""
+        import numpy as np
+
+        rst = np.full(len(self.pref_keys), empty_value, dtype=np.asarray(row_values).dtype)
+        # reduceat takes the value at the offset for an empty segment, so only non empty ones are reduced
+        non_empty = self.pref_sizes > 0
+        if np.any(non_empty):
+            rst[non_empty] = np.maximum.reduceat(row_values, self.pref_offsets[non_empty])
+        return rst
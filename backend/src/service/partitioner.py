@@ -0,0 +1,179 @@
+import math
+import threading
+from typing import Callable, Dict, List, Optional
+
+from ..models import (
+    NoticeList,
+    NoticeListGroup,
+    UserSetting,
+)
+
+# the costs are in units of a user setting
+NOTICE_LIST_MAX_COST = 1000
+# fixed cost of a prefecture (prediction of the points)
+NOTICE_LIST_PREF_COST = 50
+NOTICE_LIST_POINT_COST = 10
+# leaves room for the SQS attributes (max 256 KB)
+NOTICE_LIST_MAX_BYTES = 192 * 1024
+# a message is full enough to be sent before the end of the stream
+NOTICE_LIST_FILL_RATIO = 0.9
+# bounds the groups kept for packing
+NOTICE_LIST_PENDING_BINS = 4
+
+GROUP_OVERHEAD_BYTES = 64
+USER_SETTING_OVERHEAD_BYTES = 2
+
+
+class _Group():
+    def __init__(self, pref_key: str, pref_cost: int):
+        self.pref_key = pref_key
+        self.pref_cost = pref_cost
+        self.user_settings: List[UserSetting] = []
+        self.user_sizes: List[int] = []
+        self.user_bytes = 0
+
+    @property
+    def cost(self) -> int:
+        return self.pref_cost + len(self.user_settings)
+
+    @property
+    def size(self) -> int:
+        return GROUP_OVERHEAD_BYTES + len(self.pref_key) + self.user_bytes
+
+    def add(self, user_setting: UserSetting, size: int):
+        self.user_settings.append(user_setting)
+        self.user_sizes.append(size)
+        self.user_bytes += size
+
+    def take(self, count: int) -> "_Group":
+        """Split the first count users off into a new group"""
+        group = _Group(self.pref_key, self.pref_cost)
+        group.user_settings = self.user_settings[:count]
+        group.user_sizes = self.user_sizes[:count]
+        group.user_bytes = sum(group.user_sizes)
+        self.user_settings = self.user_settings[count:]
+        self.user_sizes = self.user_sizes[count:]
+        self.user_bytes -= group.user_bytes
+        return group
+
+    def to_model(self) -> NoticeListGroup:
+        return NoticeListGroup(pref_key=self.pref_key, user_settings=self.user_settings)
+
+
+class NoticeListPartitioner():
+    """Packs the user settings streamed per prefecture into NoticeList messages
+
+    The messages are bounded by an estimated cost (a fixed cost of the
+    prefecture + the users) and by the byte size, so that the notice_list
+    invocations get an even load:
+    - A prefecture larger than a message is split. While it is streamed,
+      full messages are emitted and the rest (up to 2 messages) is split
+      evenly at the end of the prefecture.
+    - Smaller prefectures are packed together (first fit decreasing).
+      Full messages are emitted as the stream goes, the rest on close.
+
+    add / end_prefecture can be called from several threads.
+    Use it as a context manager, so that the remaining groups are emitted on exit.
+    """
+    def __init__(self,
+                 emit: Callable[[NoticeList], None],
+                 pref_costs: Optional[Dict[str, int]] = None,
+                 max_cost: int = NOTICE_LIST_MAX_COST,
+                 max_bytes: int = NOTICE_LIST_MAX_BYTES,
+                 default_pref_cost: int = NOTICE_LIST_PREF_COST,
+                 ):
+        self.emit = emit
+        self.pref_costs = pref_costs or {}
+        self.max_cost = max_cost
+        self.max_bytes = max_bytes
+        self.default_pref_cost = default_pref_cost
+        self.message_count = 0
+        self.group_count = 0
+
+        self._lock = threading.RLock()
+        self._groups: Dict[str, _Group] = {}
+        self._pending: List[_Group] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def _fits(self, cost: int, size: int) -> bool:
+        return cost <= self.max_cost and size <= self.max_bytes
+
+    def _users_per_part(self, group: _Group) -> int:
+        # every part pays the fixed cost of the prefecture
+        users_per_part = self.max_cost - group.pref_cost
+        if group.user_bytes > 0:
+            bytes_per_user = group.user_bytes / len(group.user_settings)
+            users_per_part = min(users_per_part, int((self.max_bytes - (group.size - group.user_bytes)) / bytes_per_user))
+        return max(users_per_part, 1)
+
+    def _parts(self, group: _Group) -> int:
+        return max(math.ceil(len(group.user_settings) / self._users_per_part(group)), 1)
+
+    def add(self, pref_key: str, user_settings: List[UserSetting]):
+        """Add user settings of the prefecture (e.g. a page of the query)"""
+        sizes = [len(user_setting.json().encode("utf-8")) + USER_SETTING_OVERHEAD_BYTES for user_setting in user_settings]
+        with self._lock:
+            group = self._groups.get(pref_key)
+            if group is None:
+                group = _Group(pref_key, self.pref_costs.get(pref_key, self.default_pref_cost))
+                self._groups[pref_key] = group
+            for user_setting, size in zip(user_settings, sizes):
+                group.add(user_setting, size)
+
+            # emit full messages, keeping up to 2 messages of the prefecture for the even split of the end
+            while self._parts(group) > 2:
+                self._emit([group.take(self._users_per_part(group))])
+
+    def end_prefecture(self, pref_key: str):
+        """All the user settings of the prefecture were added"""
+        with self._lock:
+            group = self._groups.pop(pref_key, None)
+            if group is None or len(group.user_settings) == 0:
+                return
+
+            parts = self._parts(group)
+            if parts > 1:
+                # split evenly
+                for i in range(parts, 1, -1):
+                    self._emit([group.take(math.ceil(len(group.user_settings) / i))])
+                self._emit([group])
+                return
+
+            self._pending.append(group)
+            if sum(g.cost for g in self._pending) >= self.max_cost * NOTICE_LIST_PENDING_BINS:
+                self._pack(flush_all=False)
+
+    def close(self):
+        """Emit the remaining groups"""
+        with self._lock:
+            for pref_key in list(self._groups):
+                self.end_prefecture(pref_key)
+            self._pack(flush_all=True)
+
+    def _pack(self, flush_all: bool):
+        bins: List[List[_Group]] = []
+        for group in sorted(self._pending, key=lambda g: g.cost, reverse=True):
+            for groups in bins:
+                if self._fits(sum(g.cost for g in groups) + group.cost, sum(g.size for g in groups) + group.size):
+                    groups.append(group)
+                    break
+            else:
+                bins.append([group])
+
+        self._pending = []
+        for groups in bins:
+            if flush_all or sum(g.cost for g in groups) >= self.max_cost * NOTICE_LIST_FILL_RATIO:
+                self._emit(groups)
+            else:
+                self._pending.extend(groups)
+
+    def _emit(self, groups: List[_Group]):
+        self.message_count += 1
+        self.group_count += len(groups)
+        self.emit(NoticeList(groups=[g.to_model() for g in groups]))
@@ -1,9 +1,121 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Optional, Tuple
+
 from ..lib.aws import sqs
 
+SQS_BATCH_MAX_ENTRIES = 10
+SQS_BATCH_MAX_BYTES = 256 * 1024
+SQS_BATCH_RETRY_COUNT_MAX = 5
+SQS_MAX_DELAY_SECONDS = 900
+
+
+class SQSPublishError(Exception):
+    """Messages could not be sent"""
+
 
 class SQSMessagePublisher():
     def __init__(self, queue_name: str):
         self.queue_name = queue_name
 
-    def publish(self, message: str):
-        sqs.send_queue_message(self.queue_name, message)
+    def publish(self, message: str, delay_seconds: int = 0):
+        sqs.send_queue_message(self.queue_name, message, min(delay_seconds, SQS_MAX_DELAY_SECONDS))
+
+
+class BatchSQSMessagePublisher(SQSMessagePublisher):
+    """Publisher which sends messages by SendMessageBatch
+
+    Messages are buffered and flushed as batches of up to 10 entries
+    and 256 KB. Failed entries are retried with backoff.
+    With max_workers > 0 the batches are sent from a small thread pool.
+    Use it as a context manager, so that buffered messages are flushed on exit.
+    """
+    def __init__(self, queue_name: str, max_workers: int = 0, retry_count: int = SQS_BATCH_RETRY_COUNT_MAX):
+        super().__init__(queue_name)
+        self.max_workers = max_workers
+        self.retry_count = retry_count
+        self.sent_count = 0
+        self.request_count = 0
+
+        self._lock = threading.RLock()
+        self._buffer: List[Tuple[str, int]] = []
+        self._buffer_bytes = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def publish(self, message: str, delay_seconds: int = 0):
+        size = len(message.encode("utf-8"))
+        if size > SQS_BATCH_MAX_BYTES:
+            raise SQSPublishError("Message is too large: {} bytes".format(size))
+
+        with self._lock:
+            if len(self._buffer) >= SQS_BATCH_MAX_ENTRIES or self._buffer_bytes + size > SQS_BATCH_MAX_BYTES:
+                self.__flush_buffer()
+            self._buffer.append((message, min(delay_seconds, SQS_MAX_DELAY_SECONDS)))
+            self._buffer_bytes += size
+            if len(self._buffer) >= SQS_BATCH_MAX_ENTRIES:
+                self.__flush_buffer()
+
+    def flush(self):
+        """Send the buffered messages and wait for all the batches"""
+        with self._lock:
+            self.__flush_buffer()
+            futures = self._futures
+            self._futures = []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __flush_buffer(self):
+        if len(self._buffer) == 0:
+            return
+        messages = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        if self.max_workers > 0:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._futures.append(self._executor.submit(self.__send_batch, messages))
+        else:
+            self.__send_batch(messages)
+
+    def __send_batch(self, messages: List[Tuple[str, int]]):
+        entries = dict()
+        for i, (message, delay_seconds) in enumerate(messages):
+            entry = {"Id": str(i), "MessageBody": message}
+            if delay_seconds > 0:
+                entry["DelaySeconds"] = delay_seconds
+            entries[entry["Id"]] = entry
+        for i in range(self.retry_count + 1):
+            failed = sqs.send_queue_message_batch(self.queue_name, list(entries.values()))
+            with self._lock:
+                self.request_count += 1
+                self.sent_count += len(entries) - len(failed)
+            if len(failed) == 0:
+                return
+
+            sender_faults = [f for f in failed if f.get("SenderFault")]
+            if len(sender_faults) > 0:
+                # retry does not help
+                raise SQSPublishError("Failed to send messages: {}".format(sender_faults))
+            entries = {f["Id"]: entries[f["Id"]] for f in failed}
+            # wait and retry
+            time.sleep(random.uniform(0, min(2.0, 0.1 * (2 ** i))))
+
+        raise SQSPublishError("SendMessageBatch retry over. failed entries: {}".format(len(entries)))
@@ -1,5 +1,9 @@
-from typing import List
-from datetime import date
+from typing import List, Optional
+from datetime import date, datetime, time, timedelta, timezone
+
+JST = timezone(timedelta(hours=9))
+# notify the prediction of the next day after this time
+NOTICE_NEXT_DAY_TIME = time(15, 0, 0)
 
 
 class WBGTService:
@@ -16,6 +20,15 @@ class WBGTService:
     def convert_to_date_key(self, d: date) -> str:
         return d.strftime('%Y%m%d')
 
+    def get_notice_day(self, current_datetime: Optional[datetime] = None) -> date:
+        if current_datetime is None:
+            current_datetime = datetime.now(JST)
+        day = current_datetime.date()
+        if current_datetime.time() >= NOTICE_NEXT_DAY_TIME:
+            # get data of next day
+            day += timedelta(days=1)
+        return day
+
 
 if __name__ == '__main__':
     pass
@@ -1,20 +1,13 @@
 import os
-import json
-from requests.structures import CaseInsensitiveDict
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, EventBridgeEvent
 
 
-from .datastore.wbgt import (
-    DynamoDBWBGTRepository,
-    InMemoryWBGTPointRepository,
-    InMemoryWBGTPrefPointRepository,
-    InMemoryWBGTAlertLevelRepository,
-)
 from .datastore.user_setting import (
     DynamoDBUserSettingRepository,
 )
@@ -22,12 +15,49 @@ from .app.user_setting import (
     UserSettingApplication
 )
 
-from .service.publisher import SQSMessagePublisher
-from .models import NoticeList
+from .datastore.wbgt import (
+    create_dynamodb_wbgt_repository,
+    DynamoDBWBGTPrefSummaryRepository,
+    DynamoDBWBGTImportFingerprintRepository,
+)
+from .datastore import static_data
+from .service.wbgt import WBGTService
+from .app.wbgt_prediction import WBGTPredictionApplication
+from .app.pref_summary import PrefectureSummaryApplication
+from .service.publisher import BatchSQSMessagePublisher
+from .service.partitioner import (
+    NoticeListPartitioner,
+    NOTICE_LIST_PREF_COST,
+    NOTICE_LIST_POINT_COST,
+)
+from .models import NoticeList, WBGTPrefPoint
 
 logger = Logger()
 
-QUEUE_BATCH_SIZE = 500
+QUERY_PAGE_SIZE = 500
+QUEUE_PUBLISH_WORKERS = 4
+PREF_QUERY_WORKERS = 8
+
+
+def add_user_settings_of_prefecture(user_setting_app: UserSettingApplication, pref_key: str, partitioner: NoticeListPartitioner) -> int:
+    """Add the user settings of the prefecture to the partitioner as they are queried
+
+    :return: count of the user settings
+    """
+    count = 0
+    for page in user_setting_app.iter_user_settings_of_prefecture(pref_key, QUERY_PAGE_SIZE):
+        count += len(page)
+        partitioner.add(pref_key, page)
+    partitioner.end_prefecture(pref_key)
+
+    if count > 0:
+        logger.info("Prefecture: {}, User Settings count: {}".format(pref_key, count))
+    return count
+
+
+def get_pref_costs(wbgt_prefs: List[WBGTPrefPoint]) -> Dict[str, int]:
+    # the prediction of a prefecture reads the data of its points
+    return {pref.pref_key: NOTICE_LIST_PREF_COST + NOTICE_LIST_POINT_COST * len(pref.points) for pref in wbgt_prefs}
 
 
 def user_setting_list():
@@ -37,34 +67,54 @@ def user_setting_list():
     queue_notice_list_name = os.environ.get("QUEUE_NOTICE_LIST")
     if queue_notice_list_name is None:
         raise Exception("Please set QUEUE_NOTICE_LIST env")
+    wbgt_table_name = os.environ.get("TABLE_WBGT")
+    if wbgt_table_name is None:
+        raise Exception("Please set TABLE_WBGT env")
+    wbgt_pref_summary_table_name = os.environ.get("TABLE_WBGT_PREF_SUMMARY")
+    if wbgt_pref_summary_table_name is None:
+        raise Exception("Please set TABLE_WBGT_PREF_SUMMARY env")
 
     user_setting_repo = DynamoDBUserSettingRepository(table_name)
 
     user_setting_app = UserSettingApplication(user_setting_repo)
-    user_pref_list = user_setting_app.classify_user_setting_into_prefecture()
-
-    message_publisher = SQSMessagePublisher(queue_notice_list_name)
-    # send to SQS queue
-    for key, user_settings in user_pref_list.items():
-        logger.info("Prefecture: {}".format(key))
-        logger.info("User Settings count: {}".format(len(user_settings)))
-
-        cnt = 0
-        while True:
-            items = user_settings[QUEUE_BATCH_SIZE * cnt:QUEUE_BATCH_SIZE * (cnt + 1)]
-            logger.info("Count: {}, Window: {}, Size: {}".format(cnt, QUEUE_BATCH_SIZE * cnt, len(items)))
-
-            notice_list = NoticeList(
-                pref_key=key,
-                user_settings=items,
-            )
-            logger.info(notice_list)
-            message_publisher.publish(notice_list.json())
-
-            cnt += 1
-            next_items = user_settings[QUEUE_BATCH_SIZE * (cnt * 1):QUEUE_BATCH_SIZE * (cnt + 2)]
-            if len(next_items) < 1:
-                break
+    wbgt_pref_point_repo = static_data.get_wbgt_pref_point_repo()
+    wbgt_prefs = wbgt_pref_point_repo.get_wbgt_pref_points()
+
+    # daily prediction of all the prefectures (written by the importer, checked once per run)
+    wbgt_svc = WBGTService()
+    wbgt_pred_service = WBGTPredictionApplication(
+        static_data.get_wbgt_point_repo(),
+        wbgt_pref_point_repo,
+        create_dynamodb_wbgt_repository(wbgt_table_name, os.environ.get("WBGT_STORAGE_FORMAT", "item")),
+        static_data.get_wbgt_alert_level_repo(),
+        wbgt_svc,
+    )
+    pref_summary_app = PrefectureSummaryApplication(
+        wbgt_pred_service,
+        wbgt_pref_point_repo,
+        DynamoDBWBGTPrefSummaryRepository(wbgt_pref_summary_table_name),
+        DynamoDBWBGTImportFingerprintRepository(wbgt_table_name),
+    )
+    day = wbgt_svc.get_notice_day()
+    import_version = pref_summary_app.ensure_summaries(day)
+    logger.info("Prefecture summaries: {}, computed: {}, day: {}, import version: {}".format(
+        len(wbgt_prefs), pref_summary_app.computed_count, day, import_version))
+
+    def publish_notice_list(notice_list: NoticeList):
+        notice_list.day = day
+        notice_list.import_version = import_version
+        logger.info("Notice list: {}".format([(g.pref_key, len(g.user_settings)) for g in notice_list.groups]))
+        message_publisher.publish(notice_list.json())
+
+    # query the prefectures concurrently, pack them into messages and send to SQS queue as they are full
+    with BatchSQSMessagePublisher(queue_notice_list_name, max_workers=QUEUE_PUBLISH_WORKERS) as message_publisher:
+        with NoticeListPartitioner(publish_notice_list, get_pref_costs(wbgt_prefs)) as partitioner:
+            with ThreadPoolExecutor(max_workers=PREF_QUERY_WORKERS) as executor:
+                futures = [executor.submit(add_user_settings_of_prefecture, user_setting_app, pref.pref_key, partitioner) for pref in wbgt_prefs]
+                counts = [future.result() for future in futures]
+    logger.info("User Settings count: {}, Prefectures: {}".format(sum(counts), len([c for c in counts if c > 0])))
+    logger.info("Notice lists: {}, groups: {}".format(partitioner.message_count, partitioner.group_count))
+    logger.info("Published messages: {}, requests: {}".format(message_publisher.sent_count, message_publisher.request_count))
 
 
 # You can continue to use other utilities just as before
@@ -1,9 +1,8 @@
 import os
-import urllib.parse
 import json
 
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver, Response, content_types, CORSConfig
+from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver, CORSConfig
 from aws_lambda_powertools.event_handler.exceptions import (
     NotFoundError,
 )
@@ -0,0 +1,51 @@
+import pytest
+
+from src.datastore.wbgt import (
+    SERIES_HEADER_SIZE,
+    SERIES_MISSING_VALUE,
+    hours_to_time_key,
+    pack_series,
+    time_key_to_hours,
+    unpack_series,
+)
+
+
+def test_pack_series_round_trip():
+    values = [25.3, None, 0.0, -1.5, 33.0]
+    data = pack_series(1688169600, values)
+
+    assert len(data) == SERIES_HEADER_SIZE + 2 * len(values)
+    assert unpack_series(data) == (1688169600, values)
+
+
+def test_pack_series_tenths():
+    # stored as int16 tenths
+    _, values = unpack_series(pack_series(0, [25.34, 25.36, 28.26]))
+    assert values == [25.3, 25.4, 28.3]
+
+
+def test_pack_series_missing_value():
+    data = pack_series(0, [None])
+    assert int.from_bytes(data[SERIES_HEADER_SIZE:], "little", signed=True) == SERIES_MISSING_VALUE
+    assert unpack_series(data) == (0, [None])
+
+
+def test_pack_series_empty():
+    assert unpack_series(pack_series(1, [])) == (1, [])
+
+
+@pytest.mark.parametrize("time_key", ["2023070103", "2023070121", "2023070124", "2023123124", "2024022924"])
+def test_time_key_hours_round_trip(time_key: str):
+    assert hours_to_time_key(time_key_to_hours(time_key)) == time_key
+
+
+def test_hours_to_time_key_24():
+    # 24 is the last slot of the day, not 00 of the next day
+    assert hours_to_time_key(time_key_to_hours("2023070121") + 3) == "2023070124"
+    assert hours_to_time_key(time_key_to_hours("2023070124") + 3) == "2023070203"
+    assert hours_to_time_key(time_key_to_hours("2023123124") + 3) == "2024010103"
+
+
+def test_time_key_to_hours_across_days():
+    assert time_key_to_hours("2023070203") - time_key_to_hours("2023070124") == 3
+    assert time_key_to_hours("2023070124") - time_key_to_hours("2023070103") == 21
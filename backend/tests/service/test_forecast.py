@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+from src.datastore import static_data
+from src.service.forecast import ForecastMatrix
+
+TIME_KEYS = ["2023070103", "2023070106", "2023070109"]
+
+
+def test_point_maxima():
+    matrix = ForecastMatrix([("a", ["p1", "p2", "p3"])], TIME_KEYS)
+    matrix.set_values([
+        ("p1", "2023070103", 25.0),
+        ("p1", "2023070106", 28.0),
+        ("p1", "2023070109", 28.0),
+        # p2 has no value
+        ("p3", "2023070109", 21.5),
+        # ignored
+        ("unknown", "2023070103", 40.0),
+        ("p1", "2023070112", 40.0),
+    ])
+    maxima, slots, has_value = matrix.point_maxima()
+
+    assert has_value.tolist() == [True, False, True]
+    assert maxima[0] == 28.0 and math.isnan(maxima[1]) and maxima[2] == 21.5
+    # the first time slot of the maximum
+    assert slots[0] == 1 and slots[2] == 2
+
+
+def test_point_maxima_without_time_keys():
+    matrix = ForecastMatrix([("a", ["p1", "p2"])], [])
+    maxima, _, has_value = matrix.point_maxima()
+
+    assert has_value.tolist() == [False, False]
+    assert np.isnan(maxima).all()
+
+
+def test_point_of_several_prefectures():
+    matrix = ForecastMatrix([("a", ["p1", "p2"]), ("b", ["p2"])], TIME_KEYS)
+    matrix.set_values([("p2", "2023070106", 30.0)])
+    maxima, _, _ = matrix.point_maxima()
+
+    assert matrix.point_ids == ["p1", "p2", "p2"]
+    assert math.isnan(maxima[0]) and maxima[1] == 30.0 and maxima[2] == 30.0
+
+
+def test_pref_reduce_max_with_empty_prefectures():
+    matrix = ForecastMatrix([
+        ("empty_head", []),
+        ("a", ["p1", "p2"]),
+        ("empty_middle", []),
+        ("b", ["p3"]),
+        ("empty_tail", []),
+    ], TIME_KEYS)
+
+    assert matrix.pref_sizes.tolist() == [0, 2, 0, 1, 0]
+    # reduceat would give the value at the offset for an empty segment
+    rst = matrix.pref_reduce_max(np.asarray([3, 5, 4]), -1)
+    assert rst.tolist() == [-1, 5, -1, 4, -1]
+
+
+def test_pref_reduce_max_without_rows():
+    matrix = ForecastMatrix([("a", []), ("b", [])], TIME_KEYS)
+
+    assert matrix.pref_reduce_max(np.asarray([], dtype=np.int64), -1).tolist() == [-1, -1]
+
+
+def test_alert_level_of_prefectures():
+    alert_level_index = static_data.get_wbgt_alert_level_repo().get_wbgt_alert_level_index()
+    matrix = ForecastMatrix([("a", ["p1", "p2"]), ("b", ["p3"])], TIME_KEYS)
+    matrix.set_values([("p1", "2023070103", 20.0), ("p2", "2023070106", 31.5)])
+    maxima, _, _ = matrix.point_maxima()
+    priorities = matrix.pref_reduce_max(alert_level_index.classify_priorities(maxima), -1)
+
+    # the same as classifying the maximum of the prefecture, no alert level without a value
+    assert alert_level_index.get_alert_level_of_priority(priorities[0]) == alert_level_index.classify(31.5)
+    assert priorities[1] == -1
+    assert alert_level_index.get_alert_level_of_priority(priorities[1]) is None
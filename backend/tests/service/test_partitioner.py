@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from src.models import NoticeList, UserSetting
+from src.service.partitioner import NoticeListPartitioner
+
+
+def create_user_settings(pref_key: str, count: int):
+    return [
+        UserSetting(user_id="{}-{:05}".format(pref_key, i), domain_id="domain", pref_key=pref_key, alert_level_key="warning")
+        for i in range(count)
+    ]
+
+
+def create_partitioner(**kwargs):
+    messages = []
+    return NoticeListPartitioner(messages.append, default_pref_cost=10, **kwargs), messages
+
+
+def message_cost(message: NoticeList, pref_cost: int = 10) -> int:
+    return sum(pref_cost + len(g.user_settings) for g in message.groups)
+
+
+def users_of(messages, pref_key: str):
+    return [u.user_id for m in messages for g in m.groups if g.pref_key == pref_key for u in g.user_settings]
+
+
+def test_small_prefectures_first_fit_decreasing():
+    partitioner, messages = create_partitioner(max_cost=100)
+    with partitioner:
+        # costs: a 60, b 40, c 30, d 15
+        for pref_key, count in [("c", 20), ("a", 50), ("d", 5), ("b", 30)]:
+            partitioner.add(pref_key, create_user_settings(pref_key, count))
+            partitioner.end_prefecture(pref_key)
+
+    assert [[g.pref_key for g in m.groups] for m in messages] == [["a", "b"], ["c", "d"]]
+    assert partitioner.message_count == 2
+    assert partitioner.group_count == 4
+
+
+def test_large_prefecture_split_evenly():
+    partitioner, messages = create_partitioner(max_cost=100)
+    with partitioner:
+        partitioner.add("a", create_user_settings("a", 200))
+        partitioner.end_prefecture("a")
+
+    # a full message while streaming, then the rest split evenly
+    assert [len(m.groups[0].user_settings) for m in messages] == [90, 55, 55]
+    assert users_of(messages, "a") == [u.user_id for u in create_user_settings("a", 200)]
+
+
+def test_large_prefecture_streamed_by_pages():
+    partitioner, messages = create_partitioner(max_cost=100)
+    user_settings = create_user_settings("a", 200)
+    with partitioner:
+        for i in range(0, len(user_settings), 7):
+            partitioner.add("a", user_settings[i:i + 7])
+        partitioner.end_prefecture("a")
+
+    assert [len(m.groups[0].user_settings) for m in messages] == [90, 55, 55]
+    assert users_of(messages, "a") == [u.user_id for u in user_settings]
+
+
+def test_split_by_bytes():
+    size = len(create_user_settings("a", 1)[0].json().encode("utf-8")) + 2
+    # room for 10 users a message
+    partitioner, messages = create_partitioner(max_cost=1000, max_bytes=64 + 1 + size * 10)
+    with partitioner:
+        partitioner.add("a", create_user_settings("a", 25))
+        partitioner.end_prefecture("a")
+
+    assert [len(m.groups[0].user_settings) for m in messages] == [10, 8, 7]
+
+
+def test_prefecture_cost():
+    partitioner, messages = create_partitioner(max_cost=100, pref_costs={"a": 70})
+    with partitioner:
+        partitioner.add("a", create_user_settings("a", 50))
+
+    # every part pays the cost of the prefecture: up to 30 users a message, split evenly
+    assert [len(m.groups[0].user_settings) for m in messages] == [25, 25]
+
+
+def test_close_ends_the_open_prefectures():
+    partitioner, messages = create_partitioner(max_cost=100)
+    with partitioner:
+        partitioner.add("a", create_user_settings("a", 3))
+        partitioner.add("b", create_user_settings("b", 4))
+
+    assert len(messages) == 1
+    assert sorted(g.pref_key for g in messages[0].groups) == ["a", "b"]
+
+
+def test_nothing_emitted_on_error():
+    partitioner, messages = create_partitioner(max_cost=100)
+    with pytest.raises(RuntimeError):
+        with partitioner:
+            partitioner.add("a", create_user_settings("a", 3))
+            partitioner.end_prefecture("a")
+            raise RuntimeError("query failed")
+
+    assert messages == []
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_all_users_once_within_the_bounds(seed: int):
+    r = random.Random(seed)
+    counts = {"pref{}".format(i): r.choice([0, 1, 5, 30, 80, 95, 250]) for i in range(30)}
+    partitioner, messages = create_partitioner(max_cost=100)
+    with partitioner:
+        for pref_key, count in counts.items():
+            user_settings = create_user_settings(pref_key, count)
+            for i in range(0, count, 13):
+                partitioner.add(pref_key, user_settings[i:i + 13])
+            partitioner.end_prefecture(pref_key)
+
+    for message in messages:
+        assert message_cost(message) <= 100
+        assert len({g.pref_key for g in message.groups}) == len(message.groups)
+    for pref_key, count in counts.items():
+        assert users_of(messages, pref_key) == [u.user_id for u in create_user_settings(pref_key, count)]
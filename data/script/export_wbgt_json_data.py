@@ -1,9 +1,13 @@
 import os
+import sys
 import json
 import shutil
 
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../backend'))
+from src.lib.wbgt_bundle import write_bundle
+
 
 data_dir = os.path.join(os.path.dirname(__file__), '../')
 backend_data_dir = os.path.join(os.path.dirname(__file__), '../../backend/src/data')
@@ -14,6 +18,7 @@ wbgt_point_csv_file_name = 'wbgt_point_data.csv'
 wbgt_points_json_file_name = 'wbgt_points.json'
 wbgt_pref_json_file_name = 'wbgt_pref.json'
 wbgt_alert_level_json_file_name = 'wbgt_alert_levels.json'
+wbgt_static_bundle_file_name = 'wbgt_static.bin'
 
 wbgt_point_csv_path = os.path.join(data_dir, wbgt_point_csv_file_name)
 
@@ -24,6 +29,7 @@ wbgt_alert_level_json_path = os.path.join(data_dir, wbgt_alert_level_json_file_n
 backend_wbgt_points_json_path = os.path.join(backend_data_dir, wbgt_points_json_file_name)
 backend_wbgt_pref_json_path = os.path.join(backend_data_dir, wbgt_pref_json_file_name)
 backend_wbgt_alert_level_json_path = os.path.join(backend_data_dir, wbgt_alert_level_json_file_name)
+backend_wbgt_static_bundle_path = os.path.join(backend_data_dir, wbgt_static_bundle_file_name)
 
 frontend_wbgt_pref_json_path = os.path.join(frontend_data_dir, wbgt_pref_json_file_name)
 frontend_wbgt_alert_level_json_path = os.path.join(frontend_data_dir, wbgt_alert_level_json_file_name)
@@ -64,6 +70,8 @@ def main():
     shutil.copyfile(wbgt_points_json_path, backend_wbgt_points_json_path)
     shutil.copyfile(wbgt_pref_json_path, backend_wbgt_pref_json_path)
     shutil.copyfile(wbgt_alert_level_json_path, backend_wbgt_alert_level_json_path)
+    # compact binary bundle of points and prefectures for the backend
+    write_bundle(wbgt_points, wbgt_prefs, backend_wbgt_static_bundle_path)
 
     # copy to frontend data dir
     shutil.copyfile(wbgt_pref_json_path, frontend_wbgt_pref_json_path)
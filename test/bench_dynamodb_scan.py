@@ -0,0 +1,137 @@
+"""Benchmark of the scan / query layer of lib/aws/dynamodb
+
+Runs against moto (in process DynamoDB stand-in). A fixed delay is added
+to every request (--latency) to stand in for the network round trip of
+the real endpoint, and small pages (--page-size) stand in for the 1 MB
+page limit of large tables.
+moto handles the requests in process under the GIL (and a scan page costs
+time proportional to the table), so the parallel speedup measured here is a
+lower bound of the one against the real endpoint.
+
+- scan: serial scan vs parallel segmented scan
+- query: the old first-page-only query vs the paginated query
+  (the items the old query silently missed)
+
+Usage: python test/bench_dynamodb_scan.py [--items N] [--latency MS] [--page-size N] [--segments N]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from moto import mock_aws
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.lib.aws import clients, dynamodb
+
+TABLE_NAME = "bench-user-setting"
+
+
+def create_table(items: int):
+    client = boto3.client("dynamodb")
+    client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "user_id", "AttributeType": "S"},
+            {"AttributeName": "domain_id", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+        GlobalSecondaryIndexes=[{
+            "IndexName": "DomainID",
+            "KeySchema": [{"AttributeName": "domain_id", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+    )
+    dynamodb.put_items(TABLE_NAME, [
+        {
+            "user_id": "user{:06}".format(i),
+            "domain_id": "domain{}".format(i % 4),
+            "pref_key": "tokyo",
+            "alert_level_key": "warning",
+        }
+        for i in range(items)
+    ])
+
+
+def add_latency(latency: float):
+    def _sleep(**kwargs):
+        time.sleep(latency)
+
+    # registered on the shared client and the per thread resources
+    clients.get_client("dynamodb").meta.events.register_first("before-send.dynamodb", _sleep)
+    session = clients.registry._get_session()
+    session.events.register_first("before-send.dynamodb", _sleep)
+
+
+def scan_serial(page_size: int) -> int:
+    count = 0
+    for page in dynamodb.scan_pages(TABLE_NAME, page_size=page_size):
+        count += len(page)
+    return count
+
+
+def scan_parallel(page_size: int, segments: int) -> int:
+    count = 0
+    for page in dynamodb.parallel_scan_pages(TABLE_NAME, segments, page_size=page_size):
+        count += len(page)
+    return count
+
+
+def query_first_page(page_size: int) -> int:
+    # same as the old dynamodb.query (LastEvaluatedKey is ignored)
+    table = clients.get_table(TABLE_NAME)
+    response = table.query(IndexName="DomainID", KeyConditionExpression=Key("domain_id").eq("domain0"), Limit=page_size)
+    return len(response.get("Items", []))
+
+
+def query_all_pages(page_size: int) -> int:
+    count = 0
+    for page in dynamodb.query_pages(TABLE_NAME, {"domain_id": "domain0"}, "DomainID", page_size,
+                                     projection_expression="user_id"):
+        count += len(page)
+    return count
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=30.0, help="delay of a request (ms)")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--segments", type=int, default=dynamodb.SCAN_TOTAL_SEGMENTS)
+    args = parser.parse_args()
+
+    with mock_aws():
+        clients.registry.reset()
+        create_table(args.items)
+        add_latency(args.latency / 1000)
+
+        serial_count, serial = measure(lambda: scan_serial(args.page_size))
+        parallel_count, parallel = measure(lambda: scan_parallel(args.page_size, args.segments))
+        first_count, first = measure(lambda: query_first_page(args.page_size))
+        all_count, all_pages = measure(lambda: query_all_pages(args.page_size))
+
+    print("items: {}, latency: {} ms, page size: {}".format(args.items, args.latency, args.page_size))
+    print("scan serial:              {:>6} items {:>9.3f} s".format(serial_count, serial))
+    print("scan parallel ({:>2} segs):  {:>6} items {:>9.3f} s ({:.1f}x)".format(
+        args.segments, parallel_count, parallel, serial / parallel))
+    print("query first page (old):   {:>6} items {:>9.3f} s".format(first_count, first))
+    print("query all pages:          {:>6} items {:>9.3f} s".format(all_count, all_pages))
+
+
+if __name__ == '__main__':
+    main()
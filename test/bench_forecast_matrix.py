@@ -0,0 +1,111 @@
+"""Benchmark of the daily maxima / alert levels of all the prefectures
+
+Compares for the forecast of a day (all the points of the static data):
+- before: get_max_wbgt / check_alert_level / get_max_alert_level over
+  lists of WBGT objects, one point at a time
+- after: ForecastMatrix (points x time slots array, reduceat over the
+  prefecture segments, searchsorted for the alert levels)
+
+Usage: python test/bench_forecast_matrix.py [--runs N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.models import WBGT
+from src.datastore import static_data
+from src.datastore.wbgt import InMemoryWBGTRepository
+from src.service.wbgt import WBGTService
+from src.app.wbgt_prediction import WBGTPredictionApplication
+
+
+def create_values(points, time_keys):
+    r = random.Random(0)
+    return {p.point_id: {k: r.randint(150, 360) / 10 for k in time_keys} for p in points}
+
+
+def before(wbgt_svc, wbgt_prefs, points_by_pref, slot_values, alert_level_index):
+    # same as the old per point loop of notice_list
+    rst = {}
+    for wbgt_pref in wbgt_prefs:
+        alert_level_list = []
+        for point in points_by_pref[wbgt_pref.pref_key]:
+            wbgt_list = [
+                WBGT(wbgt_key=wbgt_svc.create_wbgt_key(point.point_id, k), point_id=point.point_id, time_key=k, value=v, updated_timestamp=0)
+                for k, v in slot_values[point.point_id].items()
+            ]
+            max_wbgt = None
+            for wbgt in wbgt_list:
+                if max_wbgt is None or max_wbgt.value < wbgt.value:
+                    max_wbgt = wbgt
+            if max_wbgt is not None:
+                alert_level = alert_level_index.classify(max_wbgt.value)
+                if alert_level is not None:
+                    alert_level_list.append(alert_level)
+        max_alert_level = None
+        for alert_level in alert_level_list:
+            if max_alert_level is None or max_alert_level.priority < alert_level.priority:
+                max_alert_level = alert_level
+        rst[wbgt_pref.pref_key] = max_alert_level
+    return rst
+
+
+def after(pred_app, wbgt_prefs, points_by_pref, slot_values, d, alert_level_index):
+    matrix = pred_app.create_forecast_matrix(wbgt_prefs, points_by_pref, d)
+    matrix.set_values((point_id, k, v) for point_id, values in slot_values.items() for k, v in values.items())
+    maxima, _, _ = matrix.point_maxima()
+    priorities = matrix.pref_reduce_max(alert_level_index.classify_priorities(maxima), -1)
+    return {k: alert_level_index.get_alert_level_of_priority(p) for k, p in zip(matrix.pref_keys, priorities.tolist())}
+
+
+def measure(func, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    wbgt_svc = WBGTService()
+    pred_app = WBGTPredictionApplication(
+        static_data.get_wbgt_point_repo(),
+        static_data.get_wbgt_pref_point_repo(),
+        InMemoryWBGTRepository(),
+        static_data.get_wbgt_alert_level_repo(),
+        wbgt_svc,
+    )
+    alert_level_index = static_data.get_wbgt_alert_level_repo().get_wbgt_alert_level_index()
+    wbgt_prefs = static_data.get_wbgt_pref_point_repo().get_wbgt_pref_points()
+    points_by_pref = pred_app.get_points_of_prefectures(wbgt_prefs)
+    d = date(2023, 7, 1)
+    time_keys = wbgt_svc.get_daily_time_keys(wbgt_svc.convert_to_date_key(d))
+    slot_values = create_values([p for points in points_by_pref.values() for p in points], time_keys)
+
+    # same alert levels
+    assert before(wbgt_svc, wbgt_prefs, points_by_pref, slot_values, alert_level_index) == \
+        after(pred_app, wbgt_prefs, points_by_pref, slot_values, d, alert_level_index)
+
+    before_sec = measure(lambda: before(wbgt_svc, wbgt_prefs, points_by_pref, slot_values, alert_level_index), args.runs)
+    after_sec = measure(lambda: after(pred_app, wbgt_prefs, points_by_pref, slot_values, d, alert_level_index), args.runs)
+    summaries_sec = measure(lambda: pred_app.build_prefecture_summaries(wbgt_prefs, d, "bench", 0, slot_values), args.runs)
+
+    points = sum(len(p) for p in points_by_pref.values())
+    print("prefectures: {}, points: {}, time slots: {}".format(len(wbgt_prefs), points, len(time_keys)))
+    print("alert levels before (per point objects): {:>8.2f} ms".format(before_sec * 1000))
+    print("alert levels after (forecast matrix):    {:>8.2f} ms".format(after_sec * 1000))
+    print("speedup: {:.1f}x".format(before_sec / after_sec))
+    print("all prefecture summaries (matrix + models): {:>8.2f} ms".format(summaries_sec * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Cold import time check of the Lambda handlers
+
+Imports each handler module in a fresh interpreter (run from backend/)
+and fails if the import exceeds its budget or loads a module that its
+path does not need (e.g. jwt in notify_alert before a token is issued).
+
+Usage: python test/bench_import_time.py [--runs N] [--budget-scale X]
+The backend requirements and aws-lambda-powertools must be installed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(test_dir, "../backend")
+
+# handler module: (budget ms, modules that must not be loaded at import)
+HANDLERS = {
+    "importer_lambda_handler": (600, ["requests", "jwt", "numpy", "pandas"]),
+    "user_set_list_lambda_handler": (600, ["requests", "jwt", "numpy", "pandas"]),
+    "notice_list_lambda_handler": (600, ["requests", "jwt", "numpy", "pandas"]),
+    "notify_alert_lambda_handler": (700, ["jwt", "cryptography", "numpy", "pandas"]),
+    "user_setting_api_lambda_handler": (600, ["requests", "jwt", "numpy", "pandas"]),
+    "lw_callback_lambda_handler": (700, ["jwt", "cryptography", "numpy", "pandas"]),
+}
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import src.{module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(module=module)],
+        cwd=backend_dir, capture_output=True, text=True,
+        env=dict(os.environ, AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "ap-northeast-1")))
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    failed = False
+    print("{:<34} {:>10} {:>10}  {}".format("handler", "best ms", "budget ms", "result"))
+    for module, (budget, forbidden) in HANDLERS.items():
+        budget *= args.budget_scale
+        try:
+            results = [measure(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print("{:<34} {:>10} {:>10.0f}  FAIL import error: {}".format(module, "-", budget, e))
+            failed = True
+            continue
+
+        best = min(r["ms"] for r in results)
+        loaded = sorted(set(m for m in forbidden if m in results[0]["modules"]))
+        errors = []
+        if best > budget:
+            errors.append("over budget")
+        if loaded:
+            errors.append("loads {}".format(", ".join(loaded)))
+        failed = failed or len(errors) > 0
+        print("{:<34} {:>10.0f} {:>10.0f}  {}".format(module, best, budget, "FAIL " + "; ".join(errors) if errors else "ok"))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark of the JWT assertion generation for the access token request
+
+Compares the cost of an RS256 assertion:
+- before: jwt.encode with the PEM string (the key is parsed every time)
+- after: lineworks.auth with the parsed key cache (parsed once per container)
+
+Usage: python test/bench_jwt_assertion.py [--count N] [--key-size BITS]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.lib.lineworks import auth
+
+
+def create_private_key_pem(key_size: int) -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def get_jwt_before(client_id: str, service_account: str, privatekey: str) -> str:
+    # same as the old auth.__get_jwt
+    current_time = datetime.now().timestamp()
+    return jwt.encode(
+        {
+            "iss": client_id,
+            "sub": service_account,
+            "iat": current_time,
+            "exp": current_time + (60 * 60),
+        }, privatekey, algorithm="RS256")
+
+
+def measure(func, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--key-size", type=int, default=2048)
+    args = parser.parse_args()
+
+    privatekey = create_private_key_pem(args.key_size)
+    get_jwt_after = getattr(auth, "__get_jwt")
+
+    # the tokens are the same
+    public_key = serialization.load_pem_private_key(privatekey.encode(), password=None).public_key()
+    claims = jwt.decode(get_jwt_after("client", "sa", privatekey), public_key, algorithms=["RS256"])
+    assert claims["iss"] == "client" and claims["sub"] == "sa"
+
+    auth.private_key_cache.clear()
+    start = time.perf_counter()
+    get_jwt_after("client", "sa", privatekey)
+    cold = time.perf_counter() - start
+
+    before = measure(lambda: get_jwt_before("client", "sa", privatekey), args.count)
+    after = measure(lambda: get_jwt_after("client", "sa", privatekey), args.count)
+
+    print("RSA {} bit, {} assertions".format(args.key_size, args.count))
+    print("first assertion (parse key): {:>8.3f} ms".format(cold * 1000))
+    print("per assertion before:        {:>8.3f} ms".format(before * 1000))
+    print("per assertion after (warm):  {:>8.3f} ms".format(after * 1000))
+    print("speedup: {:.1f}x".format(before / after))
+
+
+if __name__ == '__main__':
+    main()
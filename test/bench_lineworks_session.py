@@ -0,0 +1,147 @@
+"""Benchmark of the shared HTTP session of lib/lineworks
+
+Sends messages to a local HTTPS stub of the Bot API and compares the
+per-message latency:
+- before: requests.post for every message (new TCP + TLS connection)
+- after: BotApi over the shared keep-alive session (lineworks.session)
+
+--connect-delay adds a delay to every new connection on the stub, to
+stand in for the network round trips of the handshakes to the real API.
+
+Usage: python test/bench_lineworks_session.py [--messages N] [--connect-delay MS]
+"""
+import argparse
+import datetime
+import json
+import os
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.lib import lineworks
+
+
+def create_self_signed_cert(cert_dir: str):
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_file = os.path.join(cert_dir, "cert.pem")
+    key_file = os.path.join(cert_dir, "key.pem")
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ))
+    return cert_file, key_file
+
+
+def start_stub_server(cert_file: str, key_file: str, connect_delay: float) -> ThreadingHTTPServer:
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            # new connection
+            time.sleep(connect_delay)
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = json.dumps({"ok": True}).encode()
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("localhost", 0), StubHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def send_before(content: dict):
+    # same as the old BaseApi.post (module level requests.post)
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': "Bearer {}".format("token"),
+    }
+    url = "{}/bots/{}/users/{}/messages".format(lineworks.base.BASE_API_URL, "bot", "user")
+    r = requests.post(url=url, data=json.dumps(content), headers=headers, allow_redirects=False)
+    r.raise_for_status()
+
+
+def send_after(content: dict):
+    bot_api = lineworks.bot.BotApi("token")
+    bot_api.send_message_to_user(content, "bot", "user")
+
+
+def measure(func, messages: int) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        func()
+    return (time.perf_counter() - start) / messages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=0.0, help="delay of a new connection (ms)")
+    args = parser.parse_args()
+
+    content = {"content": {"type": "text", "text": "bench"}}
+    with tempfile.TemporaryDirectory() as cert_dir:
+        cert_file, key_file = create_self_signed_cert(cert_dir)
+        server = start_stub_server(cert_file, key_file, args.connect_delay / 1000)
+        lineworks.base.BASE_API_URL = "https://localhost:{}/v1.0".format(server.server_port)
+        # trust the stub certificate (both paths)
+        os.environ["REQUESTS_CA_BUNDLE"] = cert_file
+
+        # warm up
+        send_before(content)
+        send_after(content)
+
+        before = measure(lambda: send_before(content), args.messages)
+        after = measure(lambda: send_after(content), args.messages)
+        server.shutdown()
+
+    print("messages: {}, connect delay: {} ms".format(args.messages, args.connect_delay))
+    print("per message before (new connection): {:>8.3f} ms".format(before * 1000))
+    print("per message after (shared session):  {:>8.3f} ms".format(after * 1000))
+    print("speedup: {:.1f}x".format(before / after))
+
+
+if __name__ == '__main__':
+    main()
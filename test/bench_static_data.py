@@ -0,0 +1,71 @@
+"""Benchmark of the static data loading in notice_list
+
+Compares the per-record cost of loading the point, prefecture and alert
+level repositories on a warm container:
+- before: json.load and parse the three files for every SQS record
+- after: datastore.static_data getters (loaded once per container)
+
+Usage: python test/bench_static_data.py [--records N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.datastore import static_data
+from src.datastore.wbgt import (
+    InMemoryWBGTPointRepository,
+    InMemoryWBGTPrefPointRepository,
+    InMemoryWBGTAlertLevelRepository,
+)
+
+
+def load_per_record():
+    with open(static_data.WBGT_POINTS_JSON_FILE) as f:
+        wbgt_point_repo = InMemoryWBGTPointRepository(json.load(f))
+    with open(static_data.WBGT_PREF_POINTS_JSON_FILE) as f:
+        wbgt_pref_point_repo = InMemoryWBGTPrefPointRepository(json.load(f))
+    with open(static_data.WBGT_ALERT_LEVEL_JSON_FILE) as f:
+        wbgt_alert_level_repo = InMemoryWBGTAlertLevelRepository(json.load(f))
+    return wbgt_point_repo, wbgt_pref_point_repo, wbgt_alert_level_repo
+
+
+def load_cached():
+    return (
+        static_data.get_wbgt_point_repo(),
+        static_data.get_wbgt_pref_point_repo(),
+        static_data.get_wbgt_alert_level_repo(),
+    )
+
+
+def measure(func, records: int) -> float:
+    start = time.perf_counter()
+    for _ in range(records):
+        func()
+    return (time.perf_counter() - start) / records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100)
+    args = parser.parse_args()
+
+    # cold: first record of a container
+    start = time.perf_counter()
+    load_cached()
+    cold = time.perf_counter() - start
+
+    before = measure(load_per_record, args.records)
+    after = measure(load_cached, args.records)
+
+    print("first record (cold load): {:>10.3f} ms".format(cold * 1000))
+    print("per record before:        {:>10.3f} ms".format(before * 1000))
+    print("per record after (warm):  {:>10.3f} ms".format(after * 1000))
+
+
+if __name__ == '__main__':
+    main()
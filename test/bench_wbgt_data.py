@@ -0,0 +1,114 @@
+"""Benchmark of the yohou_all.csv parser
+
+Compares the legacy pandas implementation of WBGTData.get_yohou_all with
+the streaming parser (lib.wbgt_data.parse_yohou_all) on a synthetic
+yohou_all.csv built from backend/src/data/wbgt_points.json.
+Each implementation runs in its own process so that the reported peak RSS
+includes the import of its dependencies.
+
+Usage: python test/bench_wbgt_data.py [--repeat N] [--time-slots N]
+The legacy implementation requires pandas.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(test_dir, "../backend")
+WBGT_POINTS_JSON_NAME = os.path.join(backend_dir, "src/data/wbgt_points.json")
+
+
+def make_yohou_all_csv(time_slots: int) -> bytes:
+    with open(WBGT_POINTS_JSON_NAME) as f:
+        points = json.load(f)
+
+    start = datetime(2023, 7, 1, 3)
+    time_keys = [(start + timedelta(hours=3 * i)).strftime("%Y%m%d%H") for i in range(time_slots)]
+    lines = [",," + ",".join(time_keys)]
+    rnd = random.Random(0)
+    for p in points:
+        values = [str(rnd.randint(150, 340)) if rnd.random() > 0.01 else "" for _ in time_keys]
+        lines.append("{}, 2023/07/01 05:00,{}".format(p["point_id"], ",".join(values)))
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def run_legacy(body: bytes) -> int:
+    from io import StringIO
+    import pandas as pd
+
+    rst = body.decode()
+    df = pd.read_csv(StringIO(rst), sep=",", encoding="ascii", index_col=0, header=0)
+    df = df.fillna(0)
+    df = df.drop(df.columns[[0]], axis=1)
+    data = json.loads(df.to_json())
+    return sum(len(points) for points in data.values())
+
+
+def run_streaming(body: bytes) -> int:
+    sys.path.insert(0, backend_dir)
+    from src.lib.wbgt_data import parse_yohou_all
+
+    return sum(1 for _ in parse_yohou_all(BytesIO(body)))
+
+
+def child(impl: str, repeat: int, time_slots: int):
+    body = make_yohou_all_csv(time_slots)
+    func = run_legacy if impl == "legacy" else run_streaming
+
+    # first call includes the import of the dependencies
+    start = time.perf_counter()
+    func(body)
+    first = time.perf_counter() - start
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        count = func(body)
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "impl": impl,
+        "values": count,
+        "first_call_ms": first * 1000,
+        "wall_ms": elapsed * 1000,
+        "traced_peak_kb": peak / 1024,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--time-slots", type=int, default=24)
+    parser.add_argument("--child", choices=["legacy", "streaming"])
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.repeat, args.time_slots)
+        return
+
+    print("{:<10} {:>8} {:>14} {:>10} {:>16} {:>12}".format(
+        "impl", "values", "first call ms", "wall ms", "traced peak KB", "max RSS MB"))
+    for impl in ["legacy", "streaming"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", impl, "--repeat", str(args.repeat), "--time-slots", str(args.time_slots)],
+            capture_output=True, text=True)
+        if out.returncode != 0:
+            print("{:<10} failed: {}".format(impl, out.stderr.strip().splitlines()[-1]))
+            continue
+        r = json.loads(out.stdout)
+        print("{impl:<10} {values:>8} {first_call_ms:>14.1f} {wall_ms:>10.2f} {traced_peak_kb:>16.1f} {max_rss_mb:>12.1f}".format(**r))
+
+
+if __name__ == '__main__':
+    main()
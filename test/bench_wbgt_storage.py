@@ -0,0 +1,119 @@
+"""Benchmark of the storage formats of the WBGT data
+
+Runs against moto (in process DynamoDB stand-in) and compares for an
+import of all the points (8 time slots) and the read of a day:
+- item: DynamoDBWBGTRepository (an item per point and time slot)
+- packed: PackedDynamoDBWBGTRepository (an item per point, int16 tenths)
+
+Reported: items, stored bytes (attribute names + values), DynamoDB requests,
+write units (1 per started KB of an item) and elapsed time.
+
+Usage: python test/bench_wbgt_storage.py [--points N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3
+from moto import mock_aws
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "../backend"))
+
+from src.lib.aws import clients
+from src.models import WBGT
+from src.datastore import static_data
+from src.datastore.wbgt import DynamoDBWBGTRepository, PackedDynamoDBWBGTRepository
+from src.service.wbgt import WBGTService
+
+
+def create_table(table_name: str):
+    boto3.client("dynamodb").create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "wbgt_key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "wbgt_key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def item_size(item: dict) -> int:
+    size = 0
+    for name, value in item.items():
+        size += len(name)
+        (kind, v), = value.items()
+        if kind == "B":
+            size += len(v)
+        else:
+            size += len(str(v).encode())
+    return size
+
+
+def table_stats(table_name: str):
+    items = []
+    for page in boto3.client("dynamodb").get_paginator("scan").paginate(TableName=table_name):
+        items.extend(page["Items"])
+    sizes = [item_size(item) for item in items]
+    write_units = sum((s + 1023) // 1024 for s in sizes)
+    return len(items), sum(sizes), write_units
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=0, help="points to import (0: all)")
+    args = parser.parse_args()
+
+    wbgt_svc = WBGTService()
+    point_ids = [p.point_id for p in static_data.get_wbgt_point_repo().get_wbgt_points()]
+    if args.points > 0:
+        point_ids = point_ids[:args.points]
+    d = date(2023, 7, 1)
+    time_keys = wbgt_svc.get_daily_time_keys(wbgt_svc.convert_to_date_key(d))
+    r = random.Random(0)
+    wbgt_list = [
+        WBGT(
+            wbgt_key=wbgt_svc.create_wbgt_key(point_id, time_key),
+            point_id=point_id,
+            time_key=time_key,
+            value=r.randint(150, 340) / 10,
+            updated_timestamp=int(datetime.now().timestamp()),
+        )
+        for point_id in point_ids for time_key in time_keys
+    ]
+    day_keys = [w.wbgt_key for w in wbgt_list]
+
+    requests = []
+    with mock_aws():
+        clients.registry.reset()
+        clients.get_client("dynamodb").meta.events.register("before-send.dynamodb", lambda **kwargs: requests.append(1))
+
+        print("points: {}, time slots: {}".format(len(point_ids), len(time_keys)))
+        for name, repo in [("item", DynamoDBWBGTRepository("bench-wbgt-item")), ("packed", PackedDynamoDBWBGTRepository("bench-wbgt-packed"))]:
+            create_table(repo.table_name)
+
+            requests.clear()
+            start = time.perf_counter()
+            repo.put_wbgt_list(wbgt_list)
+            write_sec = time.perf_counter() - start
+            write_requests = len(requests)
+
+            requests.clear()
+            start = time.perf_counter()
+            wbgts = repo.get_wbgt_many(day_keys)
+            read_sec = time.perf_counter() - start
+            read_requests = len(requests)
+            assert len(wbgts) == len(day_keys)
+
+            items, size, write_units = table_stats(repo.table_name)
+            print("{:<6} items: {:>6}, bytes: {:>8}, write units: {:>6}, write: {:>4} requests {:>6.2f} s, read a day: {:>4} requests {:>6.2f} s".format(
+                name, items, size, write_units, write_requests, write_sec, read_requests, read_sec))
+
+
+if __name__ == '__main__':
+    main()
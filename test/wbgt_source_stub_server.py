@@ -0,0 +1,72 @@
+"""Local stand-in for the yohou_all.csv endpoint
+
+Serves a CSV file with ETag / Last-Modified and answers conditional
+requests with 304. The file is re-read on each request, so editing it
+simulates an update of the source.
+
+Usage: python test/wbgt_source_stub_server.py <csv file> [--port 8000] [--fail N]
+Then run the importer with WBGT_SOURCE_URL=http://localhost:8000/yohou_all.csv
+--fail N answers 503 to the first N requests to check the retry.
+"""
+import argparse
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(csv_path: str, fail_count: int):
+    state = {"fail_count": fail_count}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if state["fail_count"] > 0:
+                state["fail_count"] -= 1
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            with open(csv_path, "rb") as f:
+                body = f.read()
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            mtime = int(os.path.getmtime(csv_path))
+
+            if_none_match = self.headers.get("If-None-Match")
+            if_modified_since = self.headers.get("If-Modified-Since")
+            not_modified = False
+            if if_none_match is not None:
+                not_modified = if_none_match == etag
+            elif if_modified_since is not None:
+                not_modified = parsedate_to_datetime(if_modified_since).timestamp() >= mtime
+
+            if not_modified:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_file")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fail", type=int, default=0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.csv_file, args.fail))
+    print("Serving {} on http://127.0.0.1:{}/yohou_all.csv".format(args.csv_file, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()